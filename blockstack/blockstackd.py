@@ -57,7 +57,6 @@ log = virtualchain.get_logger("blockstack-core")
 import blockstack_client
 
 from lib import nameset as blockstack_state_engine
-from lib import get_db_state
 from lib.config import REINDEX_FREQUENCY
 from lib import *
 from lib.storage import *
@@ -67,10 +66,12 @@ from lib.fast_sync import *
 import lib.nameset.virtualchain_hooks as virtualchain_hooks
 import lib.config as config
 from lib.consensus import *
+from lib.metrics import RPCMetrics
 
 # global variables, for use with the RPC server
 bitcoind = None
 rpc_server = None
+rpc_metrics = RPCMetrics()
 storage_pusher = None
 gc_thread = None
 has_indexer = True
@@ -260,6 +261,17 @@ def get_namespace_cost( db, namespace_id ):
 
 
 
+def get_db_state( disposition=virtualchain_hooks.DISPOSITION_RO ):
+    """
+    Open the name database.
+    Time spent doing so counts towards the current RPC request's metrics.
+    """
+    start = time.time()
+    db = virtualchain_hooks.get_db_state( disposition=disposition )
+    rpc_metrics.note_db_open( time.time() - start )
+    return db
+
+
 class BlockstackdRPCHandler(SimpleXMLRPCRequestHandler):
     """
     Dispatcher to properly instrument calls and do
@@ -331,6 +343,8 @@ class BlockstackdRPCHandler(SimpleXMLRPCRequestHandler):
                     data, getattr(self, '_dispatch', None), self.path
                 )
 
+            rpc_metrics.add_bytes( getattr(self, 'rpc_method', '__unknown__'), len(data), len(response) )
+
         except Exception, e: # This should only happen if the module is buggy
             # internal error, report as HTTP server error
             self.send_response(500)
@@ -356,10 +370,32 @@ class BlockstackdRPCHandler(SimpleXMLRPCRequestHandler):
             self.wfile.write(response)
 
 
+    def do_GET(self):
+        """
+        Serve the RPC metrics, in Prometheus' text format
+        """
+        if self.path != config.RPC_METRICS_PATH:
+            self.report_404()
+            return
+
+        response = rpc_metrics.to_prometheus()
+
+        self.send_response(200)
+        self.send_header("Content-type", "text/plain; version=0.0.4")
+        self.send_header("Content-length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
     def _dispatch(self, method, params):
         global gc_thread
         gc_thread.gc_event()
 
+        # only label metrics with methods we have, so clients can't make up new ones
+        self.rpc_method = str(method) if self.server.funcs.has_key("rpc_" + str(method)) else '__unknown__'
+        start = rpc_metrics.begin()
+        error = False
+
         try:
             con_info = {
                 "client_host": self.client_address[0],
@@ -399,6 +435,7 @@ class BlockstackdRPCHandler(SimpleXMLRPCRequestHandler):
                     log.debug("RPC %s(%s)" % ("rpc_" + str(method), params))
 
             res = self.server.funcs["rpc_" + str(method)](*params, **con_info)
+            error = (type(res) == dict and 'error' in res)
 
             # lol jsonrpc within xmlrpc
             ret = json.dumps(res)
@@ -408,9 +445,13 @@ class BlockstackdRPCHandler(SimpleXMLRPCRequestHandler):
 
             return ret
         except Exception, e:
+            error = True
             print >> sys.stderr, "\n\n%s(%s)\n%s\n\n" % ("rpc_" + str(method), params, traceback.format_exc())
             return json.dumps( rpc_traceback() )
 
+        finally:
+            rpc_metrics.end( self.rpc_method, start, error=error )
+
 
 class BlockstackdRPC( SimpleXMLRPCServer):
     """
@@ -844,6 +885,32 @@ class BlockstackdRPC( SimpleXMLRPCServer):
         return reply
 
 
+    def rpc_get_indexer_stats(self, **con_info):
+        """
+        Get the indexer's timing counters, per hook and per opcode:
+        the number of calls, the total time spent, and the median and
+        99th-percentile times over the most recent calls (in seconds).
+
+        Return {'status': True, 'stats': ...} on success
+        Return {'error': ...} on error
+        """
+        if not is_indexer():
+            return {'error': 'Method not supported'}
+
+        return self.success_response( {'stats': virtualchain_hooks.get_indexer_stats()} )
+
+
+    def rpc_get_metrics(self, **con_info):
+        """
+        Get the RPC server's per-method metrics: request and error counts,
+        latency histograms, bytes in and out, and time spent opening the database.
+        See RPCMetrics.get_metrics().
+
+        Return {'status': True, 'metrics': ...} on success
+        """
+        return self.success_response( {'metrics': rpc_metrics.get_metrics()} )
+
+
     def rpc_get_names_owned_by_address(self, address, **con_info):
         """
         Get the list of names owned by an address.
@@ -3024,6 +3091,9 @@ def run_blockstackd():
    parser.add_argument(
       '--expected-snapshots', action='store',
       help='path to a .snapshots file with the expected consensus hashes')
+   parser.add_argument(
+      '--parallel', action='store', type=int,
+      help='verify the database in segments between its backups, using this many worker processes')
 
    parser = subparsers.add_parser(
       'importdb',
@@ -3048,6 +3118,15 @@ def run_blockstackd():
    parser.add_argument(
       '--num_required', action='store',
       help='the number of required signature matches')
+   parser.add_argument(
+      '--stream', action='store_true',
+      help='verify and extract the snapshot while it downloads, instead of downloading it first')
+   parser.add_argument(
+      '--deltas', action='store',
+      help='a CSV of URLs to delta snapshots to apply, in order, on top of the snapshot')
+   parser.add_argument(
+      '--resumable', action='store_true',
+      help='fetch snapshots in parallel chunks using their manifests, resuming any earlier partial fetch')
 
    parser = subparsers.add_parser(
       'fast_sync_snapshot',
@@ -3061,6 +3140,12 @@ def run_blockstackd():
    parser.add_argument(
       'block_id', nargs='?',
       help='the block ID of the backup to use to make a fast-sync snapshot')
+   parser.add_argument(
+      '--chunked', action='store_true',
+      help='compress the snapshot in parallel chunks (needs a node that understands chunked snapshots to import)')
+   parser.add_argument(
+      '--base', action='store',
+      help='make a delta snapshot against a CSV of snapshot paths: a full snapshot, then any deltas on top of it')
 
    parser = subparsers.add_parser(
       'fast_sync_sign',
@@ -3187,11 +3272,19 @@ def run_blockstackd():
           if expected_snapshots is None:
               sys.exit(1)
 
-      rc = verify_database( args.consensus_hash, int(args.block_id), args.db_path, working_db_path=working_db_path, expected_snapshots=expected_snapshots )
+      if expected_snapshots is None:
+          expected_snapshots = {}
+
+      if args.parallel is not None:
+          rc = verify_database_parallel( args.consensus_hash, int(args.block_id), args.db_path, num_workers=args.parallel, expected_snapshots=expected_snapshots )
+      else:
+          rc = verify_database( args.consensus_hash, int(args.block_id), args.db_path, working_db_path=working_db_path, expected_snapshots=expected_snapshots )
+
       if rc:
           # success!
           print "Database is consistent with %s" % args.consensus_hash
-          print "Verified files are in '%s'" % working_dir
+          if args.parallel is None:
+              print "Verified files are in '%s'" % working_dir
 
       else:
           # failure!
@@ -3206,9 +3299,22 @@ def run_blockstackd():
       old_snapshots_path = os.path.join( old_working_dir, os.path.basename( virtualchain.get_snapshots_filename() ) )
       old_lastblock_path = os.path.join( old_working_dir, os.path.basename( virtualchain.get_lastblock_filename() ) )
 
+      if not os.path.exists( args.db_path ):
+          print "No such database: %s" % args.db_path
+          sys.exit(1)
+
+      # fold the source's write-ahead log into it, so copying the .db file gets all of its state
+      if not sqlite3_wal_checkpoint_path( args.db_path ):
+          print "Failed to checkpoint %s; is it in use?" % args.db_path
+          sys.exit(1)
+
       if os.path.exists( db_path ):
           print "Backing up existing database to %s.bak" % db_path
-          shutil.move( db_path, db_path + ".bak" )
+
+      # move the existing db's write-ahead log along with it, so sqlite won't replay it onto the imported db
+      for suffix in ["", "-wal", "-shm"]:
+          if os.path.exists( db_path + suffix ):
+              shutil.move( db_path + suffix, db_path + ".bak" + suffix )
 
       print "Importing database from %s to %s" % (args.db_path, db_path)
       shutil.copy( args.db_path, db_path )
@@ -3233,7 +3339,11 @@ def run_blockstackd():
       if args.block_id is not None:
           block_id = int(args.block_id)
 
-      rc = fast_sync_snapshot( dest_path, private_key, block_id )
+      base_paths = None
+      if args.base is not None:
+          base_paths = args.base.split(',')
+
+      rc = fast_sync_snapshot( dest_path, private_key, block_id, chunked=args.chunked, base_paths=base_paths )
       if not rc:
           print "Failed to create snapshot"
           sys.exit(1)
@@ -3253,6 +3363,13 @@ def run_blockstackd():
           print "Failed to sign snapshot"
           sys.exit(1)
 
+      manifest_path = snapshot_path + '.manifest'
+      if os.path.exists(manifest_path):
+          rc = fast_sync_sign_snapshot( manifest_path, private_key )
+          if not rc:
+              print "Failed to sign manifest"
+              sys.exit(1)
+
    elif args.action == 'fast_sync':
       # fetch the snapshot and verify it
       if hasattr(args, 'url') and args.url:
@@ -3277,7 +3394,11 @@ def run_blockstackd():
 
       print "Synchronizing from snapshot from {}.  This may take up to 15 minutes.".format(url)
 
-      rc = fast_sync_import(working_dir, url, public_keys=public_keys, num_required=num_required, verbose=True)
+      delta_urls = []
+      if args.deltas is not None:
+          delta_urls = args.deltas.split(',')
+
+      rc = fast_sync_import(working_dir, url, public_keys=public_keys, num_required=num_required, verbose=True, stream=args.stream, delta_urls=delta_urls, resumable=args.resumable)
       if not rc:
           print 'fast_sync failed'
           sys.exit(1)
@@ -36,6 +36,7 @@ import gc
 
 import virtualchain
 from nameset.virtualchain_hooks import get_last_block, get_snapshots
+from nameset.db import sqlite3_set_storage_profile
 
 from blockstack_client.config import semver_newer
 from blockstack_client.utils import url_to_host_port, atlas_inventory_to_string
@@ -597,6 +598,7 @@ def atlasdb_open( path ):
 
     con = sqlite3.connect( path, isolation_level=None )
     con.row_factory = atlasdb_row_factory
+    sqlite3_set_storage_profile( con )
     return con
 
 
@@ -905,6 +907,31 @@ def atlasdb_get_zonefile_bits( zonefile_hash, con=None, path=None ):
     return ret
 
 
+def atlasdb_queue_zonefile_info( con, block_height, zonefile_info, zonefile_dir=None, validate=True ):
+    """
+    Queue a single block's zonefile info (as returned by
+    BlockstackDB.get_atlas_zonefile_info_at()) to the zonefile queue.
+    Return the number of zonefiles queued.
+    """
+    total = 0
+    for name_txid_zfhash in zonefile_info:
+        name = str(name_txid_zfhash['name'])
+        zfhash = str(name_txid_zfhash['value_hash'])
+        txid = str(name_txid_zfhash['txid'])
+        tried_storage = 0
+
+        present = is_zonefile_cached( zfhash, zonefile_dir=zonefile_dir, validate=validate )
+        zfinfo = atlasdb_get_zonefile( zfhash, con=con )
+        if zfinfo is not None:
+            tried_storage = zfinfo['tried_storage']
+
+        log.debug("Add %s %s %s at %s (present: %s, tried_storage: %s)" % (name, zfhash, txid, block_height, present, tried_storage) )
+        atlasdb_add_zonefile_info( name, zfhash, txid, present, tried_storage, block_height, con=con )
+        total += 1
+
+    return total
+
+
 def atlasdb_queue_zonefiles( con, db, start_block, zonefile_dir=None, validate=True ):
     """
     Queue all zonefile hashes in the BlockstackDB
@@ -915,20 +942,7 @@ def atlasdb_queue_zonefiles( con, db, start_block, zonefile_dir=None, validate=T
     for block_height in xrange(start_block, db.lastblock+1, 1):
 
         zonefile_info = db.get_atlas_zonefile_info_at( block_height )
-        for name_txid_zfhash in zonefile_info:
-            name = str(name_txid_zfhash['name'])
-            zfhash = str(name_txid_zfhash['value_hash'])
-            txid = str(name_txid_zfhash['txid'])
-            tried_storage = 0
-
-            present = is_zonefile_cached( zfhash, zonefile_dir=zonefile_dir, validate=validate )
-            zfinfo = atlasdb_get_zonefile( zfhash, con=con )
-            if zfinfo is not None:
-                tried_storage = zfinfo['tried_storage']
-
-            log.debug("Add %s %s %s at %s (present: %s, tried_storage: %s)" % (name, zfhash, txid, block_height, present, tried_storage) )
-            atlasdb_add_zonefile_info( name, zfhash, txid, present, tried_storage, block_height, con=con )
-            total += 1
+        total += atlasdb_queue_zonefile_info( con, block_height, zonefile_info, zonefile_dir=zonefile_dir, validate=validate )
 
     log.debug("Queued %s zonefiles from %s-%s" % (total, start_block, db.lastblock))
     return True
@@ -1270,6 +1284,7 @@ def atlasdb_init( path, db, peer_seeds, peer_blacklist, validate=False, zonefile
 
         lines = [l + ";" for l in ATLASDB_SQL.split(";")]
         con = sqlite3.connect( path, isolation_level=None )
+        sqlite3_set_storage_profile( con )
 
         for line in lines:
             con.execute(line)
@@ -62,6 +62,17 @@ FAST_SYNC_PUBLIC_KEYS = [
 
 FAST_SYNC_DEFAULT_URL = 'http://fast-sync.blockstack.org/snapshot.bsk'
 
+# chunked fast-sync snapshots compress the snapshot's tarball in
+# independent chunks of this many bytes, so they can be (de)compressed in parallel
+FAST_SYNC_CHUNK_SIZE = 16 * 1024 * 1024
+
+# snapshots are published with a signed manifest of the hashes of their
+# FAST_SYNC_FETCH_CHUNK_SIZE-byte chunks, so they can be fetched in parallel
+# with range requests, checked chunk by chunk, and resumed
+FAST_SYNC_FETCH_CHUNK_SIZE = 4 * 1024 * 1024
+FAST_SYNC_FETCH_WORKERS = 4
+FAST_SYNC_FETCH_RETRIES = 3
+
 """ name price configs
 """
 
@@ -133,6 +144,40 @@ REINDEX_FREQUENCY = 300 # seconds
 if os.environ.get("BLOCKSTACK_TEST") == "1":
     REINDEX_FREQUENCY = 1
 
+# maximum number of blocks the state engine's writer can run ahead
+# of the downstream (non-consensus) indexing stages, such as Atlas sync
+INDEXER_PIPELINE_DEPTH = 16
+
+# the indexer keeps call counts and timings for each hook and opcode;
+# percentiles are over each one's last INDEXER_STATS_WINDOW calls.
+# Set BLOCKSTACK_INDEXER_TRACE to a path to also append a per-block CSV trace
+# (block_id,kind,name,count,total_seconds) there.
+INDEXER_STATS_WINDOW = 1000
+INDEXER_TRACE_PATH = os.environ.get("BLOCKSTACK_INDEXER_TRACE", None)
+
+# RPC latency histogram buckets (seconds), and the HTTP path on the
+# RPC port where the RPC metrics are served in Prometheus' text format
+RPC_METRICS_LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+RPC_METRICS_PATH = "/metrics"
+
+# materialize a name's record every this many history rows,
+# so restoring it to a past block only replays recent history
+NAME_HISTORY_CHECKPOINT_INTERVAL = 64
+
+# sqlite storage profile for the name DB and atlas DB.
+# WAL lets RPC readers see a consistent snapshot while a block commits,
+# instead of blocking behind the indexer's write transaction.
+# Set BLOCKSTACK_SQLITE_WAL=0 to convert back to rollback-journal mode.
+SQLITE_WAL = (os.environ.get("BLOCKSTACK_SQLITE_WAL", "1") == "1")
+SQLITE_WAL_AUTOCHECKPOINT = 1000              # pages; the WAL is also checkpointed after each block
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024          # bytes
+SQLITE_CACHE_SIZE = -64 * 1024                # negative means KiB, per sqlite
+
+# online backups copy this many pages per step, and sleep this many
+# seconds between steps so other connections can get at the database
+SQLITE_BACKUP_PAGES_PER_STEP = 1024
+SQLITE_BACKUP_STEP_SLEEP = 0.01
+
 FIRST_BLOCK_MAINNET = 373601
 
 if os.environ.get("BLOCKSTACK_TEST", None) == "1" and os.environ.get("BLOCKSTACK_TEST_FIRST_BLOCK", None) is not None:
@@ -21,15 +21,20 @@
     along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
 """
 
+import os
 import json
+import shutil
 import tempfile
 import copy
+import time
+import multiprocessing
 
 import virtualchain
 
 log = virtualchain.get_logger("blockstack-server")
 
 import nameset as blockstack_state_engine
+import nameset.virtualchain_hooks as virtualchain_hooks
 
 import config
 
@@ -41,6 +46,7 @@ from .storage import *
 
 from .nameset import *
 from .operations import *
+from .fast_sync import blockstack_backup_restore
 
 def rec_to_virtualchain_op( name_rec, block_number, history_index, working_db, untrusted_db ):
     """
@@ -200,13 +206,46 @@ def block_to_virtualchain_ops( block_id, working_db, untrusted_db ):
     return virtualchain_ops
 
 
+def replay_blocks( working_db, untrusted_db, start_block, end_block, expected_snapshots={} ):
+    """
+    Feed the name operations in @untrusted_db from @start_block to @end_block (inclusive)
+    into @working_db, block by block.
+
+    Optionally check that the snapshots in @expected_snapshots match up as we go.
+    @expected_snapshots maps int(block_id) to str(consensus hash)
+
+    Return the dict mapping each replayed block ID to its consensus hash on success
+    Return None on verification failure
+    """
+
+    # map block ID to consensus hashes
+    consensus_hashes = {}
+
+    for block_id in xrange( start_block, end_block+1 ):
+
+        untrusted_db.lastblock = block_id
+        virtualchain_ops = block_to_virtualchain_ops( block_id, working_db, untrusted_db )
+
+        # feed ops to virtualchain to reconstruct the db at this block
+        consensus_hash = working_db.process_block( block_id, virtualchain_ops )
+        log.debug("VERIFY CONSENSUS(%s): %s" % (block_id, consensus_hash))
+
+        consensus_hashes[block_id] = consensus_hash
+        if block_id in expected_snapshots:
+            if expected_snapshots[block_id] != consensus_hash:
+                log.error("DATABASE IS NOT CONSISTENT AT %s: %s != %s" % (block_id, expected_snapshots[block_id], consensus_hash))
+                return None
+
+    return consensus_hashes
+
+
 def rebuild_database( target_block_id, untrusted_db_path, working_db_path=None, resume_dir=None, start_block=None, expected_snapshots={} ):
     """
     Given a target block ID and a path to an (untrusted) db, reconstruct it in a temporary directory by
     replaying all the nameops it contains.
 
     Optionally check that the snapshots in @expected_snapshots match up as we verify.
-    @expected_snapshots maps str(block_id) to str(consensus hash)
+    @expected_snapshots maps int(block_id) to str(consensus hash)
 
     Return the consensus hash calculated at the target block.
     Return None on verification failure (i.e. we got a different consensus hash than one for the same block in expected_snapshots)
@@ -246,24 +285,9 @@ def rebuild_database( target_block_id, untrusted_db_path, working_db_path=None,
 
     working_db = BlockstackDB( working_db_path, DISPOSITION_RW )
 
-    # map block ID to consensus hashes
-    consensus_hashes = {}
-
-    for block_id in xrange( start_block, target_block_id+1 ):
-
-        untrusted_db.lastblock = block_id
-        virtualchain_ops = block_to_virtualchain_ops( block_id, working_db, untrusted_db )
-
-        # feed ops to virtualchain to reconstruct the db at this block
-        consensus_hash = working_db.process_block( block_id, virtualchain_ops )
-        log.debug("VERIFY CONSENSUS(%s): %s" % (block_id, consensus_hash))
-
-        consensus_hashes[block_id] = consensus_hash
-        if block_id in expected_snapshots:
-            if expected_snapshots[block_id] != consensus_hash:
-                log.error("DATABASE IS NOT CONSISTENT AT %s: %s != %s" % (block_id, expected_snashots[block_id], consensus_hash))
-                return None
-
+    consensus_hashes = replay_blocks( working_db, untrusted_db, start_block, target_block_id, expected_snapshots=expected_snapshots )
+    if consensus_hashes is None:
+        return None
 
     # final consensus hash
     return consensus_hashes[ target_block_id ]
@@ -291,3 +315,246 @@ def verify_database( trusted_consensus_hash, consensus_block_id, untrusted_db_pa
         log.error("Unverifiable database state stored in '%s'" % blockstack_state_engine.working_dir )
         return False
 
+
+
+def get_backup_blocks( working_dir ):
+    """
+    Get the sorted list of block IDs at which the node in @working_dir took backups.
+    """
+    old_working_dir = os.environ.get('VIRTUALCHAIN_WORKING_DIR', None)
+    os.environ['VIRTUALCHAIN_WORKING_DIR'] = working_dir
+
+    try:
+        backup_blocks = BlockstackDB.get_backup_blocks( virtualchain_hooks )
+    finally:
+        if old_working_dir is not None:
+            os.environ['VIRTUALCHAIN_WORKING_DIR'] = old_working_dir
+        else:
+            del os.environ['VIRTUALCHAIN_WORKING_DIR']
+
+    return sorted( backup_blocks )
+
+
+def verify_database_segment( segment_dir, untrusted_db_path, untrusted_working_dir, anchor_block, end_block, expected_snapshots ):
+    """
+    Verify one segment of an untrusted database, in its own process.
+
+    The segment's state is seeded from the untrusted node's backup at @anchor_block
+    (or from the first block, if @anchor_block is None), and the untrusted
+    operations from the block after it through @end_block are replayed on top.
+
+    Return a dict with:
+    * consensus_hashes: the consensus hashes computed for each replayed block
+    * seed_consensus_hashes: the consensus hashes the seed state claims for each block up to @anchor_block
+    * seed_digest: the state digest of the seed database
+    * digest: the state digest of the database at @end_block
+    Return {'error': ...} on failure
+    """
+
+    try:
+        working_db_path = os.path.join( segment_dir, os.path.basename( untrusted_db_path ) )
+
+        if anchor_block is not None:
+            # copy in the backup, so we never touch the untrusted node's files
+            backup_dir = os.path.join( segment_dir, "backups" )
+            os.makedirs( backup_dir )
+
+            os.environ['VIRTUALCHAIN_WORKING_DIR'] = untrusted_working_dir
+            for backup_path in BlockstackDB.get_backup_paths( anchor_block, virtualchain_hooks ):
+                shutil.copy( backup_path, os.path.join( backup_dir, os.path.basename( backup_path ) ) )
+
+            if not blockstack_backup_restore( segment_dir, anchor_block ):
+                return {'error': 'Failed to restore backup at %s' % anchor_block}
+
+        os.environ['VIRTUALCHAIN_WORKING_DIR'] = segment_dir
+        blockstack_state_engine.working_dir = segment_dir
+        virtualchain.setup_virtualchain( impl=blockstack_state_engine )
+
+        untrusted_db = BlockstackDB( untrusted_db_path, DISPOSITION_RO )
+        working_db = BlockstackDB( working_db_path, DISPOSITION_RW )
+
+        seed_consensus_hashes = {}
+        seed_digest = None
+        start_block = virtualchain.get_first_block_id()
+
+        if anchor_block is not None:
+            for block_id in xrange( start_block, anchor_block+1 ):
+                seed_consensus_hashes[block_id] = working_db.get_consensus_at( block_id )
+
+            seed_digest = namedb_get_state_digest( working_db_path )
+            start_block = anchor_block + 1
+
+        log.debug("Verify segment %s-%s in '%s'" % (start_block, end_block, segment_dir))
+
+        consensus_hashes = replay_blocks( working_db, untrusted_db, start_block, end_block, expected_snapshots=expected_snapshots )
+        if consensus_hashes is None:
+            return {'error': 'Inconsistent consensus hash in segment %s-%s' % (start_block, end_block)}
+
+        working_db.close()
+        untrusted_db.close()
+
+        return {
+            'consensus_hashes': consensus_hashes,
+            'seed_consensus_hashes': seed_consensus_hashes,
+            'seed_digest': seed_digest,
+            'digest': namedb_get_state_digest( working_db_path )
+        }
+
+    except Exception, e:
+        log.exception(e)
+        return {'error': 'Failed to verify segment ending at %s' % end_block}
+
+
+def _verify_database_segment( conn, args ):
+    """
+    multiprocessing entry point for verify_database_segment.
+    Sends the result back over @conn.  If the replay aborts the
+    process, nothing is sent and the parent sees EOF instead.
+    """
+    try:
+        res = verify_database_segment( *args )
+    except Exception as e:
+        log.exception(e)
+        res = {'error': 'Segment replay failed: %s' % e}
+
+    conn.send( res )
+    conn.close()
+
+
+def _run_database_segments( segment_args, num_workers, poll_interval=0.1 ):
+    """
+    Run verify_database_segment() on each of @segment_args, in at most
+    @num_workers processes at once.  A segment whose process dies without
+    sending back a result (e.g. the replay hit a fatal mismatch and called
+    os.abort()) gets an {'error': ...} result, and the remaining segments
+    are not run.
+
+    Return the list of results, in the same order as @segment_args
+    (None for segments that never ran)
+    """
+    results = [None] * len(segment_args)
+    pending = range(0, len(segment_args))
+    running = {}
+    failed = False
+
+    try:
+        while len(running) > 0 or (len(pending) > 0 and not failed):
+            while len(pending) > 0 and len(running) < num_workers and not failed:
+                i = pending.pop(0)
+                parent_conn, child_conn = multiprocessing.Pipe( False )
+                proc = multiprocessing.Process( target=_verify_database_segment, args=(child_conn, segment_args[i]) )
+                proc.start()
+                child_conn.close()
+                running[i] = (proc, parent_conn)
+
+            finished = []
+            for i, (proc, conn) in running.items():
+                if not conn.poll() and proc.is_alive():
+                    continue
+
+                try:
+                    results[i] = conn.recv()
+                except EOFError:
+                    proc.join()
+                    results[i] = {'error': 'Segment process exited without a result (exit code %s)' % proc.exitcode}
+
+                if 'error' in results[i]:
+                    failed = True
+
+                finished.append(i)
+
+            for i in finished:
+                proc, conn = running.pop(i)
+                proc.join()
+                conn.close()
+
+            if len(finished) == 0:
+                time.sleep( poll_interval )
+
+            if failed:
+                # no point in waiting for the rest
+                for i, (proc, conn) in running.items():
+                    proc.terminate()
+                    proc.join()
+                    conn.close()
+
+                running = {}
+
+    finally:
+        for proc, conn in running.values():
+            proc.terminate()
+            proc.join()
+            conn.close()
+
+    return results
+
+
+def verify_database_parallel( trusted_consensus_hash, consensus_block_id, untrusted_db_path, untrusted_working_dir=None, num_workers=None, expected_snapshots={} ):
+    """
+    Verify that a database is consistent with a known-good consensus
+    hash, by replaying it in segments in parallel.
+
+    The block range is split at the backups the untrusted node took, and
+    each segment is replayed from its backup in a separate process.  Then
+    the segments are stitched together:  each segment's consensus hashes and
+    final state must match the consensus hashes and state of the backup the
+    next segment started from, and the last segment must arrive at
+    @trusted_consensus_hash.
+
+    Return True if the database is consistent
+    Return False if not
+    """
+
+    if untrusted_working_dir is None:
+        untrusted_working_dir = os.path.dirname( os.path.abspath( untrusted_db_path ) )
+
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+
+    anchors = [b for b in get_backup_blocks( untrusted_working_dir ) if b < consensus_block_id]
+    bounds = [None] + anchors
+    ends = anchors + [consensus_block_id]
+
+    log.debug("Verify database up to %s in %s segments with %s workers" % (consensus_block_id, len(bounds), num_workers))
+
+    verify_dir = tempfile.mkdtemp( prefix='blockstack-verify-database-' )
+    segment_args = []
+    for i in xrange(0, len(bounds)):
+        segment_dir = os.path.join( verify_dir, "segment-%s" % i )
+        os.makedirs( segment_dir )
+        segment_args.append( (segment_dir, untrusted_db_path, untrusted_working_dir, bounds[i], ends[i], expected_snapshots) )
+
+    results = _run_database_segments( segment_args, num_workers )
+
+    consensus_hashes = {}
+    for i in xrange(0, len(results)):
+        if results[i] is None:
+            log.error("Segment %s was not verified" % i)
+            log.error("Unverifiable database state stored in '%s'" % verify_dir)
+            return False
+
+        if 'error' in results[i]:
+            log.error("Segment %s failed: %s" % (i, results[i]['error']))
+            log.error("Unverifiable database state stored in '%s'" % verify_dir)
+            return False
+
+        consensus_hashes.update( results[i]['consensus_hashes'] )
+
+    # stitch the segments together
+    for i in xrange(1, len(results)):
+        for block_id, consensus_hash in results[i]['seed_consensus_hashes'].items():
+            if consensus_hashes.get(block_id) != consensus_hash:
+                log.error("DATABASE IS NOT CONSISTENT: backup at %s claims consensus hash %s at %s, but replay gave %s" % (bounds[i], consensus_hash, block_id, consensus_hashes.get(block_id)))
+                return False
+
+        if results[i-1]['digest'] != results[i]['seed_digest']:
+            log.error("DATABASE IS NOT CONSISTENT: backup at %s does not match the replayed state" % bounds[i])
+            return False
+
+    # did we reach the consensus hash we expected?
+    if consensus_hashes.get( consensus_block_id ) != trusted_consensus_hash:
+        log.error("Unverifiable database state stored in '%s'" % verify_dir)
+        return False
+
+    shutil.rmtree( verify_dir )
+    return True
@@ -28,8 +28,20 @@ import tempfile
 import base64
 import keylib
 import urllib
+import urllib2
+import urlparse
+import threading
+import Queue
 import hashlib
 import tarfile
+import bz2
+import json
+import re
+import struct
+import filecmp
+import collections
+import multiprocessing
+from cStringIO import StringIO
 
 import virtualchain
 from virtualchain.lib.ecdsalib import sign_digest, verify_digest
@@ -49,6 +61,14 @@ from .storage import *
 from .nameset import *
 from .operations import *
 
+# limits on the signature trailer (see fast_sync_inspect())
+SNAPSHOT_MAX_SIGNATURES = 256
+SNAPSHOT_MAX_SIGB64_LEN = 100
+SNAPSHOT_MAX_TRAILER_SIZE = 8 + SNAPSHOT_MAX_SIGNATURES * (SNAPSHOT_MAX_SIGB64_LEN + 8)
+
+# chunked snapshot payloads end with this (see fast_sync_snapshot_compress())
+SNAPSHOT_CHUNKED_MAGIC = 'BSKCHUNK'
+
 def snapshot_peek_number( fd, off ):
     """
     Read the last 8 bytes of fd
@@ -180,11 +200,132 @@ def fast_sync_sign_snapshot( snapshot_path, private_key, first=False ):
     return True
 
 
-def fast_sync_snapshot_compress( snapshot_dir, export_path ):
+def snapshot_compress_chunk( args ):
+    """
+    Compress one chunk of a file.
+    Runs in a worker process.
+    @args is (path, offset, length)
+    Return (compressed data, uncompressed length)
+    """
+    path, offset, length = args
+    with open(path, 'rb') as f:
+        f.seek(offset, os.SEEK_SET)
+        data = f.read(length)
+
+    return bz2.compress(data), len(data)
+
+
+def snapshot_decompress_chunk( args ):
+    """
+    Decompress one chunk of a chunked snapshot.
+    Runs in a worker process.
+    @args is (path, offset, length)
+    Return the decompressed data
+    """
+    path, offset, length = args
+    with open(path, 'rb') as f:
+        f.seek(offset, os.SEEK_SET)
+        data = f.read(length)
+
+    return bz2.decompress(data)
+
+
+def snapshot_pool_map( pool, func, args_list, depth ):
+    """
+    Like pool.imap(func, args_list), but keep at most @depth
+    results outstanding, so a slow consumer doesn't cause them
+    to pile up in RAM.  Yields results in order.
+    """
+    pending = collections.deque()
+    for args in args_list:
+        pending.append( pool.apply_async(func, (args,)) )
+        if len(pending) >= depth:
+            yield pending.popleft().get()
+
+    while len(pending) > 0:
+        yield pending.popleft().get()
+
+
+class SnapshotChunkReader(object):
+    """
+    File-like reader over a sequence of strings (i.e. decompressed chunks)
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buf = ''
+        self.buf_pos = 0
+
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buf) - self.buf_pos < size:
+            try:
+                chunk = self.chunks.next()
+            except StopIteration:
+                break
+
+            self.buf = self.buf[self.buf_pos:] + chunk
+            self.buf_pos = 0
+
+        if size < 0:
+            size = len(self.buf) - self.buf_pos
+
+        ret = self.buf[self.buf_pos:self.buf_pos + size]
+        self.buf_pos += len(ret)
+        return ret
+
+
+def fast_sync_snapshot_index( fd, payload_size ):
+    """
+    Get the chunk index of a chunked snapshot, given the size of its payload.
+    Return the index on success
+    Return None if this isn't a chunked snapshot (or the index is corrupt)
+    """
+    if payload_size < len(SNAPSHOT_CHUNKED_MAGIC) + 8:
+        return None
+
+    fd.seek(payload_size - len(SNAPSHOT_CHUNKED_MAGIC), os.SEEK_SET)
+    if fd.read(len(SNAPSHOT_CHUNKED_MAGIC)) != SNAPSHOT_CHUNKED_MAGIC:
+        return None
+
+    ptr = payload_size - len(SNAPSHOT_CHUNKED_MAGIC)
+    index_len = snapshot_peek_number(fd, ptr)
+    if index_len is None or index_len > ptr - 8:
+        log.error("Unparseable chunk index length")
+        return None
+
+    ptr -= 8
+    fd.seek(ptr - index_len, os.SEEK_SET)
+    try:
+        index = json.loads(fd.read(index_len))
+        assert index['version'] == 2
+        assert isinstance(index['chunks'], list)
+
+        offset = 0
+        for (chunk_offset, chunk_len, uncompressed_len) in index['chunks']:
+            assert chunk_offset == offset
+            offset += chunk_len
+
+        assert offset == ptr - index_len
+
+    except Exception, e:
+        log.exception(e)
+        log.error("Unparseable chunk index")
+        return None
+
+    return index
+
+
+def fast_sync_snapshot_compress( snapshot_dir, export_path, chunked=False, num_workers=None ):
     """
     Given the path to a directory, compress it and export it to the
     given path.
 
+    If @chunked is True, write a chunked snapshot:  the tarball is cut into
+    FAST_SYNC_CHUNK_SIZE-byte chunks that are compressed independently by
+    @num_workers processes.  The payload is the compressed chunks back to back
+    (so it's also a valid multi-stream bz2 file), then a JSON chunk index,
+    its length as 8 hex bytes, and SNAPSHOT_CHUNKED_MAGIC.
+
     Return {'status': True} on success
     Return {'error': ...} on failure
     """
@@ -205,10 +346,19 @@ def fast_sync_snapshot_compress( snapshot_dir, export_path ):
 
         return tarinfo
 
+    tar_path = export_path
+    if chunked:
+        tar_path = export_path + '.tar'
+
     try:
         os.chdir(snapshot_dir)
-        with tarfile.TarFile.bz2open(export_path, "w") as f:
-            f.add(".", filter=print_progress)
+        if chunked:
+            with tarfile.TarFile.open(tar_path, "w") as f:
+                f.add(".", filter=print_progress)
+
+        else:
+            with tarfile.TarFile.bz2open(tar_path, "w") as f:
+                f.add(".", filter=print_progress)
 
     except:
         os.chdir(old_dir)
@@ -217,30 +367,94 @@ def fast_sync_snapshot_compress( snapshot_dir, export_path ):
     finally:
         os.chdir(old_dir)
 
+    if not chunked:
+        return {'status': True}
+
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+
+    tar_size = os.stat(tar_path).st_size
+    chunk_args = [(tar_path, offset, min(FAST_SYNC_CHUNK_SIZE, tar_size - offset)) for offset in xrange(0, tar_size, FAST_SYNC_CHUNK_SIZE)]
+    chunks = []
+    offset = 0
+
+    log.debug("Compress {} bytes in {} chunks with {} workers".format(tar_size, len(chunk_args), num_workers))
+
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        with open(export_path, 'wb') as f:
+            for (data, uncompressed_len) in snapshot_pool_map(pool, snapshot_compress_chunk, chunk_args, 2 * num_workers):
+                f.write(data)
+                chunks.append( [offset, len(data), uncompressed_len] )
+                offset += len(data)
+
+            index_json = json.dumps({'version': 2, 'chunk_size': FAST_SYNC_CHUNK_SIZE, 'chunks': chunks})
+            f.write(index_json)
+            f.write('{:08x}'.format(len(index_json)))
+            f.write(SNAPSHOT_CHUNKED_MAGIC)
+
+    finally:
+        pool.terminate()
+        pool.join()
+        os.unlink(tar_path)
+
     return {'status': True}
 
 
-def fast_sync_snapshot_decompress( snapshot_path, output_dir ):
+def fast_sync_snapshot_decompress( snapshot_path, output_dir, num_workers=None ):
     """
     Given the path to a snapshot file, decompress it and 
-    write its contents to the given output directory
+    write its contents to the given output directory.
+    Chunked snapshots are decompressed by @num_workers processes.
 
     Return {'status': True} on success
     Return {'error': ...} on failure
     """
-    if not tarfile.is_tarfile(snapshot_path):
-        return {'error': 'Not a tarfile-compatible archive: {}'.format(snapshot_path)}
+    index = None
+    with open(snapshot_path, 'r') as f:
+        info = fast_sync_inspect(f)
+        if 'error' not in info:
+            index = fast_sync_snapshot_index(f, info['payload_size'])
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    with tarfile.TarFile.bz2open(snapshot_path, 'r') as f:
-        tarfile.TarFile.extractall(f, path=output_dir)
+    if index is None:
+        if not tarfile.is_tarfile(snapshot_path):
+            return {'error': 'Not a tarfile-compatible archive: {}'.format(snapshot_path)}
 
-    return {'status': True}
+        with tarfile.TarFile.bz2open(snapshot_path, 'r') as f:
+            tarfile.TarFile.extractall(f, path=output_dir)
+
+        return {'status': True}
 
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
 
-def fast_sync_snapshot( export_path, private_key, block_number ):
+    log.debug("Decompress {} chunks with {} workers".format(len(index['chunks']), num_workers))
+
+    chunk_args = [(snapshot_path, chunk_offset, chunk_len) for (chunk_offset, chunk_len, _) in index['chunks']]
+
+    def _check_chunks(chunks):
+        for (i, data) in enumerate(chunks):
+            if len(data) != index['chunks'][i][2]:
+                raise Exception("Chunk {} is {} bytes (expected {})".format(i, len(data), index['chunks'][i][2]))
+
+            yield data
+
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        reader = SnapshotChunkReader(_check_chunks(snapshot_pool_map(pool, snapshot_decompress_chunk, chunk_args, 2 * num_workers)))
+        res = fast_sync_stream_extract(reader, output_dir)
+
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return res
+
+
+def fast_sync_snapshot( export_path, private_key, block_number, chunked=False, base_paths=None ):
     """
     Export all the local state for fast-sync.
     If block_number is given, then the name database
@@ -249,6 +463,11 @@ def fast_sync_snapshot( export_path, private_key, block_number ):
     The exported tarball will be signed with the given private key,
     and the signature will be appended to the end of the file.
 
+    If chunked is True, write a chunked snapshot (see fast_sync_snapshot_compress()).
+
+    If base_paths is given, write a delta snapshot against the state at the
+    end of that chain of snapshots (a full snapshot, then any deltas on top of it).
+
     Return True if we succeed
     Return False if not
     """
@@ -397,9 +616,20 @@ def fast_sync_snapshot( export_path, private_key, block_number ):
         _cleanup(tmpdir)
         return False
 
+    # only export what changed since the base?
+    if base_paths:
+        res = fast_sync_make_delta(base_paths, tmpdir, block_number)
+        if 'error' in res:
+            log.error("Failed to make delta against {}: {}".format(base_paths[-1], res['error']))
+            _cleanup(tmpdir)
+            return False
+
+        _cleanup(tmpdir)
+        tmpdir = res['path']
+
     # compress
     export_path = os.path.abspath(export_path)
-    res = fast_sync_snapshot_compress(tmpdir, export_path)
+    res = fast_sync_snapshot_compress(tmpdir, export_path, chunked=chunked)
     if 'error' in res:
         log.error("Faield to compress {} to {}: {}".format(tmpdir, export_path, res['error']))
         _cleanup(tmpdir)
@@ -407,12 +637,23 @@ def fast_sync_snapshot( export_path, private_key, block_number ):
 
     log.debug("Wrote {} bytes".format(os.stat(export_path).st_size))
 
+    # manifest, for resumable fetches
+    manifest_path = fast_sync_make_manifest( export_path )
+    if manifest_path is None:
+        _cleanup(tmpdir)
+        return False
+
     # sign
     rc = fast_sync_sign_snapshot( export_path, private_key, first=True )
     if not rc:
         log.error("Failed to sign snapshot {}".format(export_path))
         return False
 
+    rc = fast_sync_sign_snapshot( manifest_path, private_key, first=True )
+    if not rc:
+        log.error("Failed to sign manifest {}".format(manifest_path))
+        return False
+
     _cleanup(tmpdir)
     return True
 
@@ -443,9 +684,220 @@ def fast_sync_fetch( import_url ):
     return tmppath
 
 
-def fast_sync_inspect( fd ):
+def fast_sync_make_manifest( snapshot_path, chunk_size=FAST_SYNC_FETCH_CHUNK_SIZE ):
+    """
+    Write the manifest for an (unsigned) snapshot to snapshot_path + '.manifest'.
+    The manifest lists the size and hash of the snapshot's payload and the hashes
+    of each of its chunk_size-byte chunks.  It is stored in the same container
+    as a snapshot, so it gets signed with fast_sync_sign_snapshot().
+
+    Return the path to the manifest on success
+    Return None on error
+    """
+    manifest_path = snapshot_path + '.manifest'
+    chunk_hashes = []
+    h = hashlib.sha256()
+
+    try:
+        payload_size = os.stat(snapshot_path).st_size
+        with open(snapshot_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if len(chunk) == 0:
+                    break
+
+                h.update(chunk)
+                chunk_hashes.append( hashlib.sha256(chunk).hexdigest() )
+
+        manifest = {
+            'version': 1,
+            'payload_size': payload_size,
+            'payload_hash': h.hexdigest(),
+            'chunk_size': chunk_size,
+            'chunks': chunk_hashes
+        }
+
+        with open(manifest_path, 'w') as f:
+            f.write(json.dumps(manifest, sort_keys=True))
+
+    except Exception, e:
+        log.exception(e)
+        log.error("Failed to make manifest for {}".format(snapshot_path))
+        return None
+
+    return manifest_path
+
+
+def fast_sync_read_range( url, start, end=None ):
+    """
+    Read the bytes [start, end) of the file at url (all of them from start, if end is None).
+    http(s) URLs are read with a range request; file:// URLs and plain paths
+    (e.g. a local mirror directory) are read directly.
+    Return the data on success
+    Raise on error
+    """
+    parsed = urlparse.urlparse(url)
+    if parsed.scheme in ['', 'file']:
+        path = urllib.url2pathname(parsed.path) if parsed.scheme == 'file' else url
+        with open(path, 'rb') as f:
+            f.seek(start, os.SEEK_SET)
+            if end is None:
+                return f.read()
+
+            return f.read(end - start)
+
+    if end is None:
+        range_header = 'bytes={}-'.format(start)
+    else:
+        range_header = 'bytes={}-{}'.format(start, end - 1)
+
+    resp = urllib2.urlopen(urllib2.Request(url, headers={'Range': range_header}), timeout=60)
+    if resp.getcode() != 206:
+        raise Exception("{} does not support range requests (HTTP {})".format(url, resp.getcode()))
+
+    return resp.read()
+
+
+def fast_sync_fetch_manifest( manifest_url, public_keys=config.FAST_SYNC_PUBLIC_KEYS, num_required=len(config.FAST_SYNC_PUBLIC_KEYS), logmsg=log.debug, logerr=log.error ):
+    """
+    Fetch a snapshot manifest and verify its signatures.
+    Return the manifest on success
+    Return None on error
+    """
+    try:
+        data = fast_sync_read_range(manifest_url, 0)
+        info = fast_sync_inspect(StringIO(data), fd_len=len(data))
+        if 'error' in info:
+            logerr("Failed to inspect manifest {}: {}".format(manifest_url, info['error']))
+            return None
+
+        manifest_json = data[:info['payload_size']]
+        num_match = fast_sync_verify_signatures( hashlib.sha256(manifest_json).hexdigest(), info['signatures'], public_keys, num_required, logmsg=logmsg )
+        if num_match < num_required:
+            logerr("Not enough manifest signatures match (required {}, found {})".format(num_required, num_match))
+            return None
+
+        manifest = json.loads(manifest_json)
+        assert manifest['version'] == 1
+        assert len(manifest['chunks']) == (manifest['payload_size'] + manifest['chunk_size'] - 1) / manifest['chunk_size']
+
+    except Exception, e:
+        log.exception(e)
+        logerr("Failed to fetch manifest {}".format(manifest_url))
+        return None
+
+    return manifest
+
+
+def fast_sync_fetch_ranged( import_url, manifest, partial_path, num_workers=FAST_SYNC_FETCH_WORKERS, logmsg=log.debug, logerr=log.error ):
+    """
+    Fetch the snapshot at import_url to partial_path, chunk by chunk as listed in
+    its (verified) manifest.  Chunks already in partial_path from an earlier
+    attempt are kept if they match the manifest; the rest are fetched by
+    num_workers threads with range requests and checked as they arrive.
+    Then the signature trailer is fetched and appended.
+
+    Return partial_path on success
+    Return None on error
+    """
+    payload_size = manifest['payload_size']
+    chunk_size = manifest['chunk_size']
+    num_chunks = len(manifest['chunks'])
+
+    def _chunk_range(i):
+        return (i * chunk_size, min((i + 1) * chunk_size, payload_size))
+
+    try:
+        if not os.path.exists(partial_path):
+            open(partial_path, 'wb').close()
+
+        f = open(partial_path, 'r+b')
+        f.truncate(payload_size)
+
+    except Exception, e:
+        log.exception(e)
+        logerr("Failed to open {}".format(partial_path))
+        return None
+
+    # what do we already have?
+    missing = Queue.Queue()
+    num_missing = 0
+    for i in xrange(0, num_chunks):
+        start, end = _chunk_range(i)
+        f.seek(start, os.SEEK_SET)
+        if hashlib.sha256(f.read(end - start)).hexdigest() != manifest['chunks'][i]:
+            missing.put(i)
+            num_missing += 1
+
+    logmsg("Fetch {} of {} chunks of {}".format(num_missing, num_chunks, import_url))
+
+    write_lock = threading.Lock()
+    failed = []
+
+    def _fetch_chunks():
+        while len(failed) == 0:
+            try:
+                i = missing.get_nowait()
+            except Queue.Empty:
+                return
+
+            start, end = _chunk_range(i)
+            for attempt in xrange(0, FAST_SYNC_FETCH_RETRIES):
+                try:
+                    data = fast_sync_read_range(import_url, start, end)
+                    if hashlib.sha256(data).hexdigest() == manifest['chunks'][i]:
+                        break
+
+                    log.error("Chunk {} of {} does not match the manifest".format(i, import_url))
+
+                except Exception, e:
+                    log.exception(e)
+                    log.error("Failed to fetch chunk {} of {}".format(i, import_url))
+
+                data = None
+
+            if data is None:
+                failed.append(i)
+                return
+
+            with write_lock:
+                f.seek(start, os.SEEK_SET)
+                f.write(data)
+
+    workers = [threading.Thread(target=_fetch_chunks) for i in xrange(0, min(num_workers, num_missing))]
+    for w in workers:
+        w.start()
+
+    for w in workers:
+        w.join()
+
+    if len(failed) > 0:
+        f.close()
+        logerr("Failed to fetch {}; run again to resume".format(import_url))
+        return None
+
+    # signatures
+    try:
+        trailer = fast_sync_read_range(import_url, payload_size)
+        assert len(trailer) <= SNAPSHOT_MAX_TRAILER_SIZE, "Signature trailer is too big"
+
+        f.seek(payload_size, os.SEEK_SET)
+        f.write(trailer)
+        f.close()
+
+    except Exception, e:
+        log.exception(e)
+        logerr("Failed to fetch signatures for {}".format(import_url))
+        return None
+
+    return partial_path
+
+
+def fast_sync_inspect( fd, fd_len=None ):
     """
     Inspect a snapshot, given its file descriptor.
+    If fd_len is given, treat the snapshot as being that long
+    (e.g. if fd isn't backed by a file).
     Get the signatures and payload size
     Return {'status': True, 
             'signatures': signatures,
@@ -453,8 +905,11 @@ def fast_sync_inspect( fd ):
             'sig_append_offset': offset} on success
     Return {'error': ...} on error
     """
-    sb = os.fstat(fd.fileno())
-    ptr = sb.st_size
+    if fd_len is None:
+        sb = os.fstat(fd.fileno())
+        fd_len = sb.st_size
+
+    ptr = fd_len
     if ptr < 8:
         log.debug("fd is {} bytes".format(ptr))
         return {'error': 'File is too small to be a snapshot'}
@@ -466,7 +921,7 @@ def fast_sync_inspect( fd ):
 
     # read number of signatures
     num_signatures = snapshot_peek_number(fd, ptr)
-    if num_signatures is None or num_signatures > 256:
+    if num_signatures is None or num_signatures > SNAPSHOT_MAX_SIGNATURES:
         log.error("Unparseable num_signatures field")
         return {'error': 'Unparseable num_signatures'}
 
@@ -479,7 +934,7 @@ def fast_sync_inspect( fd ):
     # read signatures
     for i in xrange(0, num_signatures):
         sigb64_len = snapshot_peek_number(fd, ptr)
-        if sigb64_len is None or sigb64_len > 100:
+        if sigb64_len is None or sigb64_len > SNAPSHOT_MAX_SIGB64_LEN:
             log.error("Unparseable signature length field")
             return {'error': 'Unparseable signature length'}
 
@@ -509,7 +964,7 @@ def fast_sync_inspect_snapshot( snapshot_path ):
     with open(snapshot_path, 'r') as f:
         info = fast_sync_inspect( f )
         if 'error' in info:
-            log.error("Failed to inspect snapshot {}: {}".format(import_path, info['error']))
+            log.error("Failed to inspect snapshot {}: {}".format(snapshot_path, info['error']))
             return {'error': 'Failed to inspect snapshot'}
 
         # get the hash of the file 
@@ -519,7 +974,665 @@ def fast_sync_inspect_snapshot( snapshot_path ):
     return info
 
 
-def fast_sync_import( working_dir, import_url, public_keys=config.FAST_SYNC_PUBLIC_KEYS, num_required=len(config.FAST_SYNC_PUBLIC_KEYS), verbose=False ):
+def fast_sync_verify_signatures( hash_hex, signatures, public_keys, num_required, logmsg=log.debug ):
+    """
+    Verify that at least `num_required` public keys in `public_keys`
+    signed the snapshot hash `hash_hex`.
+    NOTE: `public_keys` needs to be in the same order as the private keys that signed.
+
+    Return the number of matching signatures
+    """
+    signatures = signatures[:]
+    num_match = 0
+    for next_pubkey in public_keys:
+        for sigb64 in signatures:
+            valid = verify_digest( hash_hex, keylib.ECPublicKey(next_pubkey).to_hex(), sigb64, hashfunc=hashlib.sha256 ) 
+            if valid:
+                num_match += 1
+                if num_match >= num_required:
+                    break
+                
+                logmsg("Public key {} matches {} ({})".format(next_pubkey, sigb64, hash_hex))
+                signatures.remove(sigb64)
+            
+            else:
+                logmsg("Public key {} does NOT match {} ({})".format(next_pubkey, sigb64, hash_hex))
+
+    return num_match
+
+
+class SnapshotStreamReader(object):
+    """
+    File-like reader over a snapshot's tar payload, decompressed as the
+    snapshot is read from @src (e.g. as it is downloaded).  Works for both
+    plain and chunked snapshots (see fast_sync_snapshot_compress()).
+
+    The raw snapshot is hashed as it passes through, except for the last
+    SNAPSHOT_MAX_TRAILER_SIZE bytes:  until we reach the end, we can't tell
+    whether they're payload or signature trailer.  Call finish() once the
+    payload has been consumed, to read the rest of the snapshot, parse
+    the trailer and complete the hash.
+    """
+    def __init__(self, src, bufsize=65536):
+        self.src = src
+        self.bufsize = bufsize
+        self.hash = hashlib.sha256()
+        self.decompressor = None
+        self.decompressor_output = False
+        self.num_streams = 0
+        self.decompressed_eof = False
+        self.tail = ''
+        self.buf = ''
+        self.buf_pos = 0
+        self.num_bytes = 0
+
+
+    def _fill(self):
+        """
+        Read and decompress the next block of the snapshot.
+        Return False if there's nothing left to read
+        """
+        data = self.src.read(self.bufsize)
+        if len(data) == 0:
+            return False
+
+        self.num_bytes += len(data)
+
+        # hash all but the last SNAPSHOT_MAX_TRAILER_SIZE bytes
+        self.tail += data
+        if len(self.tail) > SNAPSHOT_MAX_TRAILER_SIZE:
+            split = len(self.tail) - SNAPSHOT_MAX_TRAILER_SIZE
+            self.hash.update(self.tail[:split])
+            self.tail = self.tail[split:]
+
+        # the payload is one bz2 stream, or one per chunk in a chunked snapshot.
+        # whatever follows the last stream (the chunk index or trailer) isn't bz2 data.
+        while len(data) > 0 and not self.decompressed_eof:
+            if self.decompressor is None:
+                if self.num_streams > 0 and not 'BZh'.startswith(data[:3]):
+                    self.decompressed_eof = True
+                    break
+
+                self.decompressor = bz2.BZ2Decompressor()
+                self.decompressor_output = False
+                self.num_streams += 1
+
+            try:
+                decompressed = self.decompressor.decompress(data)
+            except EOFError:
+                # stream ended on the last block boundary
+                self.decompressor = None
+                continue
+            except IOError:
+                if self.num_streams == 1 or self.decompressor_output:
+                    raise
+
+                # looked like the start of another stream, but wasn't
+                self.decompressed_eof = True
+                break
+
+            data = self.decompressor.unused_data
+            if len(data) > 0:
+                # stream ended in this block
+                self.decompressor = None
+
+            if len(decompressed) > 0:
+                self.decompressor_output = True
+                self.buf = self.buf[self.buf_pos:] + decompressed
+                self.buf_pos = 0
+
+        return True
+
+
+    def read(self, size=-1):
+        """
+        Read decompressed payload data
+        """
+        while (size < 0 or len(self.buf) - self.buf_pos < size) and not self.decompressed_eof:
+            if not self._fill():
+                break
+
+        if size < 0:
+            size = len(self.buf) - self.buf_pos
+
+        ret = self.buf[self.buf_pos:self.buf_pos + size]
+        self.buf_pos += len(ret)
+        return ret
+
+
+    def finish(self):
+        """
+        Read the rest of the snapshot and parse its signature trailer.
+        Return {'status': True, 'signatures': ..., 'payload_size': ..., 'hash': ...} on success
+        Return {'error': ...} on error
+        """
+        while self._fill():
+            pass
+
+        info = fast_sync_inspect( StringIO(self.tail), fd_len=len(self.tail) )
+        if 'error' in info:
+            return info
+
+        self.hash.update(self.tail[:info['payload_size']])
+        info['payload_size'] += self.num_bytes - len(self.tail)
+        info['sig_append_offset'] += self.num_bytes - len(self.tail)
+        info['hash'] = self.hash.hexdigest()
+        return info
+
+
+def fast_sync_stream_extract( reader, output_dir ):
+    """
+    Extract a snapshot's tar payload from a file-like reader
+    (e.g. a SnapshotStreamReader) into output_dir as it arrives.  Only regular files and directories that stay
+    within output_dir are accepted.
+
+    Return {'status': True} on success
+    Return {'error': ...} on failure
+    """
+    output_dir = os.path.abspath(output_dir)
+    count = 0
+
+    try:
+        with tarfile.open(fileobj=reader, mode='r|') as f:
+            for member in f:
+                dest_path = os.path.abspath(os.path.join(output_dir, member.name))
+                if dest_path != output_dir and not dest_path.startswith(output_dir + os.path.sep):
+                    return {'error': 'Snapshot entry is outside of the snapshot: {}'.format(member.name)}
+
+                if not member.isfile() and not member.isdir():
+                    return {'error': 'Snapshot entry is not a file or directory: {}'.format(member.name)}
+
+                f.extract(member, path=output_dir)
+
+                count += 1
+                if count % 100 == 0:
+                    log.debug("{} files...".format(count))
+
+    except Exception, e:
+        log.exception(e)
+        return {'error': 'Failed to extract snapshot'}
+
+    return {'status': True}
+
+
+def fast_sync_promote( staging_dir, working_dir ):
+    """
+    Move the contents of a verified staging directory into the working directory.
+    Each entry is moved into place with a rename, and anything it replaces
+    is set aside first and only deleted once every entry is in place.
+    A database's write-ahead log (-wal and -shm) in the working directory is
+    set aside too, unless the staging directory has its own: it belongs to the
+    database being replaced, and sqlite would otherwise replay it on top of the new one.
+
+    If a rename fails, the entries moved so far are moved back into the staging
+    directory and the set-aside ones are put back, so the working directory is left as it was.
+
+    Return True on success
+    Return False on error
+    """
+    retired_dir = tempfile.mkdtemp(prefix='.blockstack-fast-sync-old-', dir=working_dir)
+    names = os.listdir(staging_dir)
+    promoted = []
+    retired = []
+
+    try:
+        for name in names:
+            dest_path = os.path.join(working_dir, name)
+            if os.path.exists(dest_path):
+                os.rename(dest_path, os.path.join(retired_dir, name))
+                retired.append(name)
+
+            for wal_name in [name + '-wal', name + '-shm']:
+                if wal_name not in names and os.path.exists(os.path.join(working_dir, wal_name)):
+                    log.debug("Set aside '{}'".format(os.path.join(working_dir, wal_name)))
+                    os.rename(os.path.join(working_dir, wal_name), os.path.join(retired_dir, wal_name))
+                    retired.append(wal_name)
+
+            os.rename(os.path.join(staging_dir, name), dest_path)
+            promoted.append(name)
+
+    except Exception, e:
+        log.exception(e)
+        log.error("Failed to move {} into {}".format(staging_dir, working_dir))
+
+        # put everything back
+        try:
+            for name in reversed(promoted):
+                os.rename(os.path.join(working_dir, name), os.path.join(staging_dir, name))
+
+            for name in reversed(retired):
+                os.rename(os.path.join(retired_dir, name), os.path.join(working_dir, name))
+
+            os.rmdir(retired_dir)
+
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to restore {}; the replaced files are in {}".format(working_dir, retired_dir))
+
+        return False
+
+    shutil.rmtree(retired_dir)
+    shutil.rmtree(staging_dir)
+    return True
+
+
+def fast_sync_import_stream( working_dir, import_url, public_keys=config.FAST_SYNC_PUBLIC_KEYS, num_required=len(config.FAST_SYNC_PUBLIC_KEYS), logmsg=log.debug, logerr=log.error ):
+    """
+    Streaming fast sync import.
+    Download the snapshot at @import_url, hashing it and extracting it into a
+    staging directory under @working_dir in the same pass.  Once the download
+    completes, check the signatures over the hash, and only if they verify,
+    move the staged state into @working_dir.
+
+    Return the snapshot's (signed) hash on success
+    Return None on error
+    """
+    logmsg("Stream {}...".format(import_url))
+    staging_dir = tempfile.mkdtemp(prefix='.blockstack-fast-sync-staging-', dir=working_dir)
+
+    try:
+        src = urllib.urlopen(import_url)
+    except Exception, e:
+        log.exception(e)
+        logerr("Failed to fetch {}".format(import_url))
+        shutil.rmtree(staging_dir)
+        return None
+
+    reader = SnapshotStreamReader(src)
+    res = fast_sync_stream_extract(reader, staging_dir)
+    if 'error' in res:
+        logerr("Failed to extract {}: {}".format(import_url, res['error']))
+        src.close()
+        shutil.rmtree(staging_dir)
+        return None
+
+    info = reader.finish()
+    src.close()
+
+    if 'error' in info:
+        logerr("Failed to inspect snapshot {}: {}".format(import_url, info['error']))
+        shutil.rmtree(staging_dir)
+        return None
+
+    # validate signatures over the hash
+    logmsg("Verify {} bytes".format(info['payload_size']))
+    num_match = fast_sync_verify_signatures( info['hash'], info['signatures'], public_keys, num_required, logmsg=logmsg )
+    if num_match < num_required:
+        logerr("Not enough signatures match (required {}, found {})".format(num_required, num_match))
+        shutil.rmtree(staging_dir)
+        return None
+
+    if not fast_sync_promote(staging_dir, working_dir):
+        logerr("Failed to install snapshot into {}".format(working_dir))
+        shutil.rmtree(staging_dir)
+        return None
+
+    return info['hash']
+
+
+def fast_sync_fetch_verified( import_url, public_keys=config.FAST_SYNC_PUBLIC_KEYS, num_required=len(config.FAST_SYNC_PUBLIC_KEYS), logmsg=log.debug, logerr=log.error, partial_dir=None ):
+    """
+    Fetch a snapshot to a temporary path, and verify its signatures.
+
+    If partial_dir is given and the snapshot has a manifest (at import_url + '.manifest'),
+    fetch it in chunks to a partial file in partial_dir, so an interrupted fetch
+    can be resumed (see fast_sync_fetch_ranged()).
+
+    Return {'status': True, 'path': ..., 'hash': ...} on success
+    Return {'error': ...} on error
+    """
+    # go get it 
+    import_path = None
+    manifest = None
+    if partial_dir is not None:
+        manifest = fast_sync_fetch_manifest(import_url + '.manifest', public_keys=public_keys, num_required=num_required, logmsg=logmsg, logerr=logerr)
+        if manifest is None:
+            logmsg("No usable manifest for {}; fetching it whole".format(import_url))
+
+    if manifest is not None:
+        partial_path = os.path.join(partial_dir, '.blockstack-fast-sync-{}.partial'.format(manifest['payload_hash']))
+        import_path = fast_sync_fetch_ranged(import_url, manifest, partial_path, logmsg=logmsg, logerr=logerr)
+    else:
+        import_path = fast_sync_fetch(import_url)
+
+    if import_path is None:
+        logerr("Failed to fetch {}".format(import_url))
+        return {'error': 'Failed to fetch snapshot'}
+
+    # format: <signed bz2 payload> <sigb64> <sigb64 length (8 bytes hex)> ... <num signatures>
+    with open(import_path, 'r') as f:
+        info = fast_sync_inspect( f )
+        if 'error' in info:
+            logerr("Failed to inspect snapshot {}: {}".format(import_path, info['error']))
+            return {'error': 'Failed to inspect snapshot'}
+
+        signatures = info['signatures']
+        ptr = info['payload_size']
+
+        # get the hash of the file 
+        hash_hex = get_file_hash(f, hashlib.sha256, fd_len=ptr)
+        
+        # validate signatures over the hash
+        logmsg("Verify {} bytes".format(ptr))
+        num_match = fast_sync_verify_signatures( hash_hex, signatures, public_keys, num_required, logmsg=logmsg )
+
+        # enough signatures?
+        if num_match < num_required:
+            logerr("Not enough signatures match (required {}, found {})".format(num_required, num_match))
+            return {'error': 'Not enough signatures match'}
+
+    return {'status': True, 'path': os.path.abspath(import_path), 'hash': hash_hex}
+
+
+def sqlite3_page_size( path ):
+    """
+    Get the page size of a sqlite3 database file.
+    Return None if the file isn't a sqlite3 database
+    """
+    with open(path, 'rb') as f:
+        header = f.read(18)
+
+    if len(header) < 18 or header[:16] != 'SQLite format 3\x00':
+        return None
+
+    page_size = struct.unpack('>H', header[16:18])[0]
+    if page_size == 1:
+        page_size = 65536
+
+    return page_size
+
+
+def fast_sync_page_diff( base_path, new_path, diff_path, page_size ):
+    """
+    Write out the pages of new_path that differ from base_path,
+    as <page number (8 bytes hex)><page> records.
+    Return the number of pages written
+    """
+    count = 0
+    page_no = 0
+    with open(base_path, 'rb') as base_f, open(new_path, 'rb') as new_f, open(diff_path, 'wb') as diff_f:
+        while True:
+            new_page = new_f.read(page_size)
+            if len(new_page) == 0:
+                break
+
+            if new_page != base_f.read(page_size):
+                diff_f.write('{:08x}'.format(page_no))
+                diff_f.write(new_page)
+                count += 1
+
+            page_no += 1
+
+    return count
+
+
+def fast_sync_page_patch( base_path, diff_path, out_path, page_size, size ):
+    """
+    Rebuild a file from its base and the pages written by fast_sync_page_diff()
+    """
+    shutil.copy(base_path, out_path)
+    with open(out_path, 'r+b') as out_f, open(diff_path, 'rb') as diff_f:
+        while True:
+            page_no_hex = diff_f.read(8)
+            if len(page_no_hex) == 0:
+                break
+
+            out_f.seek(int(page_no_hex, 16) * page_size, os.SEEK_SET)
+            out_f.write(diff_f.read(page_size))
+
+        out_f.truncate(size)
+
+
+def fast_sync_list_files( root_dir ):
+    """
+    List the paths of all files under root_dir, relative to it
+    """
+    ret = []
+    for (dirpath, dirnames, filenames) in os.walk(root_dir):
+        for name in filenames:
+            ret.append( os.path.relpath(os.path.join(dirpath, name), root_dir) )
+
+    return ret
+
+
+def fast_sync_path( root_dir, rel_path ):
+    """
+    Join a relative path from a snapshot to root_dir,
+    making sure it doesn't escape root_dir.
+    """
+    root_dir = os.path.abspath(root_dir)
+    path = os.path.abspath(os.path.join(root_dir, rel_path))
+    if not path.startswith(root_dir + os.path.sep):
+        raise ValueError("Path is outside of the snapshot: {}".format(rel_path))
+
+    return path
+
+
+def fast_sync_file_hash( path ):
+    """
+    Get the hex-encoded sha256 of a file
+    """
+    with open(path, 'rb') as f:
+        return get_file_hash(f, hashlib.sha256)
+
+
+def fast_sync_delta_diff( base_dir, new_dir, delta_dir, base_hash, block_number ):
+    """
+    Fill delta_dir with the delta that turns the snapshot state in base_dir
+    into the snapshot state in new_dir:
+    * files that are new or changed are included whole, except for
+    sqlite3 databases, for which only the changed pages are included
+    (a backup file is diffed against the previous backup of the same file);
+    * unchanged files are left out;
+    * delta.json lists what to patch, what to remove, and the hash of the
+    (signed) snapshot the delta applies to.
+
+    Return {'status': True} on success
+    Return {'error': ...} on error
+    """
+    base_files = set(fast_sync_list_files(base_dir))
+    new_files = fast_sync_list_files(new_dir)
+
+    manifest = {
+        'version': 1,
+        'base_hash': base_hash,
+        'block': block_number,
+        'files': {},
+        'removed': sorted(list(base_files - set(new_files)))
+    }
+
+    for rel_path in new_files:
+        new_path = os.path.join(new_dir, rel_path)
+
+        base_rel_path = None
+        if rel_path in base_files:
+            base_rel_path = rel_path
+            if filecmp.cmp(os.path.join(base_dir, rel_path), new_path, shallow=False):
+                # unchanged
+                continue
+
+        else:
+            # back up of the same file, at another block?
+            m = re.match(r'^(.+)\.bak\.[0-9]+$', rel_path)
+            if m is not None:
+                prior_backups = filter(lambda p: re.match(r'^' + re.escape(m.group(1)) + r'\.bak\.[0-9]+$', p), base_files)
+                if len(prior_backups) > 0:
+                    base_rel_path = max(prior_backups, key=lambda p: int(p.split('.')[-1]))
+
+        dest_path = os.path.join(delta_dir, rel_path)
+        if not os.path.exists(os.path.dirname(dest_path)):
+            os.makedirs(os.path.dirname(dest_path))
+
+        page_size = sqlite3_page_size(new_path)
+        if base_rel_path is not None and page_size is not None:
+            base_path = os.path.join(base_dir, base_rel_path)
+            num_pages = fast_sync_page_diff(base_path, new_path, dest_path + '.pages', page_size)
+
+            log.debug("{}: {} pages changed since {}".format(rel_path, num_pages, base_rel_path))
+            manifest['files'][rel_path] = {
+                'type': 'pages',
+                'base': base_rel_path,
+                'page_size': page_size,
+                'size': os.stat(new_path).st_size,
+                'base_sha256': fast_sync_file_hash(base_path),
+                'sha256': fast_sync_file_hash(new_path)
+            }
+
+        else:
+            shutil.copy(new_path, dest_path)
+            manifest['files'][rel_path] = {'type': 'file'}
+
+    with open(os.path.join(delta_dir, 'delta.json'), 'w') as f:
+        f.write(json.dumps(manifest, sort_keys=True))
+
+    log.debug("Delta from {}: {} files, {} removed".format(base_hash, len(manifest['files']), len(manifest['removed'])))
+    return {'status': True}
+
+
+def fast_sync_delta_apply( delta_dir, working_dir, base_hash ):
+    """
+    Apply an extracted delta snapshot in delta_dir to the snapshot state in
+    working_dir.  The delta must have been made against the snapshot with the
+    (verified) hash base_hash.  Patched files are rebuilt in delta_dir and checked
+    before anything in working_dir is touched.  delta_dir is consumed.
+
+    Return {'status': True} on success
+    Return {'error': ...} on error
+    """
+    try:
+        with open(os.path.join(delta_dir, 'delta.json'), 'r') as f:
+            manifest = json.loads(f.read())
+
+        assert manifest['version'] == 1
+        
+    except Exception, e:
+        log.exception(e)
+        return {'error': 'Not a delta snapshot'}
+
+    if manifest['base_hash'] != base_hash:
+        return {'error': 'Delta applies to snapshot {}, not {}'.format(manifest['base_hash'], base_hash)}
+
+    try:
+        for (rel_path, file_info) in manifest['files'].items():
+            out_path = fast_sync_path(delta_dir, rel_path)
+            if file_info['type'] != 'pages':
+                if not os.path.exists(out_path):
+                    return {'error': 'Delta is missing {}'.format(rel_path)}
+
+                continue
+
+            base_path = fast_sync_path(working_dir, file_info['base'])
+            if not os.path.exists(base_path) or fast_sync_file_hash(base_path) != file_info['base_sha256']:
+                return {'error': '{} does not match the delta\'s base'.format(file_info['base'])}
+
+            fast_sync_page_patch(base_path, out_path + '.pages', out_path, file_info['page_size'], file_info['size'])
+            os.unlink(out_path + '.pages')
+
+            if fast_sync_file_hash(out_path) != file_info['sha256']:
+                return {'error': 'Failed to rebuild {}'.format(rel_path)}
+
+        os.unlink(os.path.join(delta_dir, 'delta.json'))
+
+        # move new and patched files into place, then drop what the delta removed
+        for rel_path in fast_sync_list_files(delta_dir):
+            dest_path = fast_sync_path(working_dir, rel_path)
+            if not os.path.exists(os.path.dirname(dest_path)):
+                os.makedirs(os.path.dirname(dest_path))
+
+            os.rename(os.path.join(delta_dir, rel_path), dest_path)
+
+        for rel_path in manifest['removed']:
+            path = fast_sync_path(working_dir, rel_path)
+            if os.path.exists(path):
+                os.unlink(path)
+
+    except Exception, e:
+        log.exception(e)
+        return {'error': 'Failed to apply delta'}
+
+    shutil.rmtree(delta_dir)
+    return {'status': True}
+
+
+def fast_sync_make_delta( base_paths, snapshot_dir, block_number ):
+    """
+    Make a delta snapshot directory that takes the state in snapshot_dir
+    from the snapshot state at the end of the chain base_paths (a full
+    snapshot, followed by zero or more deltas on top of it).
+
+    Return {'status': True, 'path': delta directory} on success
+    Return {'error': ...} on error
+    """
+    base_dir = tempfile.mkdtemp(prefix='.blockstack-export-base-')
+    try:
+        res = fast_sync_snapshot_decompress(base_paths[0], base_dir)
+        if 'error' in res:
+            return res
+
+        if os.path.exists(os.path.join(base_dir, 'delta.json')):
+            return {'error': '{} is a delta, not a full snapshot'.format(base_paths[0])}
+
+        info = fast_sync_inspect_snapshot(base_paths[0])
+        if 'error' in info:
+            return info
+
+        base_hash = info['hash']
+        for delta_path in base_paths[1:]:
+            staging_dir = tempfile.mkdtemp(prefix='.blockstack-export-delta-')
+            res = fast_sync_snapshot_decompress(delta_path, staging_dir)
+            if 'error' not in res:
+                res = fast_sync_delta_apply(staging_dir, base_dir, base_hash)
+
+            if 'error' in res:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                return {'error': 'Failed to apply {}: {}'.format(delta_path, res['error'])}
+
+            info = fast_sync_inspect_snapshot(delta_path)
+            if 'error' in info:
+                return info
+
+            base_hash = info['hash']
+
+        delta_dir = tempfile.mkdtemp(prefix='.blockstack-export-')
+        res = fast_sync_delta_diff(base_dir, snapshot_dir, delta_dir, base_hash, block_number)
+        if 'error' in res:
+            shutil.rmtree(delta_dir)
+            return res
+
+        return {'status': True, 'path': delta_dir}
+
+    finally:
+        shutil.rmtree(base_dir)
+
+
+def fast_sync_import_delta( working_dir, delta_url, base_hash, public_keys=config.FAST_SYNC_PUBLIC_KEYS, num_required=len(config.FAST_SYNC_PUBLIC_KEYS), logmsg=log.debug, logerr=log.error, resumable=False ):
+    """
+    Fetch and verify a delta snapshot, and apply it to the snapshot state in working_dir,
+    which must be that of the snapshot with the hash base_hash.
+
+    Return the delta's (signed) hash on success
+    Return None on error
+    """
+    res = fast_sync_fetch_verified(delta_url, public_keys=public_keys, num_required=num_required, logmsg=logmsg, logerr=logerr, partial_dir=(working_dir if resumable else None))
+    if 'error' in res:
+        return None
+
+    staging_dir = tempfile.mkdtemp(prefix='.blockstack-fast-sync-delta-', dir=working_dir)
+    delta = fast_sync_snapshot_decompress(res['path'], staging_dir)
+    if 'error' not in delta:
+        delta = fast_sync_delta_apply(staging_dir, working_dir, base_hash)
+
+    if 'error' in delta:
+        logerr("Failed to apply delta {}: {}".format(delta_url, delta['error']))
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return None
+
+    os.unlink(res['path'])
+    logmsg("Applied delta {}".format(delta_url))
+    return res['hash']
+
+
+def fast_sync_import( working_dir, import_url, public_keys=config.FAST_SYNC_PUBLIC_KEYS, num_required=len(config.FAST_SYNC_PUBLIC_KEYS), verbose=False, stream=False, delta_urls=[], resumable=False ):
     """
     Fast sync import.
     Verify the given fast-sync file from @import_path using @public_key, and then 
@@ -527,6 +1640,15 @@ def fast_sync_import( working_dir, import_url, public_keys=config.FAST_SYNC_PUBL
 
     Verify that at least `num_required` public keys in `public_keys` signed.
     NOTE: `public_keys` needs to be in the same order as the private keys that signed.
+
+    If @stream is True, download, verify and extract in one pass
+    (see fast_sync_import_stream()).
+
+    Then apply each delta snapshot in @delta_urls, in order.
+
+    If @resumable is True, fetch snapshots that have manifests in parallel chunks
+    to partial files in @working_dir, so a failed import can be resumed
+    (see fast_sync_fetch_ranged()).
     """
 
     def logmsg(s):
@@ -548,67 +1670,36 @@ def fast_sync_import( working_dir, import_url, public_keys=config.FAST_SYNC_PUBL
         logerr("No such directory {}".format(working_dir))
         return False
 
-    # go get it 
-    import_path = fast_sync_fetch(import_url)
-    if import_path is None:
-        logerr("Failed to fetch {}".format(import_url))
-        return False
-
-    # format: <signed bz2 payload> <sigb64> <sigb64 length (8 bytes hex)> ... <num signatures>
-    file_size = 0
-    try:
-        sb = os.stat(import_path)
-        file_size = sb.st_size
-    except Exception as e:
-        log.exception(e)
-        return False
+    snapshot_hash = None
+    if stream:
+        snapshot_hash = fast_sync_import_stream(working_dir, import_url, public_keys=public_keys, num_required=num_required, logmsg=logmsg, logerr=logerr)
+        if snapshot_hash is None:
+            return False
 
-    num_signatures = 0
-    ptr = file_size
-    signatures = []
+    else:
+        verified = fast_sync_fetch_verified(import_url, public_keys=public_keys, num_required=num_required, logmsg=logmsg, logerr=logerr, partial_dir=(working_dir if resumable else None))
+        if 'error' in verified:
+            return False
 
-    with open(import_path, 'r') as f:
-        info = fast_sync_inspect( f )
-        if 'error' in info:
-            logerr("Failed to inspect snapshot {}: {}".format(import_path, info['error']))
+        # decompress
+        import_path = verified['path']
+        res = fast_sync_snapshot_decompress(import_path, working_dir)
+        if 'error' in res:
+            logerr("Failed to decompress {} to {}: {}".format(import_path, working_dir, res['error']))
             return False
 
-        signatures = info['signatures']
-        ptr = info['payload_size']
+        snapshot_hash = verified['hash']
+        os.unlink(import_path)
 
-        # get the hash of the file 
-        hash_hex = get_file_hash(f, hashlib.sha256, fd_len=ptr)
-        
-        # validate signatures over the hash
-        logmsg("Verify {} bytes".format(ptr))
-        key_idx = 0
-        num_match = 0
-        for next_pubkey in public_keys:
-            for sigb64 in signatures:
-                valid = verify_digest( hash_hex, keylib.ECPublicKey(next_pubkey).to_hex(), sigb64, hashfunc=hashlib.sha256 ) 
-                if valid:
-                    num_match += 1
-                    if num_match >= num_required:
-                        break
-                    
-                    logmsg("Public key {} matches {} ({})".format(next_pubkey, sigb64, hash_hex))
-                    signatures.remove(sigb64)
-                
-                else:
-                    logmsg("Public key {} does NOT match {} ({})".format(next_pubkey, sigb64, hash_hex))
+    if os.path.exists(os.path.join(working_dir, 'delta.json')):
+        logerr("{} is a delta snapshot, not a full snapshot".format(import_url))
+        return False
 
-        # enough signatures?
-        if num_match < num_required:
-            logerr("Not enough signatures match (required {}, found {})".format(num_required, num_match))
+    for delta_url in delta_urls:
+        snapshot_hash = fast_sync_import_delta(working_dir, delta_url, snapshot_hash, public_keys=public_keys, num_required=num_required, logmsg=logmsg, logerr=logerr, resumable=resumable)
+        if snapshot_hash is None:
             return False
 
-    # decompress
-    import_path = os.path.abspath(import_path)
-    res = fast_sync_snapshot_decompress(import_path, working_dir)
-    if 'error' in res:
-        logerr("Failed to decompress {} to {}: {}".format(import_path, working_dir, res['error']))
-        return False
-
     # restore from backup
     rc = blockstack_backup_restore(working_dir, None)
     if not rc:
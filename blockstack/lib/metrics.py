@@ -0,0 +1,178 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import bisect
+import threading
+
+from .config import RPC_METRICS_LATENCY_BUCKETS
+
+import virtualchain
+log = virtualchain.get_logger("blockstack-server")
+
+
+class RPCMetrics(object):
+    """
+    Per-method RPC counters: requests, errors, a latency histogram,
+    bytes in and out, and time spent opening the name database,
+    plus the number of requests in flight.
+
+    Recording a request is a few dict and list updates under a lock.
+    """
+    def __init__(self, buckets=RPC_METRICS_LATENCY_BUCKETS):
+        self.buckets = sorted(buckets)
+        self.lock = threading.Lock()
+        self.methods = {}
+        self.in_flight = 0
+        self.local = threading.local()
+
+
+    def _get_method(self, method):
+        """
+        Get (and maybe create) a method's counters.
+        Call with self.lock held.
+        """
+        counters = self.methods.get(method, None)
+        if counters is None:
+            counters = {
+                'count': 0,
+                'errors': 0,
+                'latency_buckets': [0] * (len(self.buckets) + 1),
+                'latency_sum': 0.0,
+                'bytes_in': 0,
+                'bytes_out': 0,
+                'db_open_seconds': 0.0,
+            }
+            self.methods[method] = counters
+
+        return counters
+
+
+    def begin(self):
+        """
+        Start timing a request on this thread.
+        Return the start time, to pass to end()
+        """
+        self.local.db_open_seconds = 0.0
+        with self.lock:
+            self.in_flight += 1
+
+        return time.time()
+
+
+    def note_db_open(self, duration):
+        """
+        Add time spent opening the name database to the request on this thread, if any
+        """
+        if getattr(self.local, 'db_open_seconds', None) is not None:
+            self.local.db_open_seconds += duration
+
+
+    def end(self, method, start, error=False):
+        """
+        Finish timing a request to @method that began at @start
+        """
+        latency = time.time() - start
+        db_open_seconds = self.local.db_open_seconds
+        self.local.db_open_seconds = None
+
+        with self.lock:
+            self.in_flight -= 1
+
+            counters = self._get_method(method)
+            counters['count'] += 1
+            counters['latency_sum'] += latency
+            counters['latency_buckets'][bisect.bisect_left(self.buckets, latency)] += 1
+            counters['db_open_seconds'] += db_open_seconds
+            if error:
+                counters['errors'] += 1
+
+
+    def add_bytes(self, method, bytes_in, bytes_out):
+        """
+        Count the sizes of a request to @method and its response
+        """
+        with self.lock:
+            counters = self._get_method(method)
+            counters['bytes_in'] += bytes_in
+            counters['bytes_out'] += bytes_out
+
+
+    def get_metrics(self):
+        """
+        Get a copy of the counters, as
+        {'in_flight': ..., 'buckets': [...], 'methods': {method: {'count': ..., 'errors': ..., 'latency_buckets': [...], ...}}}
+        latency_buckets[i] is the number of requests that took at most buckets[i] seconds
+        (but more than buckets[i-1]); the last entry counts the rest.
+        """
+        with self.lock:
+            methods = {}
+            for method, counters in self.methods.items():
+                methods[method] = dict(counters)
+                methods[method]['latency_buckets'] = counters['latency_buckets'][:]
+
+            return {
+                'in_flight': self.in_flight,
+                'buckets': self.buckets[:],
+                'methods': methods
+            }
+
+
+    def to_prometheus(self):
+        """
+        Render the counters in the Prometheus text exposition format
+        """
+        metrics = self.get_metrics()
+        methods = sorted(metrics['methods'].keys())
+        lines = []
+
+        def _counter(name, help_text, field):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s counter' % name)
+            for method in methods:
+                lines.append('%s{method="%s"} %s' % (name, method, metrics['methods'][method][field]))
+
+        _counter('blockstack_rpc_requests_total', 'RPC requests handled.', 'count')
+        _counter('blockstack_rpc_errors_total', 'RPC requests that failed or returned an error.', 'errors')
+        _counter('blockstack_rpc_request_bytes_total', 'Bytes received in RPC requests.', 'bytes_in')
+        _counter('blockstack_rpc_response_bytes_total', 'Bytes sent in RPC responses.', 'bytes_out')
+        _counter('blockstack_rpc_db_open_seconds_total', 'Time RPC requests spent opening the name database.', 'db_open_seconds')
+
+        lines.append('# HELP blockstack_rpc_latency_seconds RPC request latency.')
+        lines.append('# TYPE blockstack_rpc_latency_seconds histogram')
+        for method in methods:
+            counters = metrics['methods'][method]
+            total = 0
+            for i in xrange(0, len(metrics['buckets'])):
+                total += counters['latency_buckets'][i]
+                lines.append('blockstack_rpc_latency_seconds_bucket{method="%s",le="%s"} %s' % (method, metrics['buckets'][i], total))
+
+            lines.append('blockstack_rpc_latency_seconds_bucket{method="%s",le="+Inf"} %s' % (method, counters['count']))
+            lines.append('blockstack_rpc_latency_seconds_sum{method="%s"} %s' % (method, counters['latency_sum']))
+            lines.append('blockstack_rpc_latency_seconds_count{method="%s"} %s' % (method, counters['count']))
+
+        lines.append('# HELP blockstack_rpc_in_flight RPC requests being handled.')
+        lines.append('# TYPE blockstack_rpc_in_flight gauge')
+        lines.append('blockstack_rpc_in_flight %s' % metrics['in_flight'])
+
+        return '\n'.join(lines) + '\n'
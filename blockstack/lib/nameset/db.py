@@ -30,6 +30,8 @@ import sys
 import copy
 import time
 import random
+import hashlib
+import ctypes
 
 # hack around absolute paths
 curr_dir = os.path.abspath( os.path.join( os.path.dirname(__file__), ".." ) )
@@ -162,6 +164,22 @@ BLOCKSTACK_DB_SCRIPT += """
 CREATE INDEX value_hash_names_index on name_records( value_hash, name );
 """
 
+# NOTE: kept separate so it can be added to databases created before it existed (see namedb_open())
+BLOCKSTACK_DB_HISTORY_CHECKPOINTS_SCRIPT = """
+-- NOTE: history_id is a fully-qualified name.
+-- NOTE: record_data is the JSON-serialized name record as it was at the end of block_id.
+-- NOTE: num_history_rows is the number of history rows the name had at the end of block_id.
+-- NOTE: taken every NAME_HISTORY_CHECKPOINT_INTERVAL history rows, so restoring a name
+--       to a point in time only needs the history diffs since the nearest checkpoint.
+CREATE TABLE IF NOT EXISTS history_checkpoints( history_id STRING NOT NULL,
+                                                block_id INT NOT NULL,
+                                                num_history_rows INT NOT NULL,
+                                                record_data TEXT NOT NULL,
+                                                PRIMARY KEY(history_id,block_id) );
+"""
+
+BLOCKSTACK_DB_SCRIPT += BLOCKSTACK_DB_HISTORY_CHECKPOINTS_SCRIPT
+
 BLOCKSTACK_DB_SCRIPT += """
 -- turn on foreign key constraints 
 PRAGMA foreign_keys = ON;
@@ -205,15 +223,208 @@ def sqlite3_find_tool():
     return sqlite3_path
 
 
+SQLITE_OK = 0
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+SQLITE_DONE = 101
+
+SQLITE_OPEN_READONLY = 0x1
+SQLITE_OPEN_READWRITE = 0x2
+SQLITE_OPEN_CREATE = 0x4
+
+# libsqlite3, loaded on first use (False if it can't be loaded)
+LIBSQLITE3 = None
+
+
+def sqlite3_load_library():
+    """
+    Load libsqlite3, for the parts of the C API that Python 2's
+    sqlite3 module doesn't expose (i.e. the online backup API).
+
+    This must be the very same copy of sqlite that the sqlite3 module uses.
+    Two copies in one process don't share their POSIX lock bookkeeping, so
+    closing a file in one can silently drop the other's locks on the
+    chainstate db.  So we look the symbols up through the _sqlite3
+    extension module itself (which finds the libsqlite3 it was linked
+    against), and refuse to use the library if that doesn't work (e.g.
+    sqlite is statically linked into it) or if its version differs from
+    sqlite3.sqlite_version.
+
+    Return the library handle on success
+    Return None if it isn't available
+    """
+    global LIBSQLITE3
+
+    if LIBSQLITE3 is None:
+        try:
+            _sqlite3 = sys.modules.get('_sqlite3', None)
+            if _sqlite3 is None or not getattr(_sqlite3, '__file__', None):
+                raise Exception("_sqlite3 is not a shared library")
+
+            lib = ctypes.CDLL( _sqlite3.__file__ )
+
+            lib.sqlite3_libversion.argtypes = []
+            lib.sqlite3_libversion.restype = ctypes.c_char_p
+            libversion = lib.sqlite3_libversion()
+            if libversion != sqlite3.sqlite_version:
+                raise Exception("libsqlite3 version %s does not match the sqlite3 module's version %s" % (libversion, sqlite3.sqlite_version))
+
+            lib.sqlite3_open_v2.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_void_p), ctypes.c_int, ctypes.c_char_p]
+            lib.sqlite3_close.argtypes = [ctypes.c_void_p]
+            lib.sqlite3_busy_timeout.argtypes = [ctypes.c_void_p, ctypes.c_int]
+            lib.sqlite3_exec.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+            lib.sqlite3_errmsg.argtypes = [ctypes.c_void_p]
+            lib.sqlite3_errmsg.restype = ctypes.c_char_p
+            lib.sqlite3_backup_init.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_char_p]
+            lib.sqlite3_backup_init.restype = ctypes.c_void_p
+            lib.sqlite3_backup_step.argtypes = [ctypes.c_void_p, ctypes.c_int]
+            lib.sqlite3_backup_remaining.argtypes = [ctypes.c_void_p]
+            lib.sqlite3_backup_pagecount.argtypes = [ctypes.c_void_p]
+            lib.sqlite3_backup_finish.argtypes = [ctypes.c_void_p]
+
+            LIBSQLITE3 = lib
+
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to load the sqlite3 module's libsqlite3; online backups are unavailable")
+            LIBSQLITE3 = False
+
+    if LIBSQLITE3 is False:
+        return None
+
+    return LIBSQLITE3
+
+
+def sqlite3_online_backup( src_path, dest_path, pages_per_step=None, step_sleep=None, snapshot_event=None ):
+    """
+    Back up a sqlite3 database in-process with sqlite's online backup API.
+
+    The backup is taken from a read transaction that is opened before the
+    first page is copied, so it is a consistent snapshot of the database
+    as of the call.  Pages are copied @pages_per_step at a time, sleeping
+    @step_sleep seconds between steps.  In WAL mode, writers can keep
+    committing to the source while this runs.
+
+    If given, @snapshot_event is set once the snapshot is pinned (or once
+    we've failed), so a caller running this in a thread knows when it can
+    resume writing.
+
+    The backup is written to a temporary file and moved into place
+    once it is complete.
+
+    Return True on success
+    Return False on error
+    """
+    if pages_per_step is None:
+        pages_per_step = SQLITE_BACKUP_PAGES_PER_STEP
+
+    if step_sleep is None:
+        step_sleep = SQLITE_BACKUP_STEP_SLEEP
+
+    lib = sqlite3_load_library()
+    if lib is None:
+        if snapshot_event is not None:
+            snapshot_event.set()
+
+        return False
+
+    tmp_path = dest_path + ".tmp"
+    src = ctypes.c_void_p()
+    dest = ctypes.c_void_p()
+    backup = None
+    rc = None
+
+    try:
+        rc = lib.sqlite3_open_v2( src_path, ctypes.byref(src), SQLITE_OPEN_READONLY, None )
+        if rc != SQLITE_OK:
+            log.error("Failed to open {}: rc={}".format(src_path, rc))
+            return False
+
+        lib.sqlite3_busy_timeout( src, 2**30 )
+
+        # pin a read snapshot for the whole backup
+        rc = lib.sqlite3_exec( src, "BEGIN; SELECT COUNT(*) FROM sqlite_master;", None, None, None )
+        if rc != SQLITE_OK:
+            log.error("Failed to begin backup of {}: {}".format(src_path, lib.sqlite3_errmsg(src)))
+            return False
+
+        if snapshot_event is not None:
+            snapshot_event.set()
+
+        if os.path.exists( tmp_path ):
+            os.unlink( tmp_path )
+
+        rc = lib.sqlite3_open_v2( tmp_path, ctypes.byref(dest), SQLITE_OPEN_READWRITE | SQLITE_OPEN_CREATE, None )
+        if rc != SQLITE_OK:
+            log.error("Failed to open {}: rc={}".format(tmp_path, rc))
+            return False
+
+        backup = lib.sqlite3_backup_init( dest, "main", src, "main" )
+        if not backup:
+            log.error("Failed to start backup of {}: {}".format(src_path, lib.sqlite3_errmsg(dest)))
+            return False
+
+        while True:
+            rc = lib.sqlite3_backup_step( backup, pages_per_step )
+            if rc == SQLITE_DONE:
+                break
+
+            if rc not in [SQLITE_OK, SQLITE_BUSY, SQLITE_LOCKED]:
+                log.error("Backup of {} failed: rc={}".format(src_path, rc))
+                return False
+
+            log.debug("Backup of {}: {} of {} pages left".format(src_path, lib.sqlite3_backup_remaining(backup), lib.sqlite3_backup_pagecount(backup)))
+            time.sleep( step_sleep )
+
+        rc = lib.sqlite3_backup_finish( backup )
+        backup = None
+        if rc != SQLITE_OK:
+            log.error("Failed to finish backup of {}: rc={}".format(src_path, rc))
+            return False
+
+        lib.sqlite3_close( dest )
+        dest = None
+
+        os.rename( tmp_path, dest_path )
+        return True
+
+    except Exception, e:
+        log.exception(e)
+        return False
+
+    finally:
+        if snapshot_event is not None:
+            snapshot_event.set()
+
+        if backup:
+            lib.sqlite3_backup_finish( backup )
+
+        if dest:
+            lib.sqlite3_close( dest )
+
+        if src:
+            lib.sqlite3_exec( src, "COMMIT;", None, None, None )
+            lib.sqlite3_close( src )
+
+        if os.path.exists( tmp_path ):
+            os.unlink( tmp_path )
+
+
 def sqlite3_backup( src_path, dest_path ):
     """
     Back up a sqlite3 database, while ensuring
     that no ongoing queries are being executed.
 
+    Uses the online backup API in-process if libsqlite3 is available,
+    and falls back to the sqlite3 tool otherwise.
+
     Return True on success
     Return False on error.
     """
 
+    if sqlite3_load_library() is not None:
+        return sqlite3_online_backup( src_path, dest_path )
+
     # find sqlite3
     sqlite3_path = sqlite3_find_tool()
     if sqlite3_path is None:
@@ -262,6 +473,80 @@ def sqlite3_backup( src_path, dest_path ):
     return True
 
 
+def sqlite3_pragma( con, pragma ):
+    """
+    Run a PRAGMA statement and return its first row as a tuple,
+    regardless of the connection's row factory.
+    """
+    cur = con.cursor()
+    cur.row_factory = None
+    cur.execute("PRAGMA %s;" % pragma)
+    row = cur.fetchone()
+    cur.close()
+    return row
+
+
+def sqlite3_set_storage_profile( con, wal=None ):
+    """
+    Apply our storage profile to a sqlite3 connection:
+    WAL journaling, mmap'ed reads and a larger page cache.
+
+    This is also the migration path for existing databases:  the
+    journal mode is persistent, so a rollback-journal database is
+    converted to WAL (or back, if @wal is False) the first time it is
+    opened with this profile.  Databases already in the right mode
+    are left alone, so we don't need an exclusive lock on every open.
+    """
+    if wal is None:
+        wal = SQLITE_WAL
+
+    journal_mode = "wal" if wal else "delete"
+    current_mode = sqlite3_pragma( con, "journal_mode" )[0]
+
+    if str(current_mode).lower() != journal_mode:
+        log.debug("Converting sqlite3 journal mode from '%s' to '%s'" % (current_mode, journal_mode))
+        con.execute("PRAGMA journal_mode=%s;" % journal_mode).close()
+
+    if wal:
+        con.execute("PRAGMA wal_autocheckpoint=%s;" % SQLITE_WAL_AUTOCHECKPOINT).close()
+
+    con.execute("PRAGMA mmap_size=%s;" % SQLITE_MMAP_SIZE).close()
+    con.execute("PRAGMA cache_size=%s;" % SQLITE_CACHE_SIZE).close()
+    return con
+
+
+def sqlite3_wal_checkpoint( con, mode="TRUNCATE" ):
+    """
+    Fold the write-ahead log back into the database file.
+    A no-op for rollback-journal databases.
+
+    With the default TRUNCATE mode, this waits for readers of older
+    snapshots to finish and empties the log, so the database file alone
+    holds all committed state.  PASSIVE mode checkpoints what it can
+    without waiting.
+
+    Return True if the checkpoint wasn't blocked
+    Return False if it was
+    """
+    busy = sqlite3_pragma( con, "wal_checkpoint(%s)" % mode )[0]
+    return busy == 0
+
+
+def sqlite3_wal_checkpoint_path( path ):
+    """
+    Fold the write-ahead log of the database at @path (if it has one)
+    back into the database file, so the file can be copied on its own.
+
+    Return True on success
+    Return False if the checkpoint was blocked
+    """
+    con = sqlite3.connect( path, isolation_level=None, timeout=2**30 )
+    try:
+        return sqlite3_wal_checkpoint( con )
+    finally:
+        con.close()
+
+
 def namedb_create( path ):
     """
     Create a sqlite3 db at the given path.
@@ -275,6 +560,7 @@ def namedb_create( path ):
 
     lines = [l + ";" for l in BLOCKSTACK_DB_SCRIPT.split(";")]
     con = sqlite3.connect( path, isolation_level=None, timeout=2**30 )
+    sqlite3_set_storage_profile( con )
 
     for line in lines:
         con.execute(line)
@@ -293,6 +579,10 @@ def namedb_open( path ):
     """
     con = sqlite3.connect( path, isolation_level=None, timeout=2**30 )
     con.row_factory = namedb_row_factory
+    sqlite3_set_storage_profile( con )
+
+    # databases from before history checkpoints won't have the table
+    con.execute( BLOCKSTACK_DB_HISTORY_CHECKPOINTS_SCRIPT )
 
     # add user-defined functions
     con.create_function("namespace_lifetime_multiplier", 2, namedb_get_namespace_lifetime_multiplier)
@@ -300,6 +590,31 @@ def namedb_open( path ):
     return con
 
 
+def namedb_get_state_digest( path ):
+    """
+    Get a digest over the consensus-critical tables in the database
+    at the given path (name records, namespaces, preorders and history).
+    Two databases with the same digest hold the same name state.
+    Derived tables (ops hashes, history checkpoints) are not included.
+
+    Return the hex digest
+    """
+    con = namedb_open( path )
+    cur = con.cursor()
+
+    h = hashlib.sha256()
+    for table in ['name_records', 'namespaces', 'preorders', 'history']:
+        columns = [c['name'] for c in namedb_query_execute( cur, "PRAGMA table_info(%s);" % table, () )]
+        select_query = "SELECT * FROM %s ORDER BY %s;" % (table, ", ".join(columns))
+
+        h.update( table )
+        for row in namedb_query_execute( cur, select_query, () ):
+            h.update( json.dumps( row, sort_keys=True ) )
+
+    con.close()
+    return h.hexdigest()
+
+
 def namedb_row_factory( cursor, row ):
     """
     Row factor to enforce some additional types:
@@ -1447,6 +1762,88 @@ def namedb_get_num_history_rows( cur, history_id ):
     return count
 
 
+def namedb_get_history_range( cur, history_id, start_block_id, end_block_id ):
+    """
+    Get the part of a name or namespace's history that falls
+    between two block heights (inclusive).  Either bound can be None.
+    Returns a dict keyed by block heights, paired to lists of changes (see namedb_history_extract)
+    """
+    select_query = "SELECT * FROM history WHERE history_id = ?"
+    args = (history_id,)
+
+    if start_block_id is not None:
+        select_query += " AND block_id >= ?"
+        args += (start_block_id,)
+
+    if end_block_id is not None:
+        select_query += " AND block_id <= ?"
+        args += (end_block_id,)
+
+    select_query += " ORDER BY block_id, vtxindex ASC;"
+
+    history_rows = namedb_query_execute( cur, select_query, args )
+    return namedb_history_extract( history_rows )
+
+
+def namedb_history_checkpoint_save( cur, name, block_id ):
+    """
+    Materialize a name's current record as a history checkpoint for block_id,
+    if it has gained NAME_HISTORY_CHECKPOINT_INTERVAL or more history rows
+    since its last checkpoint.  Call once the block's operations are all applied.
+
+    Return True if a checkpoint was taken
+    Return False if not
+    """
+
+    num_rows = namedb_get_num_history_rows( cur, name )
+
+    select_query = "SELECT MAX(num_history_rows) FROM history_checkpoints WHERE history_id = ?;"
+    last_num_rows = namedb_select_count_rows( cur, select_query, (name,), count_column='MAX(num_history_rows)' )
+    if last_num_rows is None:
+        last_num_rows = 0
+
+    if num_rows - last_num_rows < NAME_HISTORY_CHECKPOINT_INTERVAL:
+        return False
+
+    name_rec = namedb_get_name( cur, name, block_id, include_expired=True, include_history=False )
+    if name_rec is None:
+        return False
+
+    checkpoint = {
+        'history_id': name,
+        'block_id': block_id,
+        'num_history_rows': num_rows,
+        'record_data': json.dumps( name_rec )
+    }
+
+    query, values = namedb_insert_prepare( cur, checkpoint, "history_checkpoints" )
+    namedb_query_execute( cur, query, values )
+
+    log.debug("History checkpoint for %s at %s (%s rows)" % (name, block_id, num_rows))
+    return True
+
+
+def namedb_get_history_checkpoint( cur, history_id, block_id ):
+    """
+    Get the earliest history checkpoint for a name taken at or after block_id.
+    Return the checkpoint row (with record_data decoded) on success.
+    Return None if there is none.
+    """
+    select_query = "SELECT * FROM history_checkpoints WHERE history_id = ? AND block_id >= ? ORDER BY block_id ASC LIMIT 1;"
+    rows = namedb_query_execute( cur, select_query, (history_id, block_id) )
+    row = rows.fetchone()
+    if row is None:
+        return None
+
+    checkpoint = {}
+    checkpoint.update( row )
+
+    # the record stands in for a name_records row, so its fields are str (not unicode), like the row's
+    record_data = json.loads( checkpoint['record_data'] )
+    checkpoint['record_data'] = dict( [(str(field), value) for (field, value) in record_data.items()] )
+    return checkpoint
+
+
 def namedb_get_history( cur, history_id ):
     """
     Get all of the history for a name or namespace.
@@ -1781,11 +2178,12 @@ def namedb_get_historic_names_by_address( cur, address, offset=None, count=None
         return names
 
 
-def namedb_restore_from_history( name_rec, block_id ):
+def namedb_restore_from_history( name_rec, block_id, name_history=None ):
     """
     Given a name or a namespace record, replay its
     history diffs "back in time" to a particular block
-    number.
+    number.  Use name_history instead of the record's
+    'history' if given.
 
     Return the sequence of states the name record went
     through at that block number, starting from the beginning
@@ -1796,9 +2194,65 @@ def namedb_restore_from_history( name_rec, block_id ):
     The returned records will *not* have a 'history' key.
     """
     
-    return blockstack_client.operations.nameop_restore_from_history( name_rec, name_rec['history'], block_id )
+    if name_history is None:
+        name_history = name_rec['history']
+
+    return blockstack_client.operations.nameop_restore_from_history( name_rec, name_history, block_id )
     
 
+def namedb_restore_from_checkpoint( cur, name_rec, block_id ):
+    """
+    Given a name record (without its history), replay its history
+    diffs "back in time" to a particular block number, the way
+    namedb_restore_from_history() does.
+
+    Instead of loading and replaying the entire history, start from
+    the nearest history checkpoint after block_id and only load the
+    diffs between the two.  Without a usable checkpoint, only the
+    history from block_id onwards is loaded.
+
+    NOTE: a checkpoint is the record as it was stored, so restored
+    states will not carry over stray non-record fields from history
+    snapshots taken after the checkpoint.
+
+    Return the sequence of states the name record went
+    through at that block number, starting from the beginning
+    of the block.
+
+    Return None if the record does not exist at that point in time
+    """
+
+    name = name_rec['name']
+
+    # the last block at or before block_id where this name changed;
+    # its diffs determine the sequence of states within block_id
+    select_query = "SELECT MAX(block_id) FROM history WHERE history_id = ? AND block_id <= ?;"
+    start_block_id = namedb_select_count_rows( cur, select_query, (name, block_id), count_column='MAX(block_id)' )
+
+    checkpoint = namedb_get_history_checkpoint( cur, name, block_id )
+    if checkpoint is not None:
+        # only worth it if the name changed after the checkpoint
+        select_query = "SELECT MAX(block_id) FROM history WHERE history_id = ?;"
+        last_block_id = namedb_select_count_rows( cur, select_query, (name,), count_column='MAX(block_id)' )
+        if last_block_id is None or checkpoint['block_id'] >= last_block_id:
+            checkpoint = None
+
+    if checkpoint is None:
+        name_history = namedb_get_history_range( cur, name, start_block_id, None )
+        return namedb_restore_from_history( name_rec, block_id, name_history=name_history )
+
+    name_history = namedb_get_history_range( cur, name, start_block_id, checkpoint['block_id'] )
+
+    # stand in for all later history with a snapshot of the checkpointed record.
+    # as with any history diff, 'opcode' describes the record's 'op'.
+    snapshot = checkpoint['record_data']
+    snapshot['opcode'] = op_get_opcode_name( snapshot['op'] )
+    snapshot['history_snapshot'] = True
+    name_history[ checkpoint['block_id'] + 1 ] = [snapshot]
+
+    return namedb_restore_from_history( name_rec, block_id, name_history=name_history )
+
+
 def namedb_rec_restore( db, rows, history_id_key, block_id, include_history=False ):
     """
     Restore a record to its previous states over a block.
@@ -1816,6 +2270,12 @@ def namedb_rec_restore( db, rows, history_id_key, block_id, include_history=Fals
         rec = {}
         rec.update( row )
 
+        if history_id_key == "name" and not include_history:
+            # don't need the full history
+            restored_recs = namedb_restore_from_checkpoint( db.cursor(), rec, block_id )
+            ret += restored_recs
+            continue
+
         rec_history = get_history( rec[history_id_key] )
         rec['history'] = rec_history
 
@@ -26,6 +26,7 @@ import traceback
 import keychain
 import os
 import copy
+import shutil
 import threading
 import gc
 
@@ -132,6 +133,27 @@ class BlockstackDB( virtualchain.StateEngine ):
         # map block_id --> history_id_key --> list of history ID values
         self.collisions = {}
 
+        # consensus hashes from the blocks before the one we're checking name updates at.
+        # slid forward one block at a time (see get_valid_consensus_hashes())
+        # (block_id, [(block_id - BLOCKS_CONSENSUS_HASH_IS_VALID, consensus hash), ..., (block_id - 1, consensus hash)])
+        self.consensus_hash_window = None
+
+        # reverse map from a sender's name consensus hashes to the name and consensus hash.
+        # a sender's entry is dropped whenever we commit an operation that can change what it owns.
+        # map (sender script pubkey, block_id, lastblock, valid consensus hashes) --> (set of names, hash256_trunc128(name + consensus_hash) --> (name, consensus_hash))
+        self.name_consensus_hashes = {}
+
+        # names changed in each block, to be considered for history checkpoints
+        # map block_id --> set of names
+        self.changed_names = {}
+
+        # serialized operations committed in each block, for the block's ops hash
+        # map block_id --> list of serialized ops, in commit order
+        self.committed_ops = {}
+
+        # thread copying the db for the last backup, if one is in progress
+        self.backup_thread = None
+
 
     @classmethod 
     def borrow_readwrite_instance( cls, db_path, block_number, expected_snapshots={} ):
@@ -231,6 +253,8 @@ class BlockstackDB( virtualchain.StateEngine ):
         """
         Close the db and release memory
         """
+        self.wait_for_backup()
+
         if self.db is not None:
             self.db.commit()
             self.db.close()
@@ -238,6 +262,91 @@ class BlockstackDB( virtualchain.StateEngine ):
 
         return
     
+    def make_backups( self, block_id, working_dir=None ):
+        """
+        If it's time to back up our state (see virtualchain), do so.
+        The snapshots and lastblock files are small, so they get copied directly.
+        The db is backed up online:  we pin a read snapshot of it before returning,
+        and copy it page by page in a background thread so the next block can
+        be processed in the meantime.
+        Abort on failure.
+        """
+        if self.backup_frequency is None or (block_id % self.backup_frequency) != 0:
+            return
+
+        if sqlite3_load_library() is None:
+            return super( BlockstackDB, self ).make_backups( block_id, working_dir=working_dir )
+
+        # one backup at a time
+        self.wait_for_backup()
+
+        backup_dir = os.path.join( virtualchain.config.get_working_dir(impl=self.impl, working_dir=working_dir), "backups" )
+        if not os.path.exists(backup_dir):
+            try:
+                os.makedirs(backup_dir)
+            except Exception, e:
+                log.exception(e)
+                log.error("FATAL: failed to make backup directory '%s'" % backup_dir)
+                os.abort()
+
+        for p in [virtualchain.config.get_snapshots_filename(impl=self.impl, working_dir=working_dir), virtualchain.config.get_lastblock_filename(impl=self.impl, working_dir=working_dir)]:
+            if os.path.exists(p):
+                backup_path = os.path.join( backup_dir, os.path.basename(p) + (".bak.%s" % (block_id - 1)) )
+                if os.path.exists(backup_path):
+                    log.error("Will not overwrite '%s'" % backup_path)
+                    continue
+
+                try:
+                    shutil.copy( p, backup_path )
+                except Exception, e:
+                    log.exception(e)
+                    log.error("FATAL: failed to back up '%s'" % p)
+                    os.abort()
+
+        db_path = virtualchain.config.get_db_filename(impl=self.impl, working_dir=working_dir)
+        db_backup_path = os.path.join( backup_dir, os.path.basename(db_path) + (".bak.%s" % (block_id - 1)) )
+        if os.path.exists(db_backup_path):
+            log.error("Will not overwrite '%s'" % db_backup_path)
+            return
+
+        def _backup_db( snapshot_pinned ):
+            log.debug("Back up '%s' to '%s'" % (db_path, db_backup_path))
+            if not sqlite3_online_backup( db_path, db_backup_path, snapshot_event=snapshot_pinned ):
+                log.error("FATAL: failed to back up '%s'" % db_path)
+                os.abort()
+
+        snapshot_pinned = threading.Event()
+        self.backup_thread = threading.Thread( target=_backup_db, args=(snapshot_pinned,) )
+        self.backup_thread.start()
+        snapshot_pinned.wait()
+
+
+    def wait_for_backup( self ):
+        """
+        Wait for an in-progress db backup to finish, if there is one.
+        """
+        if self.backup_thread is not None:
+            self.backup_thread.join()
+            self.backup_thread = None
+
+
+    @classmethod
+    def backup_restore( cls, block_id, impl, working_dir=None ):
+        """
+        Restore our state from a backup (see virtualchain).
+        Also remove the db's write-ahead log, if there is one:
+        it belongs to the db we're replacing, and sqlite would
+        otherwise replay it on top of the restored db.
+        """
+        db_path = virtualchain.config.get_db_filename(impl=impl, working_dir=working_dir)
+        for p in [db_path + "-wal", db_path + "-shm"]:
+            if os.path.exists(p):
+                log.debug("Removing '%s'" % p)
+                os.unlink(p)
+
+        return super( BlockstackDB, cls ).backup_restore( block_id, impl, working_dir=working_dir )
+
+
     def export_db( self, path ):
         """
         Copy the database to the given location.
@@ -378,9 +487,20 @@ class BlockstackDB( virtualchain.StateEngine ):
         Commits all data.
         """
 
+        if block_id in self.changed_names:
+            cur = self.db.cursor()
+            for name in sorted(self.changed_names[block_id]):
+                namedb_history_checkpoint_save( cur, name, block_id )
+
+            del self.changed_names[block_id]
+
         self.db.commit()
         self.clear_collisions( block_id )
 
+        # fold this block into the database file without waiting on readers
+        # (such as an online backup in progress)
+        sqlite3_wal_checkpoint( self.db, mode="PASSIVE" )
+
     
     def log_accept( self, block_id, vtxindex, op, op_data ):
         """
@@ -654,7 +774,7 @@ class BlockstackDB( virtualchain.StateEngine ):
 
 
     @autofill( "opcode" )
-    def get_name( self, name, lastblock=None, include_expired=False ):
+    def get_name( self, name, lastblock=None, include_expired=False, include_history=True ):
         """
         Given a name, return the latest version and history of
         the metadata gleaned from the blockchain.
@@ -668,7 +788,7 @@ class BlockstackDB( virtualchain.StateEngine ):
             lastblock = self.lastblock
 
         cur = self.db.cursor()
-        name_rec = namedb_get_name( cur, name, lastblock, include_expired=include_expired )
+        name_rec = namedb_get_name( cur, name, lastblock, include_expired=include_expired, include_history=include_history )
         return name_rec
 
 
@@ -678,7 +798,7 @@ class BlockstackDB( virtualchain.StateEngine ):
         at a particular block number.
         """
 
-        name_rec = self.get_name( name, include_expired=include_expired )
+        name_rec = self.get_name( name, include_expired=include_expired, include_history=False )
 
         # trivial reject
         if name_rec is None:
@@ -689,7 +809,8 @@ class BlockstackDB( virtualchain.StateEngine ):
             # didn't exist then
             return None
 
-        historical_recs = namedb_restore_from_history( name_rec, block_number )
+        cur = self.db.cursor()
+        historical_recs = namedb_restore_from_checkpoint( cur, name_rec, block_number )
         return historical_recs
 
 
@@ -950,32 +1071,90 @@ class BlockstackDB( virtualchain.StateEngine ):
         Return (None, None) if not found.
         """
 
-        cur = self.db.cursor()
-        names = namedb_get_names_by_sender( cur, sender_script_pubkey, self.lastblock )
-        
-        if names is None:
-            log.error("Sender script '%s' owns no names" % sender_script_pubkey )
-            return (None, None)
+        possible_consensus_hashes = self.get_valid_consensus_hashes( block_id )
+        cache_key = (sender_script_pubkey, block_id, self.lastblock, tuple(possible_consensus_hashes))
 
-        possible_consensus_hashes = []
-        for i in xrange( block_id - virtualchain.config.BLOCKS_CONSENSUS_HASH_IS_VALID, block_id+1 ):
-            consensus_hash = self.get_consensus_at( i )
-            if consensus_hash is not None and consensus_hash not in possible_consensus_hashes:
-                possible_consensus_hashes.append( str(consensus_hash) )
-    
-        
-        for name in names:
-            for consensus_hash in possible_consensus_hashes:
+        name_consensus_hashes = None
+        if self.name_consensus_hashes.has_key( cache_key ):
+            _, name_consensus_hashes = self.name_consensus_hashes[cache_key]
+
+        else:
 
-                # what would have been the name/consensus_hash?
-                test_name_consensus_hash = hash256_trunc128( str(name) + consensus_hash )
-                if test_name_consensus_hash == name_consensus_hash:
-                    # found!
-                    return name, consensus_hash
+            cur = self.db.cursor()
+            names = namedb_get_names_by_sender( cur, sender_script_pubkey, self.lastblock )
+            
+            if names is None:
+                log.error("Sender script '%s' owns no names" % sender_script_pubkey )
+                return (None, None)
+
+            # what would have been the name/consensus_hash?
+            name_consensus_hashes = {}
+            for name in names:
+                for consensus_hash in possible_consensus_hashes:
+                    test_name_consensus_hash = hash256_trunc128( str(name) + consensus_hash )
+                    if not name_consensus_hashes.has_key( test_name_consensus_hash ):
+                        name_consensus_hashes[test_name_consensus_hash] = (name, consensus_hash)
+
+            # only keep this block's
+            for key in self.name_consensus_hashes.keys():
+                if key[1] != block_id:
+                    del self.name_consensus_hashes[key]
+
+            self.name_consensus_hashes[cache_key] = (set(names), name_consensus_hashes)
+
+        if name_consensus_hashes.has_key( name_consensus_hash ):
+            # found!
+            return name_consensus_hashes[name_consensus_hash]
 
         return None, None
 
 
+    def forget_name_consensus_hashes( self, name, sender_scripts ):
+        """
+        Drop the cached name consensus hashes (see get_name_from_name_consensus_hash())
+        of the senders whose names may have changed:  the given sender scripts,
+        and whoever owned @name.
+        """
+        for key in self.name_consensus_hashes.keys():
+            names, _ = self.name_consensus_hashes[key]
+            if key[0] in sender_scripts or name in names:
+                del self.name_consensus_hashes[key]
+
+
+    def get_valid_consensus_hashes( self, block_id ):
+        """
+        Get the list of consensus hashes that are valid for
+        operations at block_id, in block order and without duplicates.
+
+        The hashes for the blocks before block_id are kept in a window that
+        slides forward as block_id advances, so we only look up one or two
+        consensus hashes per block instead of the whole window.
+        """
+
+        window_start = block_id - virtualchain.config.BLOCKS_CONSENSUS_HASH_IS_VALID
+
+        if self.consensus_hash_window is not None and self.consensus_hash_window[0] == block_id:
+            prior_consensus_hashes = self.consensus_hash_window[1]
+
+        elif self.consensus_hash_window is not None and self.consensus_hash_window[0] == block_id - 1:
+            # slide forward
+            prior_consensus_hashes = filter( lambda (i, ch): i >= window_start, self.consensus_hash_window[1] )
+            prior_consensus_hashes.append( (block_id - 1, self.get_consensus_at( block_id - 1 )) )
+
+        else:
+            prior_consensus_hashes = [(i, self.get_consensus_at( i )) for i in xrange( window_start, block_id )]
+
+        self.consensus_hash_window = (block_id, prior_consensus_hashes)
+
+        # this block's consensus hash won't be known until it's processed, so always look it up
+        possible_consensus_hashes = []
+        for consensus_hash in [ch for (i, ch) in prior_consensus_hashes] + [self.get_consensus_at( block_id )]:
+            if consensus_hash is not None and str(consensus_hash) not in possible_consensus_hashes:
+                possible_consensus_hashes.append( str(consensus_hash) )
+
+        return possible_consensus_hashes
+
+
     @autofill( "opcode" )
     def get_name_preorder( self, name, sender_script_pubkey, register_addr, include_failed=False ):
         """
@@ -1488,6 +1667,22 @@ class BlockstackDB( virtualchain.StateEngine ):
         if type(op_seq) != list:
             op_seq = [op_seq]
 
+        # ownership may have changed
+        if opcode in OPCODE_NAME_STATE_CREATIONS + OPCODE_NAME_STATE_TRANSITIONS and opcode != "NAME_UPDATE":
+            # the old and new owners' names
+            sender_scripts = [nameop.get('sender', None), nameop.get('recipient', None)] + [op.get('sender', None) for op in op_seq]
+            self.forget_name_consensus_hashes( nameop.get('name', None), filter(lambda s: s is not None, sender_scripts) )
+
+        elif opcode in OPCODE_NAMESPACE_STATE_CREATIONS + OPCODE_NAMESPACE_STATE_TRANSITIONS:
+            # can change which names are live
+            self.name_consensus_hashes = {}
+
+        if history_id is not None and history_id_key == "name" and len(op_seq) > 0:
+            if not self.changed_names.has_key( current_block_number ):
+                self.changed_names[current_block_number] = set([])
+
+            self.changed_names[current_block_number].add( history_id )
+
         # make sure all the mutate fields necessary to derive
         # the next consensus hash are in place.
         for i in xrange(0, len(op_seq)):
@@ -1508,6 +1703,7 @@ class BlockstackDB( virtualchain.StateEngine ):
                 del op_seq[i]['history']
 
             self.log_commit( current_block_number, op_seq[i]['vtxindex'], op_seq[i]['op'], opcode, op_seq[i] )
+            self.put_committed_op( current_block_number, op_seq[i] )
     
         return op_seq
 
@@ -1858,10 +2054,41 @@ class BlockstackDB( virtualchain.StateEngine ):
         return ops_hash
 
 
+    def put_committed_op( self, block_id, op ):
+        """
+        Remember the serialized form of an operation we just committed,
+        so we can calculate the block's ops hash without re-reading the
+        block's operations back out of the db.
+        """
+        serialized_op = virtualchain.StateEngine.serialize_op( str(op['op'][0]), op, BlockstackDB.make_opfields(), verbose=False )
+        if not self.committed_ops.has_key( block_id ):
+            self.committed_ops[block_id] = []
+
+        self.committed_ops[block_id].append( serialized_op )
+
+
+    def get_committed_ops_hash( self, block_id ):
+        """
+        Get the hash of the sequence of operations committed in a particular block.
+        This is the same sequence virtualchain feeds into the block's consensus hash.
+        Return the hash on success.
+        """
+        serialized_ops = self.committed_ops.get( block_id, [] )
+        return virtualchain.StateEngine.make_ops_snapshot( serialized_ops )
+
+
+    def clear_committed_ops( self, block_id ):
+        """
+        Clear out all committed operations for a given block number
+        """
+        if block_id in self.committed_ops:
+            del self.committed_ops[block_id]
+
+
     def store_block_ops_hash( self, block_id, ops_hash ):
         """
         Store the operation hash for a block ID, calculated from
-        @calculate_block_ops_hash.
+        @get_committed_ops_hash or @calculate_block_ops_hash.
         """
         cur = self.db.cursor()
         namedb_set_block_ops_hash( cur, block_id, ops_hash )
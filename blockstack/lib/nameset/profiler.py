@@ -0,0 +1,175 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import functools
+import threading
+import collections
+
+from ..config import INDEXER_STATS_WINDOW
+
+import virtualchain
+log = virtualchain.get_logger("blockstack-server")
+
+
+class IndexerProfiler(object):
+    """
+    Timing counters for the indexer's hooks and per-opcode work.
+    For each hook or opcode, keep the number of calls and the total time spent,
+    as well as the durations of the last @window calls (for percentiles).
+    Gauges hold the last value set for things like queue depths.
+
+    If a trace path is given, append one CSV row per (block, counter)
+    with that block's call count and total time, for offline analysis.
+    """
+    def __init__(self, window=INDEXER_STATS_WINDOW, trace_path=None):
+        self.window = window
+        self.trace_path = trace_path
+        self.lock = threading.Lock()
+        self.counters = {
+            'hooks': {},
+            'opcodes': {},
+        }
+        self.block_counters = {}
+        self.gauges = {}
+        self.last_block = None
+
+
+    def record(self, kind, name, duration):
+        """
+        Record one call of the hook or opcode @name, which took @duration seconds
+        """
+        with self.lock:
+            counter = self.counters[kind].get(name, None)
+            if counter is None:
+                counter = {'count': 0, 'total': 0.0, 'samples': collections.deque(maxlen=self.window)}
+                self.counters[kind][name] = counter
+
+            counter['count'] += 1
+            counter['total'] += duration
+            counter['samples'].append(duration)
+
+            if self.trace_path is not None:
+                block_counter = self.block_counters.setdefault((kind, name), [0, 0.0])
+                block_counter[0] += 1
+                block_counter[1] += duration
+
+
+    def set_gauge(self, name, value):
+        """
+        Set the gauge @name to @value
+        """
+        with self.lock:
+            self.gauges[name] = value
+
+
+    def timed(self, kind, name):
+        """
+        Make a context manager that records the time spent in its body
+        """
+        return _IndexerTimer(self, kind, name)
+
+
+    def hook(self, name):
+        """
+        Decorator that records the time spent in each call of a hook
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kw):
+                with self.timed('hooks', name):
+                    return func(*args, **kw)
+
+            return wrapper
+
+        return decorator
+
+
+    def end_block(self, block_id):
+        """
+        Mark the end of a block's processing.
+        Append its rows to the trace, if we're keeping one.
+        """
+        with self.lock:
+            self.last_block = block_id
+            if self.trace_path is None or len(self.block_counters) == 0:
+                return
+
+            block_counters = self.block_counters
+            self.block_counters = {}
+
+        try:
+            with open(self.trace_path, 'a') as f:
+                for (kind, name) in sorted(block_counters.keys()):
+                    count, total = block_counters[(kind, name)]
+                    f.write("%s,%s,%s,%s,%.6f\n" % (block_id, kind, name, count, total))
+
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to write indexer trace to %s" % self.trace_path)
+
+
+    def get_stats(self):
+        """
+        Get the counters, as
+        {'last_block': ..., 'window': ..., 'hooks': {name: {'count': ..., 'total': ..., 'p50': ..., 'p99': ...}}, 'opcodes': {...}, 'gauges': {name: value}}
+        Times are in seconds; p50 and p99 are over the last @window calls.
+        """
+        ret = {
+            'last_block': self.last_block,
+            'window': self.window,
+        }
+
+        with self.lock:
+            ret['gauges'] = dict(self.gauges)
+            for kind in self.counters.keys():
+                ret[kind] = {}
+                for name, counter in self.counters[kind].items():
+                    samples = sorted(counter['samples'])
+                    ret[kind][name] = {
+                        'count': counter['count'],
+                        'total': counter['total'],
+                        'p50': samples[len(samples) / 2] if len(samples) > 0 else 0.0,
+                        'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))] if len(samples) > 0 else 0.0,
+                    }
+
+        return ret
+
+
+class _IndexerTimer(object):
+    """
+    Context manager that records the time spent in its body with an IndexerProfiler
+    """
+    def __init__(self, profiler, kind, name):
+        self.profiler = profiler
+        self.kind = kind
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.profiler.record(self.kind, self.name, time.time() - self.start)
+        return False
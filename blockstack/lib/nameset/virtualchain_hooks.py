@@ -25,8 +25,12 @@
 
 import os
 import gc
+import time
+import threading
+import Queue
 
 from .namedb import *
+from .profiler import IndexerProfiler
 
 from ..config import *
 from ..scripts import *
@@ -34,6 +38,12 @@ from ..scripts import *
 import virtualchain
 log = virtualchain.get_logger("blockstack-log")
 
+# downstream Atlas sync stage (see sync_blockchain())
+atlas_sync_stage = None
+
+# per-hook and per-opcode timings (see get_indexer_stats())
+indexer_profiler = IndexerProfiler(trace_path=INDEXER_TRACE_PATH)
+
 def get_virtual_chain_name():
    """
    (required by virtualchain state engine)
@@ -192,6 +202,7 @@ def get_db_state( disposition=DISPOSITION_RO ):
    return db_inst
 
 
+@indexer_profiler.hook('db_parse')
 def db_parse( block_id, txid, vtxindex, op, data, senders, inputs, outputs, fee, db_state=None ):
    """
    (required by virtualchain state engine)
@@ -224,7 +235,8 @@ def db_parse( block_id, txid, vtxindex, op, data, senders, inputs, outputs, fee,
    # get the data
    op = None
    try:
-       op = op_extract( opcode, data, senders, inputs, outputs, block_id, vtxindex, txid )
+       with indexer_profiler.timed('opcodes', '%s:parse' % opcode):
+           op = op_extract( opcode, data, senders, inputs, outputs, block_id, vtxindex, txid )
    except Exception, e:
        log.exception(e)
        op = None
@@ -258,6 +270,7 @@ def check_mutate_fields( op, op_data ):
     return True
 
 
+@indexer_profiler.hook('db_scan_block')
 def db_scan_block( block_id, op_list, db_state=None ):
     """
     (required by virtualchain state engine)
@@ -296,13 +309,15 @@ def db_scan_block( block_id, op_list, db_state=None ):
 
 
     # get collision information for this block
-    collisions = db_state.find_collisions( checked_ops )
+    with indexer_profiler.timed('hooks', 'find_collisions'):
+        collisions = db_state.find_collisions( checked_ops )
 
     # reject all operations that will collide 
     db_state.put_collisions( block_id, collisions )
     
 
 
+@indexer_profiler.hook('db_check')
 def db_check( block_id, new_ops, op, op_data, txid, vtxindex, checked_ops, db_state=None ):
     """
     (required by virtualchain state engine)
@@ -335,7 +350,9 @@ def db_check( block_id, new_ops, op, op_data, txid, vtxindex, checked_ops, db_st
             os.abort()
 
         log.debug("CHECK %s at (%s, %s)" % (opcode, block_id, vtxindex))
-        rc = op_check( db_state, op_data, block_id, checked_ops )
+        with indexer_profiler.timed('opcodes', '%s:check' % opcode):
+            rc = op_check( db_state, op_data, block_id, checked_ops )
+
         if rc:
 
             try:
@@ -358,6 +375,7 @@ def db_check( block_id, new_ops, op, op_data, txid, vtxindex, checked_ops, db_st
     return accept
    
    
+@indexer_profiler.hook('db_commit')
 def db_commit( block_id, op, op_data, txid, vtxindex, db_state=None ):
     """
     (required by virtualchain state engine)
@@ -398,13 +416,19 @@ def db_commit( block_id, op, op_data, txid, vtxindex, db_state=None ):
                 return []
 
             else:
+                t = time.time()
                 op_seq = db_state.commit_operation( op_data, block_id )
+                duration = time.time() - t
+
+                indexer_profiler.record('hooks', 'commit_operation', duration)
+                indexer_profiler.record('opcodes', '%s:commit' % opcode, duration)
                 return op_seq
 
         else:
             # final commit for this block 
             try:
-                db_state.commit_finished( block_id )
+                with indexer_profiler.timed('hooks', 'commit_finished'):
+                    db_state.commit_finished( block_id )
             except Exception, e:
                 log.exception(e)
                 log.error("FATAL: failed to commit at block %s" % block_id )
@@ -418,6 +442,7 @@ def db_commit( block_id, op, op_data, txid, vtxindex, db_state=None ):
 
 
 
+@indexer_profiler.hook('db_save')
 def db_save( block_id, consensus_hash, pending_ops, filename, db_state=None ):
    """
    (required by virtualchain state engine)
@@ -434,9 +459,17 @@ def db_save( block_id, consensus_hash, pending_ops, filename, db_state=None ):
    if db_state is not None:
     
         try:
-            # pre-calculate the ops hash for SNV
-            ops_hash = BlockstackDB.calculate_block_ops_hash( db_state, block_id )
+            # pre-calculate the ops hash for SNV, from the ops we committed in this block
+            with indexer_profiler.timed('hooks', 'block_ops_hash'):
+                ops_hash = db_state.get_committed_ops_hash( block_id )
+
+            if os.environ.get("BLOCKSTACK_TEST", None) == "1":
+                # make sure it's the hash SNV clients get from the block's restored records
+                db_ops_hash = BlockstackDB.calculate_block_ops_hash( db_state, block_id )
+                assert ops_hash == db_ops_hash, "BUG: ops hash mismatch at %s: committed ops give %s, db records give %s" % (block_id, ops_hash, db_ops_hash)
+
             db_state.store_block_ops_hash( block_id, ops_hash )
+            db_state.clear_committed_ops( block_id )
         except Exception, e:
             log.exception(e)
             log.error("FATAL: failed to calculate ops hash at block %s" % block_id )
@@ -444,7 +477,8 @@ def db_save( block_id, consensus_hash, pending_ops, filename, db_state=None ):
 
         try:
             # flush the database
-            db_state.commit_finished( block_id )
+            with indexer_profiler.timed('hooks', 'save_commit_finished'):
+                db_state.commit_finished( block_id )
         except Exception, e:
             log.exception(e)
             log.error("FATAL: failed to commit at block %s" % block_id )
@@ -457,9 +491,19 @@ def db_save( block_id, consensus_hash, pending_ops, filename, db_state=None ):
                 log.debug("Synchronize Atlas DB for %s" % (block_id-1))
                 zonefile_dir = blockstack_opts.get('zonefiles', get_zonefile_dir())
 
-                gc.collect()
-                atlasdb_sync_zonefiles( db_state, block_id-1, zonefile_dir=zonefile_dir )
-                gc.collect()
+                if atlas_sync_stage is not None:
+                    # hand off to the downstream stage.
+                    # the name db handle can't leave this thread, so read the zonefile info here.
+                    for block_height in xrange(block_id-1, db_state.lastblock+1):
+                        zonefile_info = db_state.get_atlas_zonefile_info_at( block_height )
+                        atlas_sync_stage.enqueue( block_height, zonefile_info, zonefile_dir )
+
+                else:
+                    gc.collect()
+                    with indexer_profiler.timed('hooks', 'atlasdb_sync_zonefiles'):
+                        atlasdb_sync_zonefiles( db_state, block_id-1, zonefile_dir=zonefile_dir )
+
+                    gc.collect()
 
         except Exception, e:
             log.exception(e)
@@ -482,6 +526,8 @@ def db_continue( block_id, consensus_hash ):
     exit if the user has so requested.
     """
 
+    indexer_profiler.end_block( block_id )
+
     # every so often, clean up
     if (block_id % 20) == 0:
         log.debug("Pre-emptive garbage collection at %s" % block_id)
@@ -490,6 +536,77 @@ def db_continue( block_id, consensus_hash ):
     return is_running() or os.environ.get("BLOCKSTACK_TEST") == "1"
 
 
+class AtlasSyncStage( threading.Thread ):
+    """
+    Downstream indexing stage that feeds each block's zonefile info
+    into the Atlas DB, in block order.
+
+    db_save() runs on the state engine's (single) writer thread and only
+    reads the zonefile info for the block; the Atlas DB writes and
+    zonefile directory checks happen here, overlapping with the writer's
+    fetching and processing of the next block.  The queue is bounded, so
+    the writer can get at most @depth blocks ahead of this stage.
+    """
+    def __init__(self, depth=INDEXER_PIPELINE_DEPTH, atlasdb_path=None):
+        super(AtlasSyncStage, self).__init__()
+        self.daemon = True
+        self.queue = Queue.Queue(maxsize=depth)
+        self.atlasdb_path = atlasdb_path
+
+
+    def enqueue(self, block_height, zonefile_info, zonefile_dir):
+        """
+        Submit a block's zonefile info.
+        Blocks if the stage is @depth blocks behind; the time the
+        writer spends blocked here is recorded as 'atlas_sync_stall'.
+        """
+        with indexer_profiler.timed('hooks', 'atlas_sync_stall'):
+            self.queue.put( (block_height, zonefile_info, zonefile_dir) )
+
+        indexer_profiler.set_gauge('atlas_sync_queue_depth', self.queue.qsize())
+
+
+    def run(self):
+        """
+        Drain the queue until we get the stop sentinel
+        """
+        from ..atlas import AtlasDBOpen, atlasdb_queue_zonefile_info, atlasdb_cache_zonefile_info
+
+        while True:
+            work = self.queue.get()
+            if work is None:
+                break
+
+            block_height, zonefile_info, zonefile_dir = work
+            indexer_profiler.set_gauge('atlas_sync_queue_depth', self.queue.qsize())
+            try:
+                with indexer_profiler.timed('hooks', 'atlasdb_sync_zonefiles'):
+                    with AtlasDBOpen(path=self.atlasdb_path) as dbcon:
+                        atlasdb_queue_zonefile_info( dbcon, block_height, zonefile_info, zonefile_dir=zonefile_dir )
+                        atlasdb_cache_zonefile_info( con=dbcon )
+
+            except Exception, e:
+                log.exception(e)
+                log.error("FATAL: failed to update Atlas db at %s" % block_height )
+                os.abort()
+
+
+    def drain(self):
+        """
+        Process everything queued so far, and stop.
+        """
+        self.queue.put(None)
+        self.join()
+
+
+def get_indexer_stats():
+    """
+    Get the indexer's per-hook and per-opcode timings.
+    See IndexerProfiler.get_stats()
+    """
+    return indexer_profiler.get_stats()
+
+
 def sync_blockchain( bt_opts, last_block, expected_snapshots={}, **virtualchain_args ):
     """
     synchronize state with the blockchain.
@@ -497,6 +614,7 @@ def sync_blockchain( bt_opts, last_block, expected_snapshots={}, **virtualchain_
     Return False if we're supposed to stop indexing
     Abort on error
     """
+    global atlas_sync_stage
  
     # make this usable even if we haven't explicitly configured virtualchain 
     impl = sys.modules[__name__]
@@ -510,7 +628,20 @@ def sync_blockchain( bt_opts, last_block, expected_snapshots={}, **virtualchain_
     # NOTE: this is the only place where a read-write handle should be created,
     # since this is the only place where the db should be modified.
     new_db = BlockstackDB.borrow_readwrite_instance( db_filename, last_block, expected_snapshots=expected_snapshots )
-    rc = virtualchain.sync_virtualchain( bt_opts, last_block, new_db, expected_snapshots=expected_snapshots, **virtualchain_args )
+
+    # run Atlas sync behind the state engine, so the writer only does consensus-critical work
+    blockstack_opts = get_blockstack_opts()
+    if blockstack_opts.get('atlas', False):
+        atlas_sync_stage = AtlasSyncStage()
+        atlas_sync_stage.start()
+
+    try:
+        rc = virtualchain.sync_virtualchain( bt_opts, last_block, new_db, expected_snapshots=expected_snapshots, **virtualchain_args )
+    finally:
+        if atlas_sync_stage is not None:
+            atlas_sync_stage.drain()
+            atlas_sync_stage = None
+
     BlockstackDB.release_readwrite_instance( new_db, last_block )
 
     return rc
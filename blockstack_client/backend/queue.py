@@ -30,7 +30,8 @@ import random
 import threading
 
 from ..constants import (
-    DEFAULT_QUEUE_PATH, PREORDER_MAX_CONFIRMATIONS, CONFIG_PATH, MAX_TX_CONFIRMATIONS)
+    DEFAULT_QUEUE_PATH, PREORDER_MAX_CONFIRMATIONS, CONFIG_PATH, MAX_TX_CONFIRMATIONS,
+    QUEUE_SQLITE_WAL, QUEUE_SQLITE_MMAP_SIZE, QUEUE_SQLITE_CACHE_SIZE)
 from .blockchain import get_block_height, get_tx_confirmations, is_tx_accepted
 
 QUEUE_SQL = """
@@ -68,6 +69,7 @@ def queuedb_create( path ):
     lines = [l + ";" for l in QUEUE_SQL.split(";")]
     lines += [l + ";" for l in ERROR_SQL.split(";")]
     con = sqlite3.connect( path, isolation_level=None )
+    queuedb_set_storage_profile( con )
 
     for line in lines:
         con.execute(line)
@@ -90,6 +92,23 @@ def conditionally_create_err_table( sql_conn ):
     sql_conn.execute(lines[0])
 
 
+def queuedb_set_storage_profile( con ):
+    """
+    Apply our storage profile to a queue DB connection:  WAL journaling,
+    so readers don't block behind writers, plus mmap'ed reads and a page cache.
+    The journal mode is persistent, so existing queue DBs are converted
+    (or converted back, if WAL is disabled) the first time they're opened here.
+    """
+    journal_mode = 'wal' if QUEUE_SQLITE_WAL else 'delete'
+    current_mode = con.execute("PRAGMA journal_mode;").fetchone()[0]
+    if str(current_mode).lower() != journal_mode:
+        con.execute("PRAGMA journal_mode={};".format(journal_mode))
+
+    con.execute("PRAGMA mmap_size={};".format(QUEUE_SQLITE_MMAP_SIZE))
+    con.execute("PRAGMA cache_size={};".format(QUEUE_SQLITE_CACHE_SIZE))
+    return con
+
+
 def queuedb_open( path ):
     """
     Open a connection to our database 
@@ -100,6 +119,7 @@ def queuedb_open( path ):
             con = queuedb_create( path )
         else:
             con = sqlite3.connect( path, isolation_level=None )
+            queuedb_set_storage_profile( con )
             conditionally_create_err_table( con )
             con.row_factory = queuedb_row_factory
         return con
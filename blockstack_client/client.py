@@ -25,7 +25,7 @@ import sys
 import os
 import importlib
 
-from proxy import BlockstackRPCClient, set_default_proxy, get_default_proxy
+from proxy import BlockstackRPCClient, BlockstackMultiRPCClient, set_default_proxy, get_default_proxy, parse_server_list
 from virtualchain import SPVClient
 import storage
 
@@ -93,7 +93,14 @@ def session(conf=None, config_path=CONFIG_PATH, server_host=None, server_port=No
 
     # create proxy
     log.debug('Connect to {}://{}:{}'.format(server_protocol, server_host, server_port))
-    proxy = BlockstackRPCClient(server_host, server_port, protocol = server_protocol)
+    if conf is not None and conf.get('servers'):
+        # route over these servers as well
+        servers = [(server_host, server_port, server_protocol)] + parse_server_list(conf['servers'], server_protocol)
+        log.debug('Also connect to {}'.format(', '.join(['{}://{}:{}'.format(p, h, pt) for (h, pt, p) in servers[1:]])))
+        proxy = BlockstackMultiRPCClient(servers)
+
+    else:
+        proxy = BlockstackRPCClient(server_host, server_port, protocol = server_protocol)
 
     # load all storage drivers
     loaded = []
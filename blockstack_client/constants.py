@@ -302,6 +302,41 @@ if os.environ.get("BLOCKSTACK_TEST_MAX_RPC_LEN"):
     MAX_RPC_LEN = int(os.environ.get("BLOCKSTACK_TEST_MAX_RPC_LEN"))
     print("Overriding MAX_RPC_LEN to {}".format(MAX_RPC_LEN))
 
+# if set, only check the structure of the server's replies to paginated calls
+# (not every item in them), since we trust the server we're talking to.
+BLOCKSTACK_TRUSTED_SERVER = (os.environ.get('BLOCKSTACK_TRUSTED_SERVER', '0') == '1')
+
+JSON_VALIDATOR_CACHE_SIZE = 256     # number of compiled response schemas to keep
+PAGINATE_WORKERS = 4                # number of pages of a paginated call to fetch at once
+
+# routing calls over several blockstack servers (see BlockstackMultiRPCClient)
+RPC_EWMA_ALPHA = 0.2                # weight of the newest sample in a server's latency and error averages
+RPC_ERROR_HALF_LIFE = 60            # seconds for a server's error average to halve while it isn't used
+RPC_HEDGE_WINDOW = 100              # number of recent latencies to compute a server's p95 over
+RPC_HEDGE_MIN_SAMPLES = 10          # use RPC_HEDGE_DEFAULT_DELAY until a server has this many samples
+RPC_HEDGE_DEFAULT_DELAY = 1.0       # seconds before hedging a read to a server we know little about
+RPC_HEDGE_MIN_DELAY = 0.05          # never hedge sooner than this many seconds
+
+# cache of name, namespace, consensus and getinfo replies, dropped on each new block (see RPCCache)
+BLOCKSTACK_RPC_CACHE = (os.environ.get('BLOCKSTACK_RPC_CACHE', '0') == '1')
+RPC_CACHE_PROBE_TTL = 2.0           # seconds between getinfo() calls to check for a new block
+RPC_CACHE_MAX_ENTRIES = 10000       # number of replies to keep, over all servers
+
+# data.DataCache tables (inode headers, directories and datastore records)
+DATA_CACHE_SHARDS = 8               # number of separately-locked shards per table
+DATA_CACHE_MAX_BYTES = 64 * 1024 * 1024     # most bytes of (JSON-serialized) entries per table
+
+# shared worker pool behind utils.ScatterGather
+SCATTER_GATHER_WORKERS = 16         # most scatter/gather tasks to run at once, over all callers
+SCATTER_GATHER_SLOW_TASK = 10.0     # warn about tasks that take longer than this many seconds
+
+# if set, storage.get_mutable_data() and storage.get_immutable_data() query their
+# drivers concurrently and take the first reply that verifies (see race_storage_reads)
+BLOCKSTACK_STORAGE_RACE_READS = (os.environ.get('BLOCKSTACK_STORAGE_RACE_READS', '0') == '1')
+STORAGE_RACE_STAGGER = 0.0          # seconds to wait before also asking the next driver in priority order
+STORAGE_WRITE_TIMEOUT = 600         # most seconds to wait for one driver to store or delete data (see replicate_storage_writes)
+SIGNATURE_CACHE_SIZE = 16384        # number of (data, public key, signature) triples known to verify (see storage.verify_raw_data_cached)
+
 CONFIG_FILENAME = 'client.ini'
 WALLET_FILENAME = 'wallet.json'
 
@@ -327,6 +362,10 @@ else:
 
 WALLET_PATH = os.path.join(CONFIG_DIR, 'wallet.json')
 DEFAULT_QUEUE_PATH = os.path.join(CONFIG_DIR, 'queues.db')
+SNV_CACHE_PATH = os.path.join(CONFIG_DIR, 'snv.db')     # consensus and nameops hashes already verified by SNV
+QUEUE_SQLITE_WAL = (os.environ.get('BLOCKSTACK_SQLITE_WAL', '1') == '1')    # WAL journaling for the queue DB
+QUEUE_SQLITE_MMAP_SIZE = 16 * 1024 * 1024    # bytes
+QUEUE_SQLITE_CACHE_SIZE = -4 * 1024          # negative means KiB, per sqlite
 
 METADATA_DIRNAME = 'metadata'
 
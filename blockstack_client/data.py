@@ -39,6 +39,8 @@ import jsontokens
 import collections
 import threading
 import functools
+import heapq
+import itertools
 import copy
 import jsonschema
 from jsonschema import ValidationError
@@ -64,7 +66,7 @@ from .config import get_config, get_local_device_id
 from .constants import (
     BLOCKSTACK_TEST, BLOCKSTACK_DEBUG, DATASTORE_SIGNING_KEY_INDEX,
     BLOCKSTACK_STORAGE_PROTO_VERSION, DEFAULT_DEVICE_ID,
-    CONFIG_PATH
+    CONFIG_PATH, DATA_CACHE_SHARDS, DATA_CACHE_MAX_BYTES
 )
 
 from .schemas import (
@@ -82,124 +84,176 @@ MUTABLE_DATA_VERSION_LOCK = threading.Lock()
 # not defined on all platforms (looking at you, Mac OS)
 EREMOTEIO = 121
 
-class DataCache(object):
+class DataCacheTable(object):
     """
-    Write-coherent inode and datastore data cache
+    One of DataCache's tables:  a map with a deadline for each entry,
+    bounded by number of entries and by size, that evicts the least-recently-used
+    entry when full.  Keys are spread over @num_shards shards, each with its
+    own lock, LRU list (an OrderedDict), and heap of deadlines, so every
+    operation is O(1) (or O(log n) for the heap) and only locks one shard.
     """
-    def __init__(self, max_headers=1024, max_dirs=1024, max_datastores=1024):
-        self.header_cache = {}
-        self.header_deadlines = {}
-        self.max_headers = max_headers
-
-        self.dir_cache = {}
-        self.dir_deadlines = {}
-        self.dir_children = {}
-        self.max_dirs = max_dirs
+    def __init__(self, max_entries, max_bytes=DATA_CACHE_MAX_BYTES, num_shards=DATA_CACHE_SHARDS):
+        self.num_shards = max(1, min(num_shards, max_entries))
 
-        self.datastore_cache = {}
-        self.datastore_deadlines = {}
-        self.max_datastores = max_datastores
+        # per-shard limits
+        self.max_entries = max(1, (max_entries + self.num_shards - 1) / self.num_shards)
+        self.max_bytes = max(1, max_bytes / self.num_shards)
 
-        self.header_lock = threading.Lock()
-        self.dir_lock = threading.Lock()
-        self.datastore_lock = threading.Lock()
+        self.entry_ids = itertools.count()
+        self.shards = [self._make_shard() for i in xrange(0, self.num_shards)]
 
 
-    def _put_data(self, lock, cache_obj, deadline_tbl, max_obj, key, value, ttl):
+    def _make_shard(self):
         """
-        Save data to either the header cache or dir cache
+        Make an empty shard
         """
-        deadline = int(time.time() + ttl)
+        return {
+            'lock': threading.Lock(),
+            'entries': collections.OrderedDict(),     # key --> {'value': ..., 'deadline': ..., 'size': ..., 'id': ...}, least-recently-used first
+            'deadlines': [],                          # heap of (deadline, entry ID, key), with stale items left in until they're popped
+            'num_bytes': 0,
+        }
 
-        if lock:
-            lock.acquire()
 
-        cache_obj[key] = {'value': value, 'deadline': deadline}
+    def _shard(self, key):
+        return self.shards[hash(key) % self.num_shards]
 
-        if not deadline_tbl.has_key(deadline):
-            deadline_tbl[deadline] = []
 
-        deadline_tbl[deadline].append(key)
+    @classmethod
+    def _sizeof(cls, value):
+        """
+        How many bytes does a value take up?
+        """
+        try:
+            return len(json.dumps(value))
+        except (TypeError, ValueError):
+            return sys.getsizeof(value)
 
-        if len(cache_obj.keys()) > max_obj:
-            # evict stuff
-            to_evict = []
-            evict_count = 0
-            for deadline in sorted(deadline_tbl.keys()):
-                to_evict.append(deadline)
-                evict_count += len(deadline_tbl[deadline])
-                if len(cache_obj.keys()) - evict_count <= max_obj:
-                    break
 
-            for deadline in to_evict:
-                evicted_keys = deadline_tbl[deadline]
-                del deadline_tbl[deadline]
+    def _remove(self, shard, key):
+        """
+        Remove an entry from a shard.
+        Call with the shard's lock held.
+        """
+        entry = shard['entries'].pop(key, None)
+        if entry is not None:
+            shard['num_bytes'] -= entry['size']
 
-                for key in evicted_keys:
-                    del cache_obj[key]
 
-        if lock:
-            lock.release()
+    def _expire(self, shard, now):
+        """
+        Remove the shard's expired entries.
+        Call with the shard's lock held.
+        """
+        deadlines = shard['deadlines']
+        while len(deadlines) > 0 and deadlines[0][0] <= now:
+            _, entry_id, key = heapq.heappop(deadlines)
+            entry = shard['entries'].get(key, None)
+            if entry is not None and entry['id'] == entry_id:
+                self._remove(shard, key)
+
+        if len(deadlines) > 2 * len(shard['entries']) + 16:
+            # mostly items for entries that are gone or were replaced
+            shard['deadlines'] = [(e['deadline'], e['id'], k) for (k, e) in shard['entries'].items()]
+            heapq.heapify(shard['deadlines'])
 
 
-    def _get_data(self, lock, cache_obj, deadline_tbl, key):
+    def put(self, key, value, ttl):
         """
-        Get data from either the header cache or dir cache
+        Cache a value for @ttl seconds
         """
-        
-        with lock:
-            if not cache_obj.has_key(key):
-                return None, None
+        entry = {
+            'value': value,
+            'deadline': int(time.time() + ttl),
+            'size': self._sizeof(value),
+            'id': next(self.entry_ids),
+        }
+
+        shard = self._shard(key)
+        with shard['lock']:
+            self._expire(shard, time.time())
+            self._remove(shard, key)
 
-            res = cache_obj[key]['value']
-            res_deadline = cache_obj[key]['deadline']
+            shard['entries'][key] = entry
+            shard['num_bytes'] += entry['size']
+            heapq.heappush(shard['deadlines'], (entry['deadline'], entry['id'], key))
 
-            if time.time() < res_deadline:
-                # fresh 
-                return res, res_deadline
+            # evict least-recently-used entries (but keep the one we just added)
+            while len(shard['entries']) > self.max_entries or (shard['num_bytes'] > self.max_bytes and len(shard['entries']) > 1):
+                _, evicted = shard['entries'].popitem(last=False)
+                shard['num_bytes'] -= evicted['size']
 
-            # expired
-            to_evict = []
-            for deadline in sorted(deadline_tbl.keys()):
-                if time.time() <= deadline:
-                    break
-                
-                to_evict.append(deadline)
 
-            for deadline in to_evict:
-                evicted_keys = deadline_tbl[deadline]
-                del deadline_tbl[deadline]
+    def get(self, key):
+        """
+        Get a cached value and its deadline
+        Return (value, deadline) if fresh
+        Return (None, None) if stale or absent
+        """
+        shard = self._shard(key)
+        with shard['lock']:
+            entry = shard['entries'].get(key, None)
+            if entry is None:
+                return None, None
 
-                for key in evicted_keys:
-                    del cache_obj[key]
+            now = time.time()
+            if now < entry['deadline']:
+                # fresh; mark as most-recently-used
+                del shard['entries'][key]
+                shard['entries'][key] = entry
+                return entry['value'], entry['deadline']
 
+            self._expire(shard, now)
             return None, None
 
 
-    def _evict_data(self, lock, cache_obj, deadline_tbl, key):
+    def evict(self, key):
         """
-        Remove data from a cache
+        Remove a cached value
         """
-        with lock:
-            if not cache_obj.has_key(key):
-                return 
+        shard = self._shard(key)
+        with shard['lock']:
+            self._remove(shard, key)
 
-            res = cache_obj[key]['value']
-            res_deadline = cache_obj[key]['deadline']
 
-            del cache_obj[key]
+    def clear(self):
+        """
+        Remove all cached values
+        """
+        for shard in self.shards:
+            with shard['lock']:
+                shard['entries'] = collections.OrderedDict()
+                shard['deadlines'] = []
+                shard['num_bytes'] = 0
 
-            if not deadline_tbl.has_key(res_deadline):
-                return
 
-            if key not in deadline_tbl[res_deadline]:
-                return 
+    def get_stats(self):
+        """
+        Get the number of entries and their total size
+        Return {'entries': ..., 'bytes': ...}
+        """
+        ret = {'entries': 0, 'bytes': 0}
+        for shard in self.shards:
+            with shard['lock']:
+                ret['entries'] += len(shard['entries'])
+                ret['bytes'] += shard['num_bytes']
 
-            deadline_tbl[res_deadline].remove(key)
-            if len(deadline_tbl[res_deadline]) == 0:
-                del deadline_tbl[res_deadline]
+        return ret
 
-            return
+
+class DataCache(object):
+    """
+    Write-coherent inode and datastore data cache
+    """
+    def __init__(self, max_headers=1024, max_dirs=1024, max_datastores=1024, max_bytes=DATA_CACHE_MAX_BYTES, num_shards=DATA_CACHE_SHARDS):
+        self.header_cache = DataCacheTable(max_headers, max_bytes=max_bytes, num_shards=num_shards)
+        self.dir_cache = DataCacheTable(max_dirs, max_bytes=max_bytes, num_shards=num_shards)
+        self.datastore_cache = DataCacheTable(max_datastores, max_bytes=max_bytes, num_shards=num_shards)
+
+        # child inode UUID --> parent directory UUID, and back
+        self.dir_children = {}
+        self.dir_members = {}
+        self.dir_lock = threading.Lock()
 
 
     def put_inode_header(self, datastore_id, inode_header, ttl):
@@ -207,7 +261,7 @@ class DataCache(object):
         Save an inode header
         """
         log.debug("Cache inode header {}".format(inode_header['uuid']))
-        return self._put_data(self.header_lock, self.header_cache, self.header_deadlines, self.max_headers, '{}:{}'.format(datastore_id, inode_header['uuid']), inode_header, ttl)
+        return self.header_cache.put('{}:{}'.format(datastore_id, inode_header['uuid']), inode_header, ttl)
 
 
     def put_inode_directory(self, datastore_id, inode_directory, ttl):
@@ -216,16 +270,18 @@ class DataCache(object):
         """
         log.debug("Cache directory {} (version {})".format(inode_directory['uuid'], inode_directory['version']))
 
-        with self.dir_lock:
-            # stash directory
-            self._put_data(None, self.dir_cache, self.dir_deadlines, self.max_dirs, '{}:{}'.format(datastore_id, inode_directory['uuid']), inode_directory, ttl)
+        # stash directory
+        self.dir_cache.put('{}:{}'.format(datastore_id, inode_directory['uuid']), inode_directory, ttl)
 
+        with self.dir_lock:
             # also, map children UUID back to the parent directory so we can properly evict the parent directory
             # when we add/remove/update a file.
+            members = self.dir_members.setdefault(inode_directory['uuid'], set())
             for child_name in inode_directory['idata']['children'].keys():
                 child_idata = inode_directory['idata']['children'][child_name]
                 child_uuid = child_idata['uuid']
                 self.dir_children[child_uuid] = inode_directory['uuid']
+                members.add(child_uuid)
 
 
     def put_datastore_record(self, datastore_id, datastore_rec, ttl):
@@ -233,7 +289,7 @@ class DataCache(object):
         Save a datastore record
         """
         log.debug("Cache datastore {}".format(datastore_id))
-        return self._put_data(self.datastore_lock, self.datastore_cache, self.datastore_deadlines, self.max_datastores, datastore_id, datastore_rec, ttl)
+        return self.datastore_cache.put(datastore_id, datastore_rec, ttl)
 
 
     def get_inode_header(self, datastore_id, inode_uuid):
@@ -241,7 +297,7 @@ class DataCache(object):
         Get a cached inode header
         Return None if stale or absent
         """
-        res, deadline = self._get_data(self.header_lock, self.header_cache, self.header_deadlines, '{}:{}'.format(datastore_id, inode_uuid))
+        res, deadline = self.header_cache.get('{}:{}'.format(datastore_id, inode_uuid))
         if res:
             log.debug("Cache HIT header {}, expires at {} (now={})".format(inode_uuid, deadline, time.time()))
 
@@ -256,7 +312,7 @@ class DataCache(object):
         Get a cached directory header
         Return None if stale or absent
         """
-        res, deadline = self._get_data(self.dir_lock, self.dir_cache, self.dir_deadlines, '{}:{}'.format(datastore_id, inode_uuid))
+        res, deadline = self.dir_cache.get('{}:{}'.format(datastore_id, inode_uuid))
         if res:
             log.debug("Cache HIT directory {}, version {}, expires at {} (now={})".format(inode_uuid, res['version'], deadline, time.time()))
 
@@ -271,7 +327,7 @@ class DataCache(object):
         Get a cached datastore record
         Return None if stale or absent
         """
-        res, deadline = self._get_data(self.datastore_lock, self.datastore_cache, self.datastore_deadlines, datastore_id)
+        res, deadline = self.datastore_cache.get(datastore_id)
         if res:
             log.debug("Cache HIT datastore {}, expires at {} (now={})".format(datastore_id, deadline, time.time()))
         
@@ -285,21 +341,21 @@ class DataCache(object):
         """
         Evict a given inode header
         """
-        return self._evict_data(self.header_lock, self.header_cache, self.header_deadlines, '{}:{}'.format(datastore_id, inode_uuid))
+        return self.header_cache.evict('{}:{}'.format(datastore_id, inode_uuid))
 
 
     def evict_inode_directory(self, datastore_id, inode_uuid):
         """
         Evict a given directory
         """
-        return self._evict_data(self.dir_lock, self.dir_cache, self.dir_deadlines, '{}:{}'.format(datastore_id, inode_uuid))
+        return self.dir_cache.evict('{}:{}'.format(datastore_id, inode_uuid))
 
 
     def evict_datastore_record(self, datastore_id):
         """
         Evict a datastore record
         """
-        return self._evict_data(self.datastore_lock, self.datastore_cache, self.datastore_deadlines, datastore_id)
+        return self.datastore_cache.evict(datastore_id)
 
 
     def evict_inode(self, datastore_id, inode_uuid):
@@ -318,30 +374,34 @@ class DataCache(object):
             self.evict_inode_header(datastore_id, parent_uuid)
             self.evict_inode_directory(datastore_id, parent_uuid)
 
-            to_remove = []
-            for (cuuid, duuid) in self.dir_children.items():
-                if duuid == inode_uuid:
-                    to_remove.append(cuuid)
-
-            for cuuid in to_remove:
-                del self.dir_children[cuuid]
+        with self.dir_lock:
+            for cuuid in self.dir_members.pop(inode_uuid, []):
+                if self.dir_children.get(cuuid, None) == inode_uuid:
+                    del self.dir_children[cuuid]
 
     
     def evict_all(self):
         """
         Clear the entire cache
         """
-        with self.header_lock:
-            self.header_cache = {}
-            self.header_deadlines = {}
+        self.header_cache.clear()
+        self.dir_cache.clear()
+        self.datastore_cache.clear()
 
         with self.dir_lock:
-            self.dir_cache = {}
-            self.dir_deadlines = {}
+            self.dir_children = {}
+            self.dir_members = {}
+
 
-        with self.datastore_lock:
-            self.datastore_cache = {}
-            self.datastore_deadliens = {}
+    def get_stats(self):
+        """
+        Get the number of entries and bytes in each table
+        """
+        return {
+            'headers': self.header_cache.get_stats(),
+            'dirs': self.dir_cache.get_stats(),
+            'datastores': self.datastore_cache.get_stats(),
+        }
 
 
 GLOBAL_CACHE = DataCache()
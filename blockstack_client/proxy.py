@@ -29,17 +29,29 @@ import traceback
 import os
 import random
 import re
+import threading
+import Queue
+import time
+import socket
+import errno
+import collections
+import urlparse
+import copy
 from xmlrpclib import ServerProxy, Transport
 from defusedxml import xmlrpc
 import httplib
 import base64
-import jsonschema
 from jsonschema.exceptions import ValidationError
+from jsonschema.validators import validator_for
 from utils import url_to_host_port
 
 from .constants import (
     MAX_RPC_LEN, CONFIG_PATH, BLOCKSTACK_TEST, DEFAULT_TIMEOUT,
-    BLOCKSTACK_DEBUG, NAME_REVOKE
+    BLOCKSTACK_DEBUG, NAME_REVOKE, BLOCKSTACK_TRUSTED_SERVER,
+    JSON_VALIDATOR_CACHE_SIZE, PAGINATE_WORKERS, RPC_EWMA_ALPHA,
+    RPC_ERROR_HALF_LIFE, RPC_HEDGE_WINDOW, RPC_HEDGE_MIN_SAMPLES,
+    RPC_HEDGE_DEFAULT_DELAY, RPC_HEDGE_MIN_DELAY, BLOCKSTACK_RPC_CACHE,
+    RPC_CACHE_PROBE_TTL, RPC_CACHE_MAX_ENTRIES
 )
 
 # prevent the usual XML attacks
@@ -149,7 +161,8 @@ class BlockstackRPCClient(object):
     """
 
     def __init__(self, server, port, max_rpc_len=MAX_RPC_LEN,
-                 timeout=DEFAULT_TIMEOUT, debug_timeline=False, protocol=None, **kw):
+                 timeout=DEFAULT_TIMEOUT, debug_timeline=False, protocol=None,
+                 trusted=BLOCKSTACK_TRUSTED_SERVER, **kw):
 
         if protocol is None:
             log.warn("RPC constructor called without a protocol, defaulting " +
@@ -159,7 +172,10 @@ class BlockstackRPCClient(object):
         self.srv = TimeoutServerProxy(self.url, protocol, timeout=timeout, allow_none=True)
         self.server = server
         self.port = port
+        self.protocol = protocol
+        self.timeout = timeout
         self.debug_timeline = debug_timeline
+        self.trusted = trusted
 
     def log_debug_timeline(self, event, key, r=-1):
         # random ID to match in logs
@@ -199,6 +215,265 @@ class BlockstackRPCClient(object):
             return inner
 
 
+class BlockstackMultiRPCClient(object):
+    """
+    RPC client for a set of blockstack servers.
+    Can be used wherever a BlockstackRPCClient can.
+
+    Keeps an exponentially-weighted moving average of each server's
+    latency and error rate, and sends each call to the healthiest server.
+    If the call fails, it is retried on the next-healthiest server.
+
+    Reads (get*() and ping()) are hedged: if the server doesn't reply
+    within its recent p95 latency, the call is sent to the next server as
+    well, and whichever replies first wins.  Other calls are only retried
+    elsewhere if the server couldn't be reached at all.
+
+    Unlike BlockstackRPCClient, this can be shared between threads.
+    """
+
+    def __init__(self, servers, timeout=DEFAULT_TIMEOUT, debug_timeline=False,
+                 trusted=BLOCKSTACK_TRUSTED_SERVER, hedge=True):
+        """
+        @servers is a list of (host, port, protocol)
+        """
+        assert len(servers) > 0, 'No servers given'
+
+        self.timeout = timeout
+        self.debug_timeline = debug_timeline
+        self.trusted = trusted
+        self.hedge = hedge
+        self.lock = threading.Lock()
+
+        self.servers = []
+        for (host, port, protocol) in servers:
+            self.servers.append({
+                'server': host,
+                'port': port,
+                'protocol': protocol,
+                'latency': 0.0,
+                'errors': 0.0,
+                'last_error': 0,
+                'samples': collections.deque(maxlen=RPC_HEDGE_WINDOW),
+                'clients': [],
+            })
+
+        # the first server, for code that expects a single one
+        self.server = self.servers[0]['server']
+        self.port = self.servers[0]['port']
+        self.protocol = self.servers[0]['protocol']
+
+    def server_health(self):
+        """
+        Get each server's routing state.
+        Returns a list of {'server': ..., 'port': ..., 'protocol': ..., 'latency': ..., 'errors': ..., 'p95': ...}
+        """
+        now = time.time()
+        ret = []
+        with self.lock:
+            for srv in self.servers:
+                ret.append({
+                    'server': srv['server'],
+                    'port': srv['port'],
+                    'protocol': srv['protocol'],
+                    'latency': srv['latency'],
+                    'errors': self._errors(srv, now),
+                    'p95': self._p95(srv),
+                })
+
+        return ret
+
+    def _errors(self, srv, now):
+        """
+        Get a server's error average, decayed by the time since its last error
+        so servers that failed a while ago get tried again.
+        Call with self.lock held.
+        """
+        return srv['errors'] * (0.5 ** ((now - srv['last_error']) / float(RPC_ERROR_HALF_LIFE)))
+
+    def _p95(self, srv):
+        """
+        Get a server's p95 latency, or None if we don't have enough samples.
+        Call with self.lock held.
+        """
+        if len(srv['samples']) < RPC_HEDGE_MIN_SAMPLES:
+            return None
+
+        samples = sorted(srv['samples'])
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def _rank(self):
+        """
+        Order the servers from healthiest to least healthy.
+        An error costs as much as a timeout.
+        Returns the list of server indexes
+        """
+        now = time.time()
+        with self.lock:
+            scores = [(srv['latency'] + self._errors(srv, now) * self.timeout, i) for (i, srv) in enumerate(self.servers)]
+
+        return [i for (score, i) in sorted(scores)]
+
+    def _hedge_delay(self, srv_idx):
+        """
+        How long to wait for a server to reply before hedging
+        """
+        with self.lock:
+            p95 = self._p95(self.servers[srv_idx])
+
+        if p95 is None:
+            return RPC_HEDGE_DEFAULT_DELAY
+
+        return max(RPC_HEDGE_MIN_DELAY, p95)
+
+    def _record(self, srv_idx, latency, error):
+        """
+        Update a server's latency and error averages
+        """
+        with self.lock:
+            srv = self.servers[srv_idx]
+            if error:
+                srv['errors'] = RPC_EWMA_ALPHA + (1 - RPC_EWMA_ALPHA) * self._errors(srv, time.time())
+                srv['last_error'] = time.time()
+
+            else:
+                srv['errors'] = (1 - RPC_EWMA_ALPHA) * srv['errors']
+                srv['latency'] = RPC_EWMA_ALPHA * latency + (1 - RPC_EWMA_ALPHA) * srv['latency'] if len(srv['samples']) > 0 else latency
+                srv['samples'].append(latency)
+
+    def _get_client(self, srv_idx):
+        """
+        Take an idle BlockstackRPCClient for a server, or make one
+        """
+        with self.lock:
+            srv = self.servers[srv_idx]
+            if len(srv['clients']) > 0:
+                return srv['clients'].pop()
+
+        return BlockstackRPCClient(srv['server'], srv['port'], timeout=self.timeout,
+                                   debug_timeline=self.debug_timeline, protocol=srv['protocol'], trusted=self.trusted)
+
+    def _put_client(self, srv_idx, client):
+        """
+        Give back a BlockstackRPCClient taken with _get_client()
+        """
+        with self.lock:
+            self.servers[srv_idx]['clients'].append(client)
+
+    def _run(self, srv_idx, key, args, kw, results):
+        """
+        Run a call on a server, and put (srv_idx, error, result) to @results
+        """
+        client = self._get_client(srv_idx)
+        start = time.time()
+        try:
+            res = getattr(client, key)(*args, **kw)
+            self._record(srv_idx, time.time() - start, False)
+            results.put((srv_idx, None, res))
+
+        except Exception as e:
+            if BLOCKSTACK_DEBUG:
+                log.exception(e)
+
+            srv = self.servers[srv_idx]
+            log.warning('RPC {}() to {}://{}:{} failed: {}'.format(key, srv['protocol'], srv['server'], srv['port'], e))
+            self._record(srv_idx, time.time() - start, True)
+            results.put((srv_idx, e, None))
+
+        finally:
+            self._put_client(srv_idx, client)
+
+    def _call(self, key, args, kw):
+        """
+        Run a call on the best server, hedging and failing over as needed.
+        Returns the first server's reply
+        Raises the last server's exception if they all fail
+        """
+        is_read = key.startswith('get') or key == 'ping'
+        order = self._rank()
+        results = Queue.Queue()
+        pending = 0
+        next_srv = 0
+        hedged = False
+        last_error = None
+
+        def _launch():
+            thr = threading.Thread(target=self._run, args=(order[next_srv], key, args, kw, results))
+            thr.daemon = True
+            thr.start()
+
+        _launch()
+        next_srv += 1
+        pending += 1
+
+        while True:
+            hedge_delay = None
+            if self.hedge and is_read and not hedged and next_srv < len(order):
+                hedge_delay = self._hedge_delay(order[next_srv - 1])
+
+            try:
+                srv_idx, error, res = results.get(True, hedge_delay if hedge_delay is not None else self.timeout * len(order))
+            except Queue.Empty:
+                if hedge_delay is None:
+                    raise socket.timeout('No server replied to {}()'.format(key))
+
+                # slow server; ask the next one too
+                _launch()
+                next_srv += 1
+                pending += 1
+                hedged = True
+                continue
+
+            pending -= 1
+            if error is None:
+                return res
+
+            last_error = error
+            can_retry = is_read or (isinstance(error, socket.error) and error.errno in [errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH])
+            if next_srv < len(order) and can_retry:
+                # fail over
+                _launch()
+                next_srv += 1
+                pending += 1
+
+            elif pending == 0:
+                raise last_error
+
+    def __getattr__(self, key):
+        try:
+            return object.__getattr__(self, key)
+        except AttributeError:
+            def inner(*args, **kw):
+                return self._call(key, args, kw)
+
+            return inner
+
+
+def parse_server_list(servers, default_protocol='https'):
+    """
+    Parse a comma-separated list of blockstack servers,
+    given as [protocol://]host:port.
+    Returns a list of (host, port, protocol)
+    Raises ValueError on invalid list
+    """
+    ret = []
+    for server in servers.split(','):
+        server = server.strip()
+        if len(server) == 0:
+            continue
+
+        if '://' not in server:
+            server = '{}://{}'.format(default_protocol, server)
+
+        urlinfo = urlparse.urlparse(server)
+        if urlinfo.scheme not in ['http', 'https'] or urlinfo.hostname is None or urlinfo.port is None:
+            raise ValueError('Invalid server "{}"'.format(server))
+
+        ret.append( (urlinfo.hostname, urlinfo.port, urlinfo.scheme) )
+
+    return ret
+
+
 def get_default_proxy(config_path=CONFIG_PATH):
     """
     Get the default API proxy to blockstack.
@@ -245,6 +520,26 @@ def set_default_proxy(proxy):
     default_proxy = proxy
 
 
+def proxy_clone(proxy):
+    """
+    Make another proxy to the same server as the given one,
+    so another thread can use it (proxies can't be shared
+    between threads, since they keep their connections open).
+
+    Returns the new proxy on success
+    Returns None if we don't know how to copy this kind of proxy
+    """
+    if isinstance(proxy, BlockstackMultiRPCClient):
+        # can be shared
+        return proxy
+
+    if not isinstance(proxy, BlockstackRPCClient):
+        return None
+
+    return BlockstackRPCClient(proxy.server, proxy.port, timeout=proxy.timeout, debug_timeline=proxy.debug_timeline,
+                               protocol=proxy.protocol, trusted=proxy.trusted)
+
+
 def json_is_error(resp):
     """
     Is the given response object
@@ -278,6 +573,42 @@ def json_is_exception(resp):
     return True
 
 
+# compiled validators, keyed by their schemas' JSON
+json_validators = {}
+
+
+def json_validator(schema):
+    """
+    Get a validator for the given schema.
+    The schema is checked and compiled only the first time
+    we see it; after that, the validator is reused.
+
+    Returns the validator on success
+    Raises SchemaError on invalid schema
+    """
+    try:
+        key = json.dumps(schema, sort_keys=True)
+    except (TypeError, ValueError):
+        # can't cache this one
+        key = None
+
+    validator = json_validators.get(key, None) if key is not None else None
+    if validator is not None:
+        return validator
+
+    validator_cls = validator_for(schema)
+    validator_cls.check_schema(schema)
+    validator = validator_cls(schema)
+
+    if key is not None:
+        if len(json_validators) >= JSON_VALIDATOR_CACHE_SIZE:
+            json_validators.clear()
+
+        json_validators[key] = validator
+
+    return validator
+
+
 def json_validate(schema, resp):
     """
     Validate an RPC response.
@@ -285,31 +616,46 @@ def json_validate(schema, resp):
     form of the given schema, or it must
     take the form of {'error': ...}
 
+    @schema is either a schema or a validator
+    from json_validator().
+
     Returns the resp on success
     Returns {'error': ...} on validation error
     """
-    error_schema = {
-        'type': 'object',
-        'properties': {
-            'error': {
-                'type': 'string'
-            }
-        },
-        'required': [
-            'error'
-        ]
-    }
-
     # is this an error?
-    try:
-        jsonschema.validate(resp, error_schema)
-    except ValidationError:
-        # not an error.
-        jsonschema.validate(resp, schema)
+    if isinstance(resp, dict) and isinstance(resp.get('error', None), (str, unicode)):
+        return resp
 
+    # not an error.
+    validator = json_validator(schema) if isinstance(schema, dict) else schema
+    validator.validate(resp)
     return resp
 
 
+def proxy_is_trusted(proxy):
+    """
+    Do we trust the server behind this proxy?
+    (only BlockstackRPCClient and BlockstackMultiRPCClient proxies
+    can be trusted; others turn unknown attributes into RPC calls)
+    """
+    return isinstance(proxy, (BlockstackRPCClient, BlockstackMultiRPCClient)) and proxy.trusted
+
+
+def json_validate_page(validator, structure_validator, resp, proxy=None):
+    """
+    Validate a page of a paginated RPC response.
+    If we trust the server behind @proxy, then
+    only check the page's structure with @structure_validator.
+
+    Returns the resp on success
+    Returns {'error': ...} on validation error
+    """
+    if proxy_is_trusted(proxy):
+        return json_validate(structure_validator, resp)
+
+    return json_validate(validator, resp)
+
+
 def json_traceback(error_msg=None):
     """
     Generate a stack trace as a JSON-formatted error message.
@@ -370,6 +716,441 @@ def json_response_schema( expected_object_schema ):
     return schema
 
 
+def json_page_schema( field_name, item_schema ):
+    """
+    Make a schema for a server response with a page of items
+    in the list @field_name.
+    """
+    return json_response_schema({
+        'type': 'object',
+        'properties': {
+            field_name: {
+                'type': 'array',
+                'items': item_schema,
+            },
+        },
+        'required': [
+            field_name,
+        ],
+    })
+
+
+# Precompiled validators for the paginated calls.
+# The *_STRUCTURE validators only check the shape of the page,
+# and are used instead when we trust the server.
+COUNT_VALIDATOR = json_validator(json_response_schema({
+    'type': 'object',
+    'properties': {
+        'count': {
+            'type': 'integer',
+            'minimum': 0,
+        },
+    },
+    'required': [
+        'count',
+    ],
+}))
+
+NAMES_PAGE_VALIDATOR = json_validator(json_page_schema('names', {
+    'type': 'string',
+    'uniqueItems': True
+}))
+
+NAMES_PAGE_VALIDATOR_STRUCTURE = json_validator(json_page_schema('names', {}))
+
+HISTORIC_NAMES_PAGE_VALIDATOR = json_validator(json_page_schema('names', {
+    'type': 'object',
+    'properties': {
+        'name': {
+            'type': 'string',
+            'pattern': OP_NAME_OR_SUBDOMAIN_PATTERN,
+        },
+        'block_id': {
+            'type': 'integer',
+            'minimum': 0,
+        },
+        'vtxindex': {
+            'type': 'integer',
+            'minimum': 0,
+        },
+    },
+    'required': [
+        'name',
+        'block_id',
+        'vtxindex',
+    ],
+}))
+
+HISTORIC_NAMES_PAGE_VALIDATOR_STRUCTURE = json_validator(json_page_schema('names', {}))
+
+OP_HISTORY_ROWS_PAGE_VALIDATOR = json_validator(json_page_schema('history_rows', {
+    'type': 'object',
+    'properties': {
+        'txid': {
+            'type': 'string',
+            'pattern': OP_TXID_PATTERN,
+        },
+        'history_id': {
+            'type': 'string',
+        },
+        'block_id': {
+            'type': 'integer',
+            'minimum': 0,
+        },
+        'vtxindex': {
+            'type': 'integer',
+            'minimum': 0,
+        },
+        'op': {
+            'type': 'string',
+            'pattern': OP_CODE_PATTERN,
+        },
+        'history_data': {
+            'type': 'string'
+        },
+    },
+    'required': [
+        'txid',
+        'history_id',
+        'block_id',
+        'vtxindex',
+        'op',
+        'history_data',
+    ],
+}))
+
+OP_HISTORY_ROWS_PAGE_VALIDATOR_STRUCTURE = json_validator(json_page_schema('history_rows', {}))
+
+NAMEOPS_PAGE_VALIDATOR = json_validator(json_page_schema('nameops', {
+    'type': 'object',
+    'properties': OP_HISTORY_SCHEMA['properties'],
+    'required': [
+        'op',
+        'opcode',
+        'txid',
+        'vtxindex',
+    ]
+}))
+
+NAMEOPS_PAGE_VALIDATOR_STRUCTURE = json_validator(json_page_schema('nameops', {}))
+
+ZONEFILES_BY_BLOCK_PAGE_VALIDATOR = json_validator({
+    'type' : 'object',
+    'properties' : {
+        'lastblock' : {'type' : 'integer'},
+        'zonefile_info' : {
+            'type' : 'array',
+            'items' : {
+                'type' : 'object',
+                'properties' : {
+                    'name' : {'type' : 'string'},
+                    'zonefile_hash' : { 'type' : 'string',
+                                        'pattern' : OP_ZONEFILE_HASH_PATTERN },
+                    'txid' : {'type' : 'string',
+                              'pattern' : OP_TXID_PATTERN},
+                    'block_height' : {'type' : 'integer'}
+                },
+                'required' : [ 'zonefile_hash', 'txid', 'block_height' ]
+            }
+        }
+    },
+    'required' : ['lastblock', 'zonefile_info']
+})
+
+ZONEFILES_BY_BLOCK_PAGE_VALIDATOR_STRUCTURE = json_validator({
+    'type' : 'object',
+    'properties' : {
+        'lastblock' : {'type' : 'integer'},
+        'zonefile_info' : {'type' : 'array'}
+    },
+    'required' : ['lastblock', 'zonefile_info']
+})
+
+
+
+class PaginateWorker(threading.Thread):
+    """
+    Fetches pages for paginate_stream() with its own proxy
+    """
+    def __init__(self, get_page, proxy, work_queue, results, results_cv, stopped):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.get_page = get_page
+        self.proxy = proxy
+        self.work_queue = work_queue
+        self.results = results
+        self.results_cv = results_cv
+        self.stopped = stopped
+
+    def run(self):
+        while True:
+            work = self.work_queue.get()
+            if work is None or self.stopped.is_set():
+                return
+
+            page_num, page_offset, page_count = work
+            try:
+                page = self.get_page(page_offset, page_count, self.proxy)
+            except Exception as e:
+                log.exception(e)
+                page = {'error': 'Failed to fetch page at offset {}'.format(page_offset)}
+
+            with self.results_cv:
+                self.results[page_num] = page
+                self.results_cv.notify_all()
+
+
+def paginate_stream(get_page, offset, count, page_size, proxy=None, num_workers=PAGINATE_WORKERS):
+    """
+    Fetch the @count items starting at @offset from a paginated call,
+    @page_size items at a time.  get_page(offset, count, proxy) returns
+    a page (a list of items) or {'error': ...}.
+
+    Up to @num_workers pages are fetched at once, each with its own copy
+    of @proxy, and at most twice that many are held for the caller.
+    If the proxy can't be copied, pages are fetched one at a time.
+
+    Yields each non-empty page, in order.  Short or empty pages don't end
+    the stream, since the page getters may drop items the server sent
+    (e.g. invalid names), so a short page doesn't mean end-of-table.
+    Yields {'error': ...} and stops on error.
+    """
+    proxy = get_default_proxy() if proxy is None else proxy
+
+    pages = []
+    for page_offset in xrange(offset, offset + count, page_size):
+        pages.append( (len(pages), page_offset, min(page_size, offset + count - page_offset)) )
+
+    workers = []
+    if num_workers > 1 and len(pages) > 1:
+        for i in xrange(0, min(num_workers, len(pages))):
+            worker_proxy = proxy_clone(proxy)
+            if worker_proxy is None:
+                break
+
+            workers.append(worker_proxy)
+
+    def _check_page(page, page_count):
+        if json_is_error(page):
+            return page
+
+        if len(page) > page_count:
+            return {'error': 'server replied too much data'}
+
+        return page
+
+    if len(workers) == 0:
+        # one at a time
+        for (page_num, page_offset, page_count) in pages:
+            page = _check_page(get_page(page_offset, page_count, proxy), page_count)
+            if json_is_error(page):
+                yield page
+                return
+
+            if len(page) > 0:
+                yield page
+
+        return
+
+    work_queue = Queue.Queue()
+    results = {}
+    results_cv = threading.Condition()
+    stopped = threading.Event()
+    window = 2 * len(workers)
+
+    for i in xrange(0, len(workers)):
+        workers[i] = PaginateWorker(get_page, workers[i], work_queue, results, results_cv, stopped)
+        workers[i].start()
+
+    try:
+        for work in pages[:window]:
+            work_queue.put(work)
+
+        for (page_num, page_offset, page_count) in pages:
+            with results_cv:
+                while page_num not in results:
+                    results_cv.wait(1.0)
+
+                page = results.pop(page_num)
+
+            if page_num + window < len(pages):
+                work_queue.put(pages[page_num + window])
+
+            page = _check_page(page, page_count)
+            if json_is_error(page):
+                yield page
+                return
+
+            if len(page) > 0:
+                yield page
+
+    finally:
+        stopped.set()
+        for worker in workers:
+            work_queue.put(None)
+
+
+def paginate(get_page, offset, count, page_size, proxy=None, num_workers=PAGINATE_WORKERS):
+    """
+    Fetch the @count items starting at @offset from a paginated call.
+    See paginate_stream().
+
+    Returns the list of items on success
+    Returns {'error': ...} on error
+    """
+    return paginate_collect(paginate_stream(get_page, offset, count, page_size, proxy=proxy, num_workers=num_workers))
+
+
+def paginate_collect(page_stream):
+    """
+    Gather up the pages from a page stream.
+
+    Returns the list of items on success
+    Returns {'error': ...} on error
+    """
+    items = []
+    for page in page_stream:
+        if json_is_error(page):
+            return page
+
+        items += page
+
+    return items
+
+
+class RPCCache(object):
+    """
+    Process-wide cache of RPC replies, keyed by (server, method, args),
+    so repeated lookups within a block only cost one RPC.
+
+    Each server's replies are dropped as soon as its getinfo() reports
+    a new last_block_processed.  getinfo() is asked at most once every
+    @probe_ttl seconds, and its reply is cached for that long as well.
+
+    Only replies from BlockstackRPCClient proxies are cached, and only
+    if they aren't errors.  BlockstackMultiRPCClient replies aren't cached,
+    since the getinfo() probe and the call itself can be answered by
+    different servers, which may be on different blocks.
+    """
+    def __init__(self, enabled=BLOCKSTACK_RPC_CACHE, probe_ttl=RPC_CACHE_PROBE_TTL, max_entries=RPC_CACHE_MAX_ENTRIES):
+        self.enabled = enabled
+        self.probe_ttl = probe_ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.servers = {}
+        self.num_entries = 0
+
+    def clear(self):
+        """
+        Drop everything
+        """
+        with self.lock:
+            self.servers = {}
+            self.num_entries = 0
+
+    def _server_id(self, proxy):
+        """
+        Identify the server behind a proxy.
+        Returns None if we can't cache this proxy's replies
+        """
+        if isinstance(proxy, BlockstackRPCClient):
+            return proxy.url
+
+        return None
+
+    def _probe(self, server_id, proxy):
+        """
+        Get the server's getinfo() reply, asking it again if the last one is stale.
+        Drop the server's cached replies if it has processed a new block.
+        Returns the getinfo() reply (possibly an error)
+        """
+        with self.lock:
+            server = self.servers.get(server_id, None)
+            if server is not None and time.time() - server['probe_time'] < self.probe_ttl:
+                return copy.deepcopy(server['info'])
+
+        info = proxy.getinfo()
+
+        with self.lock:
+            server = self.servers.get(server_id, None)
+            if json_is_error(info) or not isinstance(info, dict) or 'last_block_processed' not in info:
+                # can't tell what block the server is on
+                if server is not None:
+                    self.num_entries -= len(server['entries'])
+                    del self.servers[server_id]
+
+                return info
+
+            if server is None or server['last_block'] != info['last_block_processed']:
+                # new block (or new server)
+                if server is not None:
+                    self.num_entries -= len(server['entries'])
+
+                server = {'last_block': info['last_block_processed'], 'entries': {}}
+                self.servers[server_id] = server
+
+            server['info'] = copy.deepcopy(info)
+            server['probe_time'] = time.time()
+            return info
+
+    def call(self, proxy, method, args):
+        """
+        Make an RPC call, or return its cached reply.
+        Returns the reply
+        Raises on RPC error
+        """
+        server_id = self._server_id(proxy) if self.enabled else None
+        if server_id is None:
+            return getattr(proxy, method)(*args)
+
+        info = self._probe(server_id, proxy)
+        if method == 'getinfo':
+            return info
+
+        if json_is_error(info):
+            return getattr(proxy, method)(*args)
+
+        key = (method, args)
+        with self.lock:
+            server = self.servers.get(server_id, None)
+            if server is not None and key in server['entries']:
+                return copy.deepcopy(server['entries'][key])
+
+        resp = getattr(proxy, method)(*args)
+        if json_is_error(resp) or not isinstance(resp, dict) or resp.get('indexing', False):
+            return resp
+
+        with self.lock:
+            server = self.servers.get(server_id, None)
+            if server is None or server['last_block'] != info['last_block_processed']:
+                # went stale while we were asking
+                return resp
+
+            if self.num_entries >= self.max_entries:
+                for other_server in self.servers.values():
+                    other_server['entries'] = {}
+
+                self.num_entries = 0
+
+            if key not in server['entries']:
+                self.num_entries += 1
+
+            server['entries'][key] = copy.deepcopy(resp)
+
+        return resp
+
+
+RPC_CACHE = RPCCache()
+
+
+def set_rpc_cache(enabled):
+    """
+    Turn the RPC reply cache on or off (see RPCCache)
+    """
+    RPC_CACHE.enabled = enabled
+    if not enabled:
+        RPC_CACHE.clear()
+
 
 def getinfo(proxy=None, hostport=None):
     """
@@ -434,7 +1215,7 @@ def getinfo(proxy=None, hostport=None):
             proxy = BlockstackRPCClient(host, port, protocol=protocol)
 
     try:
-        resp = proxy.getinfo()
+        resp = RPC_CACHE.call(proxy, 'getinfo', ())
         old_resp = resp
         resp = json_validate( schema, resp )
         if json_is_error(resp):
@@ -605,24 +1386,6 @@ def get_all_names_page(offset, count, include_expired=False, proxy=None):
     Returns {'error': ...} on error
     """
 
-    page_schema = {
-        'type': 'object',
-        'properties': {
-            'names': {
-                'type': 'array',
-                'items': {
-                    'type': 'string',
-                    'uniqueItems': True
-                },
-            },
-        },
-        'required': [
-            'names',
-        ],
-    }
-
-    schema = json_response_schema( page_schema )
-
     try:
         assert count <= 100, 'Page too big: {}'.format(count)
     except AssertionError as ae:
@@ -640,10 +1403,13 @@ def get_all_names_page(offset, count, include_expired=False, proxy=None):
         else:
             resp = proxy.get_all_names(offset, count)
 
-        resp = json_validate(schema, resp)
+        resp = json_validate_page(NAMES_PAGE_VALIDATOR, NAMES_PAGE_VALIDATOR_STRUCTURE, resp, proxy=proxy)
         if json_is_error(resp):
             return resp
 
+        if proxy_is_trusted(proxy):
+            return resp['names']
+
         # must be valid names
         valid_names = []
         for n in resp['names']:
@@ -676,21 +1442,6 @@ def get_num_names(proxy=None, include_expired=False):
     Return {'error': ...} on failure
     """
 
-    schema = {
-        'type': 'object',
-        'properties': {
-            'count': {
-                'type': 'integer',
-                'minimum': 0,
-            },
-        },
-        'required': [
-            'count',
-        ],
-    }
-
-    count_schema = json_response_schema( schema )
-
     proxy = get_default_proxy() if proxy is None else proxy
 
     resp = {}
@@ -700,7 +1451,7 @@ def get_num_names(proxy=None, include_expired=False):
         else:
             resp = proxy.get_num_names()
 
-        resp = json_validate(count_schema, resp)
+        resp = json_validate(COUNT_VALIDATOR, resp)
         if json_is_error(resp):
             return resp
     except ValidationError as e:
@@ -728,41 +1479,33 @@ def get_all_names(offset=None, count=None, include_expired=False, proxy=None):
     Return the list of names on success
     Return {'error': ...} on failure
     """
+    return paginate_collect(get_all_names_stream(offset=offset, count=count, include_expired=include_expired, proxy=proxy))
+
+
+def get_all_names_stream(offset=None, count=None, include_expired=False, proxy=None):
+    """
+    Get all names within the given range, a page at a time.
+    Yields each list of names, in order.
+    Yields {'error': ...} and stops on failure
+    """
     offset = 0 if offset is None else offset
     proxy = get_default_proxy() if proxy is None else proxy
 
     if count is None:
         # get all names after this offset
-        count = get_num_names(proxy=proxy)
+        count = get_num_names(proxy=proxy, include_expired=include_expired)
         if json_is_error(count):
             # error
-            return count
+            yield count
+            return
 
         count -= offset
 
-    page_size = 100
-    all_names = []
-    while len(all_names) < count:
-        request_size = page_size
-        if count - len(all_names) < request_size:
-            request_size = count - len(all_names)
-
-        page = get_all_names_page(offset + len(all_names), request_size, include_expired=include_expired, proxy=proxy)
-        if json_is_error(page):
-            # error
-            return page
-
-        if len(page) > request_size:
-            # error
-            error_str = 'server replied too much data'
-            return {'error': error_str}
-        elif len(page) == 0:
-            # end-of-table
-            break
+    def _get_page(page_offset, page_count, page_proxy):
+        return get_all_names_page(page_offset, page_count, include_expired=include_expired, proxy=page_proxy)
 
-        all_names += page
-
-    return all_names
+    for page in paginate_stream(_get_page, offset, count, 100, proxy=proxy):
+        yield page
 
 
 def get_all_namespaces(offset=None, count=None, proxy=None):
@@ -827,24 +1570,6 @@ def get_names_in_namespace_page(namespace_id, offset, count, proxy=None):
     Returns {'error': ...} on error
     """
 
-    names_schema = {
-        'type': 'object',
-        'properties': {
-            'names': {
-                'type': 'array',
-                'items': {
-                    'type': 'string',
-                    'uniqueItems': True
-                },
-            },
-        },
-        'required': [
-            'names',
-        ],
-    }
-
-    schema = json_response_schema( names_schema )
-
     assert count <= 100, 'Page too big: {}'.format(count)
 
     proxy = get_default_proxy() if proxy is None else proxy
@@ -852,10 +1577,13 @@ def get_names_in_namespace_page(namespace_id, offset, count, proxy=None):
     resp = {}
     try:
         resp = proxy.get_names_in_namespace(namespace_id, offset, count)
-        resp = json_validate(schema, resp)
+        resp = json_validate_page(NAMES_PAGE_VALIDATOR, NAMES_PAGE_VALIDATOR_STRUCTURE, resp, proxy=proxy)
         if json_is_error(resp):
             return resp
 
+        if proxy_is_trusted(proxy):
+            return resp['names']
+
         # must be valid names
         valid_names = []
         for n in resp['names']:
@@ -938,38 +1666,32 @@ def get_names_in_namespace(namespace_id, offset=None, count=None, proxy=None):
     Returns the list of names on success
     Returns {'error': ..} on error
     """
+    return paginate_collect(get_names_in_namespace_stream(namespace_id, offset=offset, count=count, proxy=proxy))
+
+
+def get_names_in_namespace_stream(namespace_id, offset=None, count=None, proxy=None):
+    """
+    Get all names in a namespace, a page at a time.
+    Yields each list of names, in order.
+    Yields {'error': ...} and stops on error
+    """
     offset = 0 if offset is None else offset
+    proxy = get_default_proxy() if proxy is None else proxy
+
     if count is None:
         # get all names in this namespace after this offset
         count = get_num_names_in_namespace(namespace_id, proxy=proxy)
         if json_is_error(count):
-            return count
+            yield count
+            return
 
         count -= offset
 
-    page_size = 100
-    all_names = []
-    while len(all_names) < count:
-        request_size = page_size
-        if count - len(all_names) < request_size:
-            request_size = count - len(all_names)
-
-        page = get_names_in_namespace_page(namespace_id, offset + len(all_names), request_size, proxy=proxy)
-        if json_is_error(page):
-            # error
-            return page
-
-        if len(page) > request_size:
-            # error
-            error_str = 'server replied too much data'
-            return {'error': error_str}
-        elif len(page) == 0:
-            # end-of-table
-            break
-
-        all_names += page
+    def _get_page(page_offset, page_count, page_proxy):
+        return get_names_in_namespace_page(namespace_id, page_offset, page_count, proxy=page_proxy)
 
-    return all_names[:count]
+    for page in paginate_stream(_get_page, offset, count, 100, proxy=proxy):
+        yield page
 
 
 def get_names_owned_by_address(address, proxy=None):
@@ -1085,42 +1807,6 @@ def get_historic_names_by_address_page(address, offset, count, proxy=None):
     Returns {'error': ...} on error
     """
 
-    names_schema = {
-        'type': 'object',
-        'properties': {
-            'names': {
-                'type': 'array',
-                'items': {
-                    'type': 'object',
-                    'properties': {
-                        'name': {
-                            'type': 'string',
-                            'pattern': OP_NAME_OR_SUBDOMAIN_PATTERN,
-                        },
-                        'block_id': {
-                            'type': 'integer',
-                            'minimum': 0,
-                        },
-                        'vtxindex': {
-                            'type': 'integer',
-                            'minimum': 0,
-                        },
-                    },
-                    'required': [
-                        'name',
-                        'block_id',
-                        'vtxindex',
-                    ],
-                },
-            },
-        },
-        'required': [
-            'names'
-        ],
-    }
-
-    schema = json_response_schema( names_schema )
-    
     proxy = get_default_proxy() if proxy is None else proxy
     
     assert count <= 100, "Page too big"
@@ -1128,10 +1814,13 @@ def get_historic_names_by_address_page(address, offset, count, proxy=None):
     resp = {}
     try:
         resp = proxy.get_historic_names_by_address(address, offset, count)
-        resp = json_validate(schema, resp)
+        resp = json_validate_page(HISTORIC_NAMES_PAGE_VALIDATOR, HISTORIC_NAMES_PAGE_VALIDATOR_STRUCTURE, resp, proxy=proxy)
         if json_is_error(resp):
             return resp
 
+        if proxy_is_trusted(proxy):
+            return resp['names']
+
         # names must be valid
         for n in resp['names']:
             assert scripts.is_name_valid(str(n['name'])), ('Invalid name "{}"'.format(str(n['name'])))
@@ -1161,6 +1850,15 @@ def get_historic_names_by_address(address, offset=None, count=None, proxy=None):
     Returns the list of names on success
     Returns {'error': ...} on failure
     """
+    return paginate_collect(get_historic_names_by_address_stream(address, offset=offset, count=count, proxy=proxy))
+
+
+def get_historic_names_by_address_stream(address, offset=None, count=None, proxy=None):
+    """
+    Get the list of names created by an address throughout history, a page at a time.
+    Yields each list of names, in order.
+    Yields {'error': ...} and stops on failure
+    """
     proxy = get_default_proxy() if proxy is None else proxy
 
     offset = 0 if offset is None else offset
@@ -1168,34 +1866,16 @@ def get_historic_names_by_address(address, offset=None, count=None, proxy=None):
         # get all names owned by this address
         count = get_num_historic_names_by_address(address, proxy=proxy)
         if json_is_error(count):
-            return count
+            yield count
+            return
 
         count -= offset
 
-    page_size = 10
-    all_names = []
-    while len(all_names) < count:
-        request_size = page_size
-        if count - len(all_names) < request_size:
-            request_size = count - len(all_names)
-
-        page = get_historic_names_by_address_page(address, offset + len(all_names), request_size, proxy=proxy)
-        if json_is_error(page):
-            # error
-            return page
-
-        if len(page) > request_size:
-            # error
-            error_str = 'server replied too much data'
-            return {'error': error_str}
-
-        elif len(page) == 0:
-            # end-of-table
-            break
+    def _get_page(page_offset, page_count, page_proxy):
+        return get_historic_names_by_address_page(address, page_offset, page_count, proxy=page_proxy)
 
-        all_names += page
-
-    return all_names[:count]
+    for page in paginate_stream(_get_page, offset, count, 10, proxy=proxy):
+        yield page
 
 
 def get_DID_blockchain_record(did, proxy=None):
@@ -1295,7 +1975,7 @@ def get_consensus_at(block_height, proxy=None, hostport=None):
 
     resp = {}
     try:
-        resp = proxy.get_consensus_at(block_height)
+        resp = RPC_CACHE.call(proxy, 'get_consensus_at', (block_height,))
         resp = json_validate(resp_schema, resp)
         if json_is_error(resp):
             return resp
@@ -1604,83 +2284,77 @@ def get_name_blockchain_history(name, start_block, end_block, proxy=None):
     return ret
 
 
+def get_op_history_rows_page(name, offset, count, proxy=None):
+    """
+    Get a page of history rows for a name or namespace.
+    Returns the list of rows on success
+    Returns {'error': ...} on error
+    """
+    proxy = get_default_proxy() if proxy is None else proxy
+
+    resp = {}
+    try:
+        resp = proxy.get_op_history_rows(name, offset, count)
+        resp = json_validate_page(OP_HISTORY_ROWS_PAGE_VALIDATOR, OP_HISTORY_ROWS_PAGE_VALIDATOR_STRUCTURE, resp, proxy=proxy)
+        if json_is_error(resp):
+            return resp
+
+        if not proxy_is_trusted(proxy):
+            for row in resp['history_rows']:
+                if row['history_id'] != name:
+                    raise ValidationError('History row for "{}" is not for "{}"'.format(row['history_id'], name))
+
+    except ValidationError as e:
+        if BLOCKSTACK_DEBUG:
+            log.exception(e)
+
+        resp = json_traceback(resp.get('error'))
+        return resp
+
+    except Exception as ee:
+        if BLOCKSTACK_DEBUG:
+            log.exception(ee)
+
+        log.error("Caught exception while connecting to Blockstack node: {}".format(ee))
+        resp = {'error': 'Failed to contact Blockstack node.  Try again with `--debug`.'}
+        return resp
+
+    return resp['history_rows']
+
+
 def get_op_history_rows(name, proxy=None):
     """
     Get the history rows for a name or namespace.
     """
-    history_schema = {
-        'type': 'array',
-        'items': {
-            'type': 'object',
-            'properties': {
-                'txid': {
-                    'type': 'string',
-                    'pattern': OP_TXID_PATTERN,
-                },
-                'history_id': {
-                    'type': 'string',
-                    'pattern': '^({})$'.format(name),
-                },
-                'block_id': {
-                    'type': 'integer',
-                    'minimum': 0,
-                },
-                'vtxindex': {
-                    'type': 'integer',
-                    'minimum': 0,
-                },
-                'op': {
-                    'type': 'string',
-                    'pattern': OP_CODE_PATTERN,
-                },
-                'history_data': {
-                    'type': 'string'
-                },
-            },
-            'required': [
-                'txid',
-                'history_id',
-                'block_id',
-                'vtxindex',
-                'op',
-                'history_data',
-            ],
-        },
-    }
+    history_rows_count = get_num_op_history_rows(name, proxy=proxy)
+    if json_is_error(history_rows_count):
+        return history_rows_count
 
-    hist_count_schema = {
-        'type': 'object',
-        'properties': {
-            'count': {
-                'type': 'integer',
-                'minimum': 0,
-            },
-        },
-        'required': [
-            'count'
-        ],
-    }
+    history_rows = paginate_collect(get_op_history_rows_stream(name, count=history_rows_count, proxy=proxy))
+    if json_is_error(history_rows):
+        return history_rows
 
-    hist_rows_schema = {
-        'type': 'object',
-        'properties': {
-            'history_rows': history_schema
-        },
-        'required': [
-            'history_rows'
-        ]
-    }
+    if BLOCKSTACK_TEST is not None and len(history_rows) != history_rows_count:
+        # something's wrong--we should have them all
+        msg = 'Missing history rows: expected {}, got {}'.format(history_rows_count, len(history_rows))
+        log.error(msg)
+        return {'error': msg}
 
-    count_schema = json_response_schema( hist_count_schema )
-    resp_schema = json_response_schema( hist_rows_schema )
+    return history_rows
 
+
+def get_num_op_history_rows(name, proxy=None):
+    """
+    Get the number of history rows for a name or namespace.
+    Returns the count on success
+    Returns {'error': ...} on error
+    """
     proxy = get_default_proxy() if proxy is None else proxy
 
-    # how many history rows?
     history_rows_count = None
     try:
         history_rows_count = proxy.get_num_op_history_rows(name)
-        history_rows_count = json_validate(count_schema, history_rows_count)
+        history_rows_count = json_validate(COUNT_VALIDATOR, history_rows_count)
         if json_is_error(history_rows_count):
             return history_rows_count
 
@@ -1695,46 +2369,31 @@ def get_op_history_rows(name, proxy=None):
         resp = {'error': 'Failed to contact Blockstack node.  Try again with `--debug`.'}
         return resp
 
-    history_rows = []
-    history_rows_count = history_rows_count['count']
-    page_size = 10
-    while len(history_rows) < history_rows_count:
-        resp = {}
-        try:
-            resp = proxy.get_op_history_rows(name, len(history_rows), page_size)
-            resp = json_validate(resp_schema, resp)
-            if json_is_error(resp):
-                return resp
-
-            history_rows += resp['history_rows']
-
-            if BLOCKSTACK_TEST is not None:
-                if len(resp['history_rows']) == page_size:
-                    continue
+    return history_rows_count['count']
 
-                if len(history_rows) == history_rows_count:
-                    continue
 
-                # something's wrong--we should have them all
-                msg = 'Missing history rows: expected {}, got {}'
-                raise Exception(msg.format(history_rows_count, len(history_rows)))
-
-        except ValidationError as e:
-            if BLOCKSTACK_DEBUG:
-                log.exception(e)
+def get_op_history_rows_stream(name, offset=None, count=None, proxy=None):
+    """
+    Get the history rows for a name or namespace, a page at a time.
+    Yields each list of rows, in order.
+    Yields {'error': ...} and stops on error
+    """
+    proxy = get_default_proxy() if proxy is None else proxy
 
-            resp = json_traceback(resp.get('error'))
-            return resp
+    offset = 0 if offset is None else offset
+    if count is None:
+        count = get_num_op_history_rows(name, proxy=proxy)
+        if json_is_error(count):
+            yield count
+            return
 
-        except Exception as ee:
-            if BLOCKSTACK_DEBUG:
-                log.exception(ee)
+        count -= offset
 
-            log.error("Caught exception while connecting to Blockstack node: {}".format(ee))
-            resp = {'error': 'Failed to contact Blockstack node.  Try again with `--debug`.'}
-            return resp
+    def _get_page(page_offset, page_count, page_proxy):
+        return get_op_history_rows_page(name, page_offset, page_count, proxy=page_proxy)
 
-    return history_rows
+    for page in paginate_stream(_get_page, offset, count, 10, proxy=proxy):
+        yield page
 
 
 def get_zonefiles_by_block(from_block, to_block, proxy=None):
@@ -1745,30 +2404,6 @@ def get_zonefiles_by_block(from_block, to_block, proxy=None):
                                     'txid' : '...',
                                     'block_height' : '...' } ] }
     """
-    zonefile_info_schema = {
-        'type' : 'array',
-        'items' : {
-            'type' : 'object',
-            'properties' : {
-                'name' : {'type' : 'string'},
-                'zonefile_hash' : { 'type' : 'string',
-                                    'pattern' : OP_ZONEFILE_HASH_PATTERN },
-                'txid' : {'type' : 'string',
-                          'pattern' : OP_TXID_PATTERN},
-                'block_height' : {'type' : 'integer'}
-            },
-            'required' : [ 'zonefile_hash', 'txid', 'block_height' ]
-        }
-    }
-    response_schema = {
-        'type' : 'object',
-        'properties' : {
-            'lastblock' : {'type' : 'integer'},
-            'zonefile_info' : zonefile_info_schema
-        },
-        'required' : ['lastblock', 'zonefile_info']
-    }
-
     proxy = get_default_proxy() if proxy is None else proxy
 
     offset = 0
@@ -1779,7 +2414,7 @@ def get_zonefiles_by_block(from_block, to_block, proxy=None):
         resp = proxy.get_zonefiles_by_block(from_block, to_block, offset, 100)
         if 'error' in resp:
             return resp
-        resp = json_validate(response_schema, resp)
+        resp = json_validate_page(ZONEFILES_BY_BLOCK_PAGE_VALIDATOR, ZONEFILES_BY_BLOCK_PAGE_VALIDATOR_STRUCTURE, resp, proxy=proxy)
         if json_is_error(resp):
             return resp
         output_zonefiles += resp['zonefile_info']
@@ -1797,53 +2432,13 @@ def get_nameops_affected_at(block_id, proxy=None):
     Return the list of name records at the given height on success.
     Return {'error': ...} on error.
     """
-    history_schema = {
-        'type': 'array',
-        'items': {
-            'type': 'object',
-            'properties': OP_HISTORY_SCHEMA['properties'],
-            'required': [
-                'op',
-                'opcode',
-                'txid',
-                'vtxindex',
-            ]
-        }
-    }
-
-    nameop_history_schema = {
-        'type': 'object',
-        'properties': {
-            'nameops': history_schema,
-        },
-        'required': [
-            'nameops',
-        ],
-    }
-
-    history_count_schema = {
-        'type': 'object',
-        'properties': {
-            'count': {
-                'type': 'integer',
-                'minimum': 0,
-            },
-        },
-        'required': [
-            'count',
-        ],
-    }
-    
-    count_schema = json_response_schema( history_count_schema )
-    nameop_schema = json_response_schema( nameop_history_schema )
-
     proxy = get_default_proxy() if proxy is None else proxy
 
     # how many nameops?
     num_nameops = None
     try:
         num_nameops = proxy.get_num_nameops_affected_at(block_id)
-        num_nameops = json_validate(count_schema, num_nameops)
+        num_nameops = json_validate(COUNT_VALIDATOR, num_nameops)
         if json_is_error(num_nameops):
             return num_nameops
 
@@ -1868,7 +2463,7 @@ def get_nameops_affected_at(block_id, proxy=None):
         resp = {}
         try:
             resp = proxy.get_nameops_affected_at(block_id, len(all_nameops), page_size)
-            resp = json_validate(nameop_schema, resp)
+            resp = json_validate_page(NAMEOPS_PAGE_VALIDATOR, NAMEOPS_PAGE_VALIDATOR_STRUCTURE, resp, proxy=proxy)
             if json_is_error(resp):
                 return resp
 
@@ -2041,7 +2636,7 @@ def get_name_blockchain_record(name, include_expired=True, include_grace=True, p
     resp = {}
     lastblock = None
     try:
-        resp = proxy.get_name_blockchain_record(name)
+        resp = RPC_CACHE.call(proxy, 'get_name_blockchain_record', (name,))
         resp = json_validate(resp_schema, resp)
         if json_is_error(resp):
             if resp['error'] == 'Not found.':
@@ -2112,7 +2707,7 @@ def get_namespace_blockchain_record(namespace_id, proxy=None):
 
     ret = {}
     try:
-        ret = proxy.get_namespace_blockchain_record(namespace_id)
+        ret = RPC_CACHE.call(proxy, 'get_namespace_blockchain_record', (namespace_id,))
         ret = json_validate(resp_schema, ret)
         if json_is_error(ret):
             return ret
@@ -20,9 +20,12 @@
     You should have received a copy of the GNU General Public License
     along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
 """
+import os
 import simplejson
 import random
 import time
+import sqlite3
+import threading
 
 from .backend.blockchain import get_bitcoind_client
 
@@ -39,13 +42,112 @@ from .logger import get_logger
 from .constants import (
     FIRST_BLOCK_MAINNET, NAME_OPCODES,
     OPFIELDS, BLOCKCHAIN_ID_MAGIC, NAME_PREORDER,
-    NAME_TRANSFER, NAMESPACE_PREORDER
+    NAME_TRANSFER, NAMESPACE_PREORDER, SNV_CACHE_PATH
 )
 
 import json
 
 log = get_logger()
 
+SNV_CACHE_SQL = """
+CREATE TABLE IF NOT EXISTS verified( block_id INTEGER PRIMARY KEY NOT NULL,
+                                     consensus_hash TEXT NOT NULL,
+                                     nameops_hash TEXT,
+                                     prev_block_ids TEXT );
+"""
+
+SNV_CACHE_LOCK = threading.Lock()
+
+
+def snv_cache_open(path):
+    """
+    Open (and maybe create) the SNV cache:  a table of blocks whose
+    consensus hashes (and maybe nameops hashes) SNV has already verified.
+    Blocks that SNV walked through also have the skip-list blocks their
+    consensus hashes were checked against (comma-separated prev_block_ids).
+    Return the connection
+    """
+    dirname = os.path.dirname(path)
+    if len(dirname) > 0 and not os.path.exists(dirname):
+        os.makedirs(dirname)
+
+    con = sqlite3.connect(path, isolation_level=None, timeout=30)
+    con.execute(SNV_CACHE_SQL)
+    return con
+
+
+def snv_cache_load(path, start_block_id, end_block_id):
+    """
+    Get the verified hashes for the blocks in [start_block_id, end_block_id].
+    Return {block_id: (consensus_hash, nameops_hash or None, [prev block IDs] or None)}
+    Return {} if the cache can't be read
+    """
+    ret = {}
+    try:
+        with SNV_CACHE_LOCK:
+            con = snv_cache_open(path)
+            rows = con.execute('SELECT block_id,consensus_hash,nameops_hash,prev_block_ids FROM verified WHERE block_id >= ? AND block_id <= ?;',
+                               (start_block_id, end_block_id)).fetchall()
+            con.close()
+
+        for (block_id, ch, nameops_hash, prev_block_ids) in rows:
+            if prev_block_ids is not None:
+                prev_block_ids = [int(b) for b in str(prev_block_ids).split(',') if len(b) > 0]
+
+            ret[block_id] = (str(ch), str(nameops_hash) if nameops_hash is not None else None, prev_block_ids)
+
+    except Exception as e:
+        log.exception(e)
+        log.error('Failed to read SNV cache {}'.format(path))
+        return {}
+
+    return ret
+
+
+def snv_cache_store(path, consensus_hashes, nameops_hashes, prev_block_ids):
+    """
+    Remember verified consensus hashes and nameops hashes, and the
+    skip-list blocks each walked block's consensus hash was checked against.
+    If they disagree with what's in the cache, then one of the trust roots
+    they were verified against was bad; since we can't tell which,
+    throw out the cache and keep only these.
+
+    Return True on success
+    Return False on error
+    """
+    try:
+        with SNV_CACHE_LOCK:
+            con = snv_cache_open(path)
+            con.execute('BEGIN;')
+
+            block_ids = sorted(consensus_hashes.keys())
+            for block_id in block_ids:
+                row = con.execute('SELECT consensus_hash FROM verified WHERE block_id = ?;', (block_id,)).fetchone()
+                if row is not None and str(row[0]) != consensus_hashes[block_id]:
+                    log.error('SNV cache disagrees on the consensus hash at {} ({} != {}); clearing it'.format(block_id, row[0], consensus_hashes[block_id]))
+                    con.execute('DELETE FROM verified;')
+                    break
+
+            for block_id in block_ids:
+                prevs = None
+                if block_id in prev_block_ids:
+                    prevs = ','.join([str(b) for b in prev_block_ids[block_id]])
+
+                con.execute('INSERT OR REPLACE INTO verified (block_id,consensus_hash,nameops_hash,prev_block_ids) ' +
+                            'VALUES (?,?,COALESCE(?,(SELECT nameops_hash FROM verified WHERE block_id = ?)),' +
+                            'COALESCE(?,(SELECT prev_block_ids FROM verified WHERE block_id = ?)));',
+                            (block_id, consensus_hashes[block_id], nameops_hashes.get(block_id, None), block_id, prevs, block_id))
+
+            con.execute('COMMIT;')
+            con.close()
+
+    except Exception as e:
+        log.exception(e)
+        log.error('Failed to write SNV cache {}'.format(path))
+        return False
+
+    return True
+
 
 def txid_to_block_data(txid, bitcoind_proxy, proxy=None):
     """
@@ -276,12 +378,19 @@ def get_consensus_hash_from_tx(tx):
     return None
 
 
-def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, consensus_hash, proxy=None):
+def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, consensus_hash, proxy=None, cache_path=SNV_CACHE_PATH):
     """
     Simple name verification (snv) lookup:
     Use a known-good "current" consensus hash and block ID to
     look up a set of name operations from the past, given the previous
     point in time's untrusted block ID and consensus hash.
+
+    Hashes verified along the way are remembered in the SNV cache at
+    @cache_path (pass None to not use it).  Since a consensus hash covers
+    the consensus hashes it was built from, once we verify a consensus hash
+    that the cache agrees with, we can trust the cached hashes we reach by
+    following its skip-list links.  Other cached blocks may have been
+    verified against a different trust anchor, so they aren't used.
     """
 
     log.debug('verify {}-{} to {}-{}'.format(
@@ -299,8 +408,68 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
         next_block_id: current_consensus_hash
     }
 
+    # skip-list blocks each verified block's consensus hash was built from
+    prev_links = {}
+
+    # previously-verified hashes
+    cached = {}
+    if cache_path is not None:
+        cached = snv_cache_load(cache_path, block_id, current_block_id)
+
+    def _check_cache(verified_block_ids):
+        """
+        If the cache agrees with us on any of these verified consensus hashes,
+        then use its hashes for the blocks reachable from them through the
+        cached skip-list links.
+        Return True if so
+        """
+        found = False
+        for b in sorted(verified_block_ids, reverse=True):
+            if b not in cached:
+                continue
+
+            if cached[b][0] != prev_consensus_hashes[b]:
+                log.warning('SNV cache disagrees on the consensus hash at {}; ignoring it'.format(b))
+                cached.clear()
+                return False
+
+            reached = set([b])
+            frontier = [b]
+            while len(frontier) > 0:
+                cb = frontier.pop()
+                for pb in (cached[cb][2] or []):
+                    if pb in cached and pb not in reached:
+                        reached.add(pb)
+                        frontier.append(pb)
+
+            for cb in reached:
+                if cb in prev_consensus_hashes and prev_consensus_hashes[cb] != cached[cb][0]:
+                    log.warning('SNV cache disagrees on the consensus hash at {}; ignoring it'.format(cb))
+                    cached.clear()
+                    return False
+
+            for cb in reached:
+                (ch, nameops_hash, prev_block_ids) = cached.pop(cb)
+                prev_consensus_hashes.setdefault(cb, ch)
+                if nameops_hash is not None:
+                    prev_nameops_hashes.setdefault(cb, nameops_hash)
+
+                if prev_block_ids is not None:
+                    prev_links.setdefault(cb, prev_block_ids)
+
+            log.debug('SNV cache agrees with block {} ({} blocks reached)'.format(b, len(reached)))
+            found = True
+
+        return found
+
+    _check_cache([next_block_id])
+
     # print 'next_block_id = {}, block_id = {}'.format(next_block_id, block_id)
     while next_block_id >= block_id:
+        if next_block_id == block_id and block_id in prev_nameops_hashes:
+            # already verified
+            break
+
         # get nameops_at[ next_block_id ], and all consensus_hash[ next_block_id - 2^i ]
         # such that block_id - 2*i > block_id (start at i = 1)
         i = 0
@@ -377,6 +546,10 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
             log.error(msg.format(next_block_id, expected_ch, ch, nameops_hash, prev_consensus_hashes))
             return {'error': 'Consensus hash mismatch'}
 
+        prev_links[next_block_id] = prev_consensus_block_ids
+        if len(cached) > 0:
+            _check_cache([next_block_id] + prev_consensus_block_ids)
+
         # advance!
         # find the smallest known consensus hash whose block is greater than block_id
         current_candidate = next_block_id
@@ -430,6 +603,9 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
 
     log.debug('{} nameops at {}'.format(len(historic_nameops), block_id))
 
+    if cache_path is not None:
+        snv_cache_store(cache_path, prev_consensus_hashes, prev_nameops_hashes, prev_links)
+
     # strip history
     for hn in historic_nameops:
         if 'history' in hn.keys():
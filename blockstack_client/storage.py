@@ -31,17 +31,23 @@ import urllib
 import urllib2
 import base64
 import time
+import threading
+import Queue
+import functools
+import collections
 import jsontokens
 
 import blockstack_zones
 import blockstack_profiles
 
 from .logger import get_logger
-from constants import BLOCKSTACK_TEST, BLOCKSTACK_DEBUG, BLOCKSTACK_STORAGE_CLASSES
+from constants import BLOCKSTACK_TEST, BLOCKSTACK_DEBUG, BLOCKSTACK_STORAGE_CLASSES, BLOCKSTACK_STORAGE_RACE_READS, STORAGE_RACE_STAGGER, \
+        STORAGE_WRITE_TIMEOUT, SIGNATURE_CACHE_SIZE
 from config import get_config, CONFIG_PATH
 from scripts import hex_hash160
 import schemas
 from keys import is_singlesig_hex
+from .utils import ScatterGather, ScatterGatherTask, get_scatter_gather_pool
 
 import virtualchain
 from virtualchain.lib.ecdsalib import (
@@ -54,6 +60,10 @@ log = get_logger()
 # global list of registered data handlers
 storage_handlers = []
 
+# hashes of (data, public key, signature) triples that verified, least-recently-used first
+VERIFIED_SIGNATURES = collections.OrderedDict()
+VERIFIED_SIGNATURES_LOCK = threading.Lock()
+
 
 class UnhandledURLException(Exception):
     def __init__(self, url):
@@ -216,13 +226,52 @@ def sign_data_payload( data_payload, data_privkey ):
     return data_sigb64
 
 
+def verify_raw_data_cached( data_txt, data_pubkey, sigb64 ):
+    """
+    verify_raw_data(), but remember the last SIGNATURE_CACHE_SIZE
+    (data, public key, signature) triples that verified, so checking
+    the same signature again skips the ECDSA math.
+    Only successes are remembered, keyed by a hash of the whole triple.
+    Return True if the signature is valid
+    Return False if not
+    """
+    if SIGNATURE_CACHE_SIZE <= 0:
+        return verify_raw_data( data_txt, data_pubkey, sigb64 )
+
+    h = hashlib.sha256()
+    for part in [data_txt, data_pubkey, sigb64]:
+        if isinstance(part, unicode):
+            part = part.encode('utf-8')
+
+        part = str(part)
+        h.update('{}:{},'.format(len(part), part))
+
+    key = h.digest()
+    with VERIFIED_SIGNATURES_LOCK:
+        if key in VERIFIED_SIGNATURES:
+            # mark as most-recently-used
+            del VERIFIED_SIGNATURES[key]
+            VERIFIED_SIGNATURES[key] = True
+            return True
+
+    if not verify_raw_data( data_txt, data_pubkey, sigb64 ):
+        return False
+
+    with VERIFIED_SIGNATURES_LOCK:
+        VERIFIED_SIGNATURES[key] = True
+        while len(VERIFIED_SIGNATURES) > SIGNATURE_CACHE_SIZE:
+            VERIFIED_SIGNATURES.popitem(last=False)
+
+    return True
+
+
 def verify_data_payload( data_payload, data_pubkey, sigb64 ):
     """
     Given a payload, verify that the signature covers
     its netstring representation (i.e. 'len(data_payload):data_payload,')
     """
     data_txt = serialize_data_payload(data_payload)
-    res = verify_raw_data( data_txt, data_pubkey, sigb64 )
+    res = verify_raw_data_cached( data_txt, data_pubkey, sigb64 )
     return res
    
 
@@ -275,7 +324,7 @@ def verify_data_tombstone( signed_tombstone, data_pubkey ):
         return False
 
     tombstone_data, sigb64 = parts[0], parts[1]
-    return verify_raw_data( tombstone_data, data_pubkey, sigb64 )
+    return verify_raw_data_cached( tombstone_data, data_pubkey, sigb64 )
 
 
 def make_data_tombstone( tombstone_data ):
@@ -705,8 +754,70 @@ def configure_storage_driver(driver_name, index=False, force_index=False, config
     return {'error': 'No such driver'}
 
 
+def race_storage_reads(attempts, stagger=STORAGE_RACE_STAGGER):
+    """
+    Race a list of reads.  Each attempt is a callable that returns
+    verified data, or None if it couldn't get any.
+
+    Attempts start in order, each @stagger seconds after the one
+    before it (or right away once all the ones before it have failed).
+    The first data to come back wins; attempts that haven't started
+    yet never will, and the results of ones still running are ignored.
+
+    Return the data on success
+    Return None if every attempt failed
+    """
+    if len(attempts) == 0:
+        return None
+
+    if len(attempts) == 1:
+        return attempts[0]()
+
+    results = Queue.Queue()
+
+    def _run(attempt):
+        res = None
+        try:
+            res = attempt()
+        except Exception as e:
+            log.exception(e)
+
+        results.put(res)
+
+    started = 0
+    finished = 0
+    next_start = time.time()
+
+    while finished < len(attempts):
+        now = time.time()
+        if started < len(attempts) and (now >= next_start or started == finished):
+            thr = threading.Thread(target=_run, args=(attempts[started],))
+            thr.daemon = True
+            thr.start()
+
+            started += 1
+            next_start = now + stagger
+            continue
+
+        try:
+            if started < len(attempts):
+                res = results.get(timeout=max(0, next_start - now))
+            else:
+                res = results.get()
+
+        except Queue.Empty:
+            continue
+
+        finished += 1
+        if res is not None:
+            log.debug('Read won by attempt {} of {} ({} finished)'.format(started, len(attempts), finished))
+            return res
+
+    return None
+
+
 def get_immutable_data(data_hash, data_url=None, hash_func=get_data_hash, fqu=None,
-                       data_id=None, zonefile=False, drivers=None):
+                       data_id=None, zonefile=False, drivers=None, race=None, stagger=None):
     """
     Given the hash of the data, go through the list of
     immutable data handlers and look it up.
@@ -714,6 +825,9 @@ def get_immutable_data(data_hash, data_url=None, hash_func=get_data_hash, fqu=No
     Optionally pass the fully-qualified name (@fqu), human-readable data ID (data_id),
     and whether or not this is a zonefile request (zonefile) as hints to the driver.
 
+    If @race is True (default: BLOCKSTACK_STORAGE_RACE_READS), query the
+    handlers concurrently instead of one at a time (see race_storage_reads).
+
     Return the data (as a dict) on success.
     Return None on failure
     """
@@ -723,6 +837,12 @@ def get_immutable_data(data_hash, data_url=None, hash_func=get_data_hash, fqu=No
         log.warn('No storage handlers registered')
         return None
 
+    if race is None:
+        race = BLOCKSTACK_STORAGE_RACE_READS
+
+    if stagger is None:
+        stagger = STORAGE_RACE_STAGGER
+
     handlers_to_use = []
     if drivers is None:
         handlers_to_use = storage_handlers
@@ -735,14 +855,17 @@ def get_immutable_data(data_hash, data_url=None, hash_func=get_data_hash, fqu=No
 
     log.debug('get_immutable {}'.format(data_hash))
 
-    for handler in [data_url] + handlers_to_use:
-        if handler is None:
-            continue
-
-        data, data_dict = None, None
+    def _get_from(handler):
+        """
+        Get and verify the data from a handler or the URL hint.
+        Return the data on success
+        Return None if not found or invalid
+        """
+        data = None
 
         if handler == data_url:
             # url hint
+            handler_name = data_url
             try:
                 # assume it's something we can urlopen
                 urlh = urllib2.urlopen(data_url)
@@ -752,13 +875,14 @@ def get_immutable_data(data_hash, data_url=None, hash_func=get_data_hash, fqu=No
                 log.exception(e)
                 msg = 'Failed to load profile from "{}"'
                 log.error(msg.format(data_url))
-                continue
+                return None
         else:
             # handler
+            handler_name = handler.__name__
             if not getattr(handler, 'get_immutable_handler', None):
                 msg = 'No method: {}.get_immutable_handler({})'
                 log.debug(msg.format(handler, data_hash))
-                continue
+                return None
 
             log.debug('Try {} ({})'.format(handler.__name__, data_hash))
             try:
@@ -769,12 +893,12 @@ def get_immutable_data(data_hash, data_url=None, hash_func=get_data_hash, fqu=No
                 log.exception(e)
                 msg = 'Method failed: {}.get_immutable_handler({})'
                 log.debug(msg.format(handler, data_hash))
-                continue
+                return None
 
         if data is None:
             msg = 'No data: {}.get_immutable_handler({})'
-            log.debug(msg.format(handler.__name__, data_hash))
-            continue
+            log.debug(msg.format(handler_name, data_hash))
+            return None
 
         # validate
         dh = hash_func(data)
@@ -787,11 +911,20 @@ def get_immutable_data(data_hash, data_url=None, hash_func=get_data_hash, fqu=No
                 msg = 'Invalid data hash from {}.get_immutable_handler'
                 log.error(msg.format(handler.__name__))
 
-            continue
+            return None
 
-        log.debug('loaded {} with {}'.format(data_hash, handler.__name__))
+        log.debug('loaded {} with {}'.format(data_hash, handler_name))
         return data
 
+    attempts = [functools.partial(_get_from, handler) for handler in [data_url] + handlers_to_use if handler is not None]
+    if race:
+        return race_storage_reads(attempts, stagger=stagger)
+
+    for attempt in attempts:
+        data = attempt()
+        if data is not None:
+            return data
+
     return None
 
 
@@ -828,12 +961,15 @@ def get_driver_urls( fq_data_id, storage_drivers ):
 
 
 def get_mutable_data(fq_data_id, data_pubkey, urls=None, data_address=None, data_hash=None,
-                     owner_address=None, blockchain_id=None, drivers=None, decode=True, bsk_version=None, return_public_key=False):
+                     owner_address=None, blockchain_id=None, drivers=None, decode=True, bsk_version=None, return_public_key=False,
+                     race=None, stagger=None):
     """
     Low-level call to get mutable data, given a fully-qualified data name.
     
     if decode is False, then data_pubkey, data_address, and owner_address are not needed and raw bytes will be returned.
     if return_public_key is True, and resolution succeeds, then return {'data': ..., 'public_key': ...} instead of the data.
+    if race is True (default: BLOCKSTACK_STORAGE_RACE_READS), then query the drivers' URLs
+    concurrently instead of one at a time, and take the first data that verifies (see race_storage_reads).
 
     Return:
     * a dict containing the profile if profile=True and this was a profile
@@ -846,6 +982,12 @@ def get_mutable_data(fq_data_id, data_pubkey, urls=None, data_address=None, data
 
     global storage_handlers
 
+    if race is None:
+        race = BLOCKSTACK_STORAGE_RACE_READS
+
+    if stagger is None:
+        stagger = STORAGE_RACE_STAGGER
+
     # fully-qualified username hint
     fqu = None
     if blockchain_id is not None:
@@ -871,7 +1013,71 @@ def get_mutable_data(fq_data_id, data_pubkey, urls=None, data_address=None, data
             log.debug("Invalid address '{}'".format(a))
             continue
 
+    def _get_from(storage_handler, url):
+        """
+        Get, decode, and verify the data from a driver's URL.
+        Return the data on success
+        Return None if not found or invalid
+        """
+        data_txt, data_res = None, None
+
+        log.debug('Try {} ({})'.format(storage_handler.__name__, url))
+        try:
+            data_txt = storage_handler.get_mutable_handler(url, fqu=fqu, data_pubkey=data_pubkey, data_pubkey_hashes=data_pubkey_hashes)
+        except UnhandledURLException as uue:
+            # handler doesn't handle this URL
+            msg = 'Storage handler {} does not handle URLs like {}'
+            log.debug(msg.format(storage_handler.__name__, url))
+            return None
+        except Exception as e:
+            log.exception(e)
+            return None
+
+        if data_txt is None:
+            # no data
+            msg = 'No data from {} ({})'
+            log.debug(msg.format(storage_handler.__name__, url))
+            return None
+
+        # parse it, if desired
+        if decode:
+            data_res = None
+            if data_pubkey is not None or data_address is not None or data_hash is not None:
+                data_res = parse_mutable_data(
+                    data_txt, data_pubkey, public_key_hash=data_address, data_hash=data_hash, bsk_version=bsk_version, return_public_key=return_public_key
+                )
+
+            if data_res is None and owner_address is not None:
+                data_res = parse_mutable_data(
+                    data_txt, None, public_key_hash=owner_address, bsk_version=bsk_version, return_public_key=return_public_key
+                )
+
+            if data_res is None:
+                msg = 'Unparseable data from "{}"'
+                log.error(msg.format(url))
+                return None
+
+            msg = 'Loaded "{}" with {}'
+            log.debug(msg.format(url, storage_handler.__name__))
+
+            if BLOCKSTACK_TEST:
+                log.debug("loaded data: {}".format(data_res))
+
+        else:
+            if return_public_key:
+                data_res = {'data': data_txt, 'public_key': None}
+            else:
+                data_res = data_txt
+
+            msg = 'Fetched (but did not decode or verify) "{}" with "{}"'
+            log.debug(msg.format(url, storage_handler.__name__))
+
+        return data_res
+
     log.debug('get_mutable_data {} fqu={} bsk_version={}'.format(fq_data_id, fqu, bsk_version))
+
+    # which drivers and URLs to try, in order
+    attempts = []
     for storage_handler in handlers_to_use:
         if not getattr(storage_handler, 'get_mutable_handler', None):
             continue
@@ -913,68 +1119,95 @@ def get_mutable_data(fq_data_id, data_pubkey, urls=None, data_address=None, data
                     try_urls.append(url)
 
         for url in try_urls:
-            data_txt, data_res = None, None
+            attempts.append(functools.partial(_get_from, storage_handler, url))
 
-            log.debug('Try {} ({})'.format(storage_handler.__name__, url))
-            try:
-                data_txt = storage_handler.get_mutable_handler(url, fqu=fqu, data_pubkey=data_pubkey, data_pubkey_hashes=data_pubkey_hashes)
-            except UnhandledURLException as uue:
-                # handler doesn't handle this URL
-                msg = 'Storage handler {} does not handle URLs like {}'
-                log.debug(msg.format(storage_handler.__name__, url))
-                continue
-            except Exception as e:
-                log.exception(e)
-                continue
+    if race:
+        return race_storage_reads(attempts, stagger=stagger)
 
-            if data_txt is None:
-                # no data
-                msg = 'No data from {} ({})'
-                log.debug(msg.format(storage_handler.__name__, url))
-                continue
+    for attempt in attempts:
+        data_res = attempt()
+        if data_res is not None:
+            return data_res
 
-            # parse it, if desired
-            if decode:
-                data_res = None
-                if data_pubkey is not None or data_address is not None or data_hash is not None:
-                    data_res = parse_mutable_data(
-                        data_txt, data_pubkey, public_key_hash=data_address, data_hash=data_hash, bsk_version=bsk_version, return_public_key=return_public_key
-                    )
-
-                if data_res is None and owner_address is not None:
-                    data_res = parse_mutable_data(
-                        data_txt, None, public_key_hash=owner_address, bsk_version=bsk_version, return_public_key=return_public_key
-                    )
-
-                if data_res is None:
-                    msg = 'Unparseable data from "{}"'
-                    log.error(msg.format(url))
-                    continue
+    return None
 
-                msg = 'Loaded "{}" with {}'
-                log.debug(msg.format(url, storage_handler.__name__))
 
-                if BLOCKSTACK_TEST:
-                    log.debug("loaded data: {}".format(data_res))
+def _storage_write_task(driver_name, write):
+    """
+    Run one driver's write (or delete) for replicate_storage_writes().
+    Return {'status': True} if it succeeded
+    Return {'error': ...} if not
+    """
+    log.debug('Try "{}"'.format(driver_name))
+    try:
+        rc = write()
+    except Exception as e:
+        log.exception(e)
+        return {'error': 'Driver {} raised an exception'.format(driver_name)}
 
-            else:
-                if return_public_key:
-                    data_res = {'data': data_txt, 'public_key': None}
-                else:
-                    data_res = data_txt
+    if not rc:
+        log.debug('Failed to replicate with "{}"'.format(driver_name))
+        return {'error': 'Driver {} failed'.format(driver_name)}
 
-                msg = 'Fetched (but did not decode or verify) "{}" with "{}"'
-                log.debug(msg.format(url, storage_handler.__name__))
+    log.debug('Replication succeeded with "{}"'.format(driver_name))
+    return {'status': True}
 
-            return data_res
 
-    return None
+def replicate_storage_writes(writes, required=None, timeout=STORAGE_WRITE_TIMEOUT, background=False):
+    """
+    Run a set of driver writes (or deletes) at once, so they take as long
+    as the slowest driver instead of all of them added up.
 
+    @writes is a list of (driver name, callable), where the callable
+    returns True if the write succeeded.
+    @timeout is the most seconds to wait for any one driver, or a dict
+    of them by driver name (drivers not in it get STORAGE_WRITE_TIMEOUT).
+    If @background is True and at least one of the drivers is @required,
+    the writes to the optional drivers are not waited on.
 
-def put_immutable_data(data_text, txid, data_hash=None, required=None, skip=None, required_exclusive=False):
+    Return {'successes': [driver names], 'failures': {driver name: error}, 'background': [driver names]}
+    """
+    required = [] if required is None else required
+    have_required = (len([name for (name, _) in writes if name in required]) > 0)
+
+    sg = ScatterGather()
+    background_drivers = []
+    for (driver_name, write) in writes:
+        task = functools.partial(_storage_write_task, driver_name, write)
+        if background and have_required and driver_name not in required:
+            get_scatter_gather_pool().submit(ScatterGatherTask(driver_name, task))
+            background_drivers.append(driver_name)
+            continue
+
+        driver_timeout = timeout
+        if isinstance(timeout, dict):
+            driver_timeout = timeout.get(driver_name, STORAGE_WRITE_TIMEOUT)
+
+        sg.add_task(driver_name, task, timeout=driver_timeout)
+
+    sg.run_tasks()
+
+    successes = []
+    failures = {}
+    for driver_name, res in sg.get_results().items():
+        if 'error' in res:
+            failures[driver_name] = res['error']
+        else:
+            successes.append(driver_name)
+
+    log.debug('Replicated to [{}] in {}; failed: [{}]; in the background: [{}]'.format(
+        ','.join(sorted(successes)), sg.get_latencies(), ','.join(sorted(failures.keys())), ','.join(background_drivers)
+    ))
+
+    return {'successes': successes, 'failures': failures, 'background': background_drivers}
+
+
+def put_immutable_data(data_text, txid, data_hash=None, required=None, skip=None, required_exclusive=False,
+                       timeout=STORAGE_WRITE_TIMEOUT, background=False):
     """
     Given a string of data (which can either be data or a zonefile), store it into our immutable data stores.
     Do so in a best-effort manner--this method only fails if *all* storage providers fail.
+    The drivers are written to in parallel (see replicate_storage_writes for @timeout and @background).
 
     Return the hash of the data on success
     Return None on error
@@ -991,12 +1224,10 @@ def put_immutable_data(data_text, txid, data_hash=None, required=None, skip=None
     else:
         data_hash = str(data_hash)
 
-    successes = 0
-    required_successes = 0
-
     msg = 'put_immutable_data({}), required={}, skip={}'
     log.debug(msg.format(data_hash, ','.join(required), ','.join(skip)))
 
+    writes = []
     for handler in storage_handlers:
         if required_exclusive and handler.__name__ not in required:
             continue
@@ -1012,40 +1243,24 @@ def put_immutable_data(data_text, txid, data_hash=None, required=None, skip=None
             log.debug("Storage provider {} is required but does not allow immutable storage".format(handler.__name__))
             return None
 
-        rc = False
-
-        try:
-            log.debug('Try "{}"'.format(handler.__name__))
-            rc = handler.put_immutable_handler(data_hash, data_text, txid)
-        except Exception as e:
-            log.exception(e)
-            if handler.__name__ not in required:
-                continue
-
-            # fatal
-            log.debug("Failed to replicate to required storage provider {}".format(handler.__name__))
-            return None
+        writes.append((handler.__name__, functools.partial(handler.put_immutable_handler, data_hash, data_text, txid)))
 
-        if not rc:
-            log.debug('Failed to replicate with "{}"'.format(handler.__name__))
-            if handler.__name__ not in required:
-                continue
+    res = replicate_storage_writes(writes, required=required, timeout=timeout, background=background)
+    successes = len(res['successes'])
+    required_successes = len([d for d in res['successes'] if d in required])
 
+    for d in res['failures'].keys():
+        if d in required:
             # fatal
+            log.debug("Failed to replicate to required storage provider {}".format(d))
             return None
 
-        else:
-            log.debug('Replication succeeded with "{}"'.format(handler.__name__))
-            successes += 1
-
-            if handler.__name__ in required:
-                required_successes += 1
-
     # failed everywhere or succeeded somewhere
     return None if successes == 0 and required_successes == len(set(required) - set(skip)) else data_hash
 
 
-def put_mutable_data(fq_data_id, data_text_or_json, sign=True, raw=False, data_privkey=None, data_pubkey=None, data_signature=None, profile=False, blockchain_id=None, required=None, skip=None, required_exclusive=False):
+def put_mutable_data(fq_data_id, data_text_or_json, sign=True, raw=False, data_privkey=None, data_pubkey=None, data_signature=None, profile=False, blockchain_id=None, required=None, skip=None, required_exclusive=False,
+                     timeout=STORAGE_WRITE_TIMEOUT, background=False):
     """
     Given the unserialized data, store it into our mutable data stores.
     Do so in a best-effort way.  This method fails if all storage providers fail,
@@ -1056,6 +1271,7 @@ def put_mutable_data(fq_data_id, data_text_or_json, sign=True, raw=False, data_p
     @required_exclusive: if True, then only the required drivers will be tried (none of the loaded but not-required drivers will be invoked)
     @sign: if True, then a private key is required.  if False, then simply store the data without serializing it or including a public key and signature.
     @raw: If True, then the data will be put as-is without any ancilliary metadata.  Requires sign=False
+    @timeout, @background: see replicate_storage_writes.  The drivers are written to in parallel.
 
     Return True on success
     Return False on error
@@ -1101,9 +1317,7 @@ def put_mutable_data(fq_data_id, data_text_or_json, sign=True, raw=False, data_p
     if BLOCKSTACK_TEST:
         log.debug("data ({}): {}".format(type(serialized_data), serialized_data))
 
-    successes = 0
-    required_successes = 0
-
+    writes = []
     skipped_optionals = []
 
     for handler in storage_handlers:
@@ -1123,35 +1337,17 @@ def put_mutable_data(fq_data_id, data_text_or_json, sign=True, raw=False, data_p
             skipped_optionals.append(handler.__name__)
             continue
 
-        rc = False
-        log.debug('Try "{}"'.format(handler.__name__))
-
-        try:
-            rc = handler.put_mutable_handler(fq_data_id, serialized_data, fqu=fqu, profile=profile)
-        except Exception as e:
-            log.exception(e)
-            if handler.__name__ not in required:
-                continue
-
-            log.error("Failed to replicate data with '{}'".format(handler.__name__))
-            return None
-
-        if rc:
-            log.debug("Replicated {} bytes with {} (rc = {})".format(len(serialized_data), handler.__name__, rc))
-            successes += 1
+        writes.append((handler.__name__, functools.partial(handler.put_mutable_handler, fq_data_id, serialized_data, fqu=fqu, profile=profile)))
 
-            if handler.__name__ in required:
-                required_successes += 1
+    res = replicate_storage_writes(writes, required=required, timeout=timeout, background=background)
+    successes = len(res['successes'])
+    required_successes = len([d for d in res['successes'] if d in required])
 
-            continue
-
-        if handler.__name__ not in required:
-            log.debug('Failed to replicate with "{}"'.format(handler.__name__))
-            continue
-
-        # required driver failed
-        log.error("Failed to replicate to required storage provider '{}'".format(handler.__name__))
-        return False
+    for d in res['failures'].keys():
+        if d in required:
+            # required driver failed
+            log.error("Failed to replicate to required storage provider '{}'".format(d))
+            return False
 
     if len(skipped_optionals) > 1:
         log.debug("Skipped optional drivers: [{}]".format(",".join(skipped_optionals)))
@@ -1163,11 +1359,11 @@ def put_mutable_data(fq_data_id, data_text_or_json, sign=True, raw=False, data_p
     return (successes > 0) and (required_successes >= len(set(required) - set(skip)))
 
 
-def delete_immutable_data(data_hash, txid, privkey=None, signed_data_tombstone=None):
+def delete_immutable_data(data_hash, txid, privkey=None, signed_data_tombstone=None, timeout=STORAGE_WRITE_TIMEOUT):
     """
     Given the hash of the data, the private key of the user,
     and the txid that deleted the data's hash from the blockchain,
-    delete the data from all immutable data stores.
+    delete the data from all immutable data stores, in parallel.
     """
 
     global storage_handlers
@@ -1185,25 +1381,29 @@ def delete_immutable_data(data_hash, txid, privkey=None, signed_data_tombstone=N
         ts = make_data_tombstone('immutable:{}:{}'.format(data_hash, txid))
         signed_data_tombstone = sign_data_tombstone( ts, privkey )
         
+    def _delete(handler):
+        handler.delete_immutable_handler(data_hash, txid, signed_data_tombstone)
+        return True
+
+    writes = []
     for handler in storage_handlers:
         if not getattr(handler, 'delete_immutable_handler', None):
             continue
 
-        try:
-            handler.delete_immutable_handler(data_hash, txid, signed_data_tombstone)
-        except Exception as e:
-            log.exception(e)
-            return False
+        writes.append((handler.__name__, functools.partial(_delete, handler)))
 
-    return True
+    res = replicate_storage_writes(writes, timeout=timeout)
+    return len(res['failures']) == 0
 
 
-def delete_mutable_data(fq_data_id, privatekey=None, signed_data_tombstone=None, required=None, required_exclusive=False, skip=None, blockchain_id=None, profile=False):
+def delete_mutable_data(fq_data_id, privatekey=None, signed_data_tombstone=None, required=None, required_exclusive=False, skip=None, blockchain_id=None, profile=False,
+                        timeout=STORAGE_WRITE_TIMEOUT, background=False):
     """
     Given the data ID and private key of a user,
     go and delete the associated mutable data.
 
     The fq_data_id is an opaque identifier that is prefixed with the username.
+    The drivers are deleted from in parallel (see replicate_storage_writes for @timeout and @background).
     """
 
     global storage_handlers
@@ -1229,9 +1429,8 @@ def delete_mutable_data(fq_data_id, privatekey=None, signed_data_tombstone=None,
         ts = make_data_tombstone(fq_data_id)
         signed_data_tombstone = sign_data_tombstone(ts, privatekey)
 
-    required_successes = 0
-
     # remove data
+    writes = []
     for handler in storage_handlers:
         if handler.__name__ in skip:
             log.debug("Skipping {}".format(handler.__name__))
@@ -1244,19 +1443,15 @@ def delete_mutable_data(fq_data_id, privatekey=None, signed_data_tombstone=None,
             log.debug("Skipping non-required driver {}".format(handler.__name__))
             continue
 
-        rc = False
-        try:
-            rc = handler.delete_mutable_handler(fq_data_id, signed_data_tombstone, fqu=fqu, profile=profile)
-        except Exception as e:
-            log.exception(e)
-            rc = False
+        writes.append((handler.__name__, functools.partial(handler.delete_mutable_handler, fq_data_id, signed_data_tombstone, fqu=fqu, profile=profile)))
 
-        if not rc and handler.__name__ in required:
-            log.error("Failed to delete from required storage driver {}".format(handler.__name__))
+    res = replicate_storage_writes(writes, required=required, timeout=timeout, background=background)
+    required_successes = len([d for d in res['successes'] if d in required])
+
+    for d in res['failures'].keys():
+        if d in required:
+            log.error("Failed to delete from required storage driver {}".format(d))
             return False
-        
-        elif handler.__name__ in required:
-            required_successes += 1
 
     return required_successes >= len(set(required) - set(skip))
 
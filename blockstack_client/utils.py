@@ -31,9 +31,11 @@ import traceback
 import gc
 import signal
 import time
+import Queue
 
 from .config import get_config
 from .logger import get_logger
+from .constants import SCATTER_GATHER_WORKERS, SCATTER_GATHER_SLOW_TASK
 
 log = get_logger('blockstack-client')
 
@@ -345,20 +347,189 @@ class ScatterGatherThread(threading.Thread):
         self.post_result(res)
 
 
+class ScatterGatherTask(object):
+    """
+    A task queued on a ScatterGatherPool.
+    It runs at most once, and only if it is claimed
+    before it is cancelled or abandoned.
+    """
+    def __init__(self, name, rpc_call, timeout=None):
+        self.name = name
+        self.rpc_call = rpc_call
+        self.timeout = timeout
+        self.state = 'pending'
+        self.result = None
+        self.latency = None
+        self.start_time = None
+        self.lock = threading.Lock()
+        self.cv = threading.Condition(self.lock)
+
+
+    def claim(self):
+        """
+        Claim the task, so we can run it.
+        Return True if we got it
+        Return False if it already ran, is running, or was cancelled
+        """
+        with self.lock:
+            if self.state != 'pending':
+                return False
+
+            self.state = 'running'
+            self.start_time = time.time()
+            self.cv.notify_all()
+            return True
+
+
+    def finish(self, res):
+        """
+        Post the result, unless the waiter gave up on us
+        """
+        with self.lock:
+            if self.state != 'running':
+                return
+
+            self.state = 'done'
+            self.result = res
+            self.cv.notify_all()
+
+
+    def abandon(self, error):
+        """
+        Stop waiting for the task.  If it hasn't started, it won't;
+        if it's running, its result will be thrown away.
+        Return True if the task had not finished
+        Return False if it had
+        """
+        with self.lock:
+            if self.state == 'done':
+                return False
+
+            self.state = 'abandoned'
+            self.result = {'error': error}
+            self.cv.notify_all()
+            return True
+
+
+    def wait(self):
+        """
+        Wait for the task to finish or be abandoned.  If it has a timeout,
+        wait at most that long once it starts running; time spent queued
+        behind other tasks doesn't count.
+        Return True if it's no longer running
+        Return False if it timed out
+        """
+        with self.lock:
+            while self.state in ['pending', 'running']:
+                if self.timeout is None or self.start_time is None:
+                    self.cv.wait()
+                    continue
+
+                time_left = self.start_time + self.timeout - time.time()
+                if time_left <= 0:
+                    return False
+
+                self.cv.wait(time_left)
+
+            return True
+
+
+    def run(self):
+        """
+        Run the task, if it's still ours to run
+        """
+        if not self.claim():
+            return
+
+        start = time.time()
+        res = ScatterGatherThread.do_work(self.rpc_call)
+        self.latency = time.time() - start
+        self.finish(res)
+
+
+class ScatterGatherPool(object):
+    """
+    Bounded set of worker threads, shared by all ScatterGathers.
+    Workers start on first use, and live as long as the process.
+    """
+    def __init__(self, num_workers=SCATTER_GATHER_WORKERS):
+        self.num_workers = num_workers
+        self.queue = Queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+
+    def _worker_main(self):
+        """
+        Run tasks forever
+        """
+        self.local.is_worker = True
+        while True:
+            task = self.queue.get()
+            task.run()
+
+
+    def is_worker(self):
+        """
+        Is the calling thread one of our workers?
+        """
+        return getattr(self.local, 'is_worker', False)
+
+
+    def submit(self, task):
+        """
+        Queue a ScatterGatherTask
+        """
+        with self.lock:
+            while len(self.threads) < self.num_workers:
+                thr = threading.Thread(target=self._worker_main, name='ScatterGatherWorker-{}'.format(len(self.threads)))
+                thr.daemon = True
+                thr.start()
+                self.threads.append(thr)
+
+        self.queue.put(task)
+
+
+SCATTER_GATHER_POOL = None
+SCATTER_GATHER_POOL_LOCK = threading.Lock()
+
+def get_scatter_gather_pool():
+    """
+    Get the process-wide scatter/gather worker pool
+    """
+    global SCATTER_GATHER_POOL
+    with SCATTER_GATHER_POOL_LOCK:
+        if SCATTER_GATHER_POOL is None:
+            SCATTER_GATHER_POOL = ScatterGatherPool()
+
+        return SCATTER_GATHER_POOL
+
+
 class ScatterGather(object):
     """
     Scatter/gather work pool
     Give it a few tasks, and it will run them
-    in parallel
+    in parallel on the shared ScatterGatherPool
     """
-    def __init__(self):
+    def __init__(self, pool=None):
         self.tasks = {}
+        self.timeouts = {}
         self.ran = False
         self.results = {}
+        self.latencies = {}
+        self.pool = pool
+        self.running = None
 
-    def add_task(self, result_name, rpc_call):
+    def add_task(self, result_name, rpc_call, timeout=None):
+        """
+        Queue up a task.  If it runs for longer than @timeout seconds
+        (not counting time spent queued in the pool), its result will
+        be {'error': ...}
+        """
         assert result_name not in self.tasks.keys(), "Duplicate task: {}".format(result_name)
         self.tasks[result_name] = rpc_call
+        self.timeouts[result_name] = timeout
 
 
     def get_result(self, result_name):
@@ -375,34 +546,86 @@ class ScatterGather(object):
         return self.results
 
 
+    def get_latencies(self):
+        """
+        Get how long each task ran for, in seconds
+        (None for tasks that did not finish)
+        """
+        assert self.ran
+        return self.latencies
+
+
+    def cancel(self):
+        """
+        Stop waiting for unfinished tasks.  Ones that have not started
+        won't; ones that are running have their results thrown away.
+        Their results will be {'error': 'Task cancelled'}.
+        Safe to call from another thread while run_tasks() waits.
+        """
+        running = self.running
+        if running is None:
+            return
+
+        for task in running.values():
+            task.abandon('Task cancelled')
+
+
+    def _record(self, task_name, task):
+        """
+        Keep a finished task's result and latency
+        """
+        self.results[task_name] = task.result
+        self.latencies[task_name] = task.latency
+        if task.latency is not None:
+            if task.latency > SCATTER_GATHER_SLOW_TASK:
+                log.warning("Task '{}' took {} seconds".format(task_name, task.latency))
+            else:
+                log.debug("Task '{}' took {} seconds".format(task_name, task.latency))
+
+
     def run_tasks(self, single_thread=False):
         """
-        Run all queued tasks, wait for them all to finish,
-        and return the set of results
+        Run all queued tasks, wait for them all to finish
+        (or time out), and return the set of results
         """
         if not single_thread:
-            threads = {}
+            pool = self.pool
+            if pool is None:
+                pool = get_scatter_gather_pool()
+
+            tasks = {}
             for task_name, task_call in self.tasks.items():
+                tasks[task_name] = ScatterGatherTask(task_name, task_call, timeout=self.timeouts[task_name])
+
+            self.running = tasks
+            for task_name, task in tasks.items():
                 log.debug("Start task '{}'".format(task_name))
-                thr = ScatterGatherThread(task_call)
-                thr.start()
+                pool.submit(task)
 
-                threads[task_name] = thr
+            if pool.is_worker():
+                # we're a task ourselves, so the pool may be full of tasks
+                # waiting on us.  Run whatever hasn't been picked up yet.
+                for task in tasks.values():
+                    task.run()
 
-            for task_name, thr in threads.items():
+            for task_name, task in tasks.items():
                 log.debug("Join task '{}'".format(task_name))
-                thr.join()
-                res = thr.get_result()
-                self.results[task_name] = res
+                if not task.wait():
+                    if task.abandon('Task timed out after {} seconds'.format(task.timeout)):
+                        log.error("Task '{}' timed out after {} seconds".format(task_name, task.timeout))
+
+                self._record(task_name, task)
+
+            self.running = None
                
         else:
             # for testing purposes
             for task_name, task_call in self.tasks.items():
                 log.debug("Start task (single-threaded) '{}'".format(task_name))
-                res = ScatterGatherThread.do_work(task_call)
+                task = ScatterGatherTask(task_name, task_call)
+                task.run()
                 log.debug("Join task (single-threaded) '{}'".format(task_name))
-                self.results[task_name] = res
+                self._record(task_name, task)
 
         self.ran = True
         return self.results
-
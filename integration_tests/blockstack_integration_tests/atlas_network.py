@@ -369,11 +369,15 @@ class AtlasNetworkRPCHandler(SimpleXMLRPCRequestHandler):
     Hander to capture tracebacks
     """
     def _dispatch(self, method, params):
+        bytes_in = int(self.headers.get('content-length', 0))
+        src_hostport = None
         try:
             
             if len(params) > 0 and params[0] == 'atlas_network':
                 # trim
                 params = params[1:]
+                if len(params) > 0:
+                    src_hostport = params[0]
 
             log.debug("Atlas Network RPC begin %s(%s)" % (method, params))
 
@@ -383,10 +387,13 @@ class AtlasNetworkRPCHandler(SimpleXMLRPCRequestHandler):
             ret = json.dumps(res)
 
             log.debug("Atlas Network RPC end %s(%s)" % (method, params))
+            self.server.record_rpc( src_hostport, str(method), bytes_in, len(ret) )
             return ret
         except Exception, e:
             print >> sys.stderr, "\n%s(%s)\n%s\n" % (method, params, traceback.format_exc())
-            return json.dumps(rpc_traceback())
+            ret = json.dumps(rpc_traceback())
+            self.server.record_rpc( src_hostport, str(method), bytes_in, len(ret), failed=True )
+            return ret
 
 
 class AtlasNetwork( SocketServer.ThreadingMixIn, SimpleXMLRPCServer ):
@@ -430,6 +437,11 @@ class AtlasNetwork( SocketServer.ThreadingMixIn, SimpleXMLRPCServer ):
         self.zonefiles_timeout = network_params.get('zonefiles_timeout', 1 )
         self.push_zonefiles_timeout = network_params.get("push_zonefiles_timeout", 1 )
 
+        # traffic between peers
+        # map src hostport --> method --> {'count': ..., 'failed': ..., 'bytes_in': ..., 'bytes_out': ...}
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
         # register methods 
         for attr in dir(self):
             if attr.startswith("rpc_"):
@@ -438,6 +450,29 @@ class AtlasNetwork( SocketServer.ThreadingMixIn, SimpleXMLRPCServer ):
                     self.register_function( method )
 
  
+    def record_rpc(self, src_hostport, method, bytes_in, bytes_out, failed=False):
+        """
+        Count an RPC call sent by src_hostport (None for the test control-plane)
+        through the network, and the sizes of the request and its reply.
+        """
+        with self.stats_lock:
+            peer_stats = self.stats.setdefault( str(src_hostport), {} )
+            method_stats = peer_stats.setdefault( method, {'count': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0} )
+            method_stats['count'] += 1
+            method_stats['bytes_in'] += bytes_in
+            method_stats['bytes_out'] += bytes_out
+            if failed:
+                method_stats['failed'] += 1
+
+
+    def get_stats(self):
+        """
+        Get a copy of the traffic counters (see record_rpc())
+        """
+        with self.stats_lock:
+            return json.loads( json.dumps(self.stats) )
+
+
     def possibly_drop(self, src_hostport, dest_hostport):
         """
         Possibly drop the connection
@@ -716,6 +751,14 @@ def atlas_network_is_synchronized( network_des, lastblock, num_zonefiles ):
     return True
 
 
+def atlas_network_get_stats( network_des ):
+    """
+    Get the RPC traffic that has gone through the network so far,
+    as {src hostport: {method: {'count': ..., 'failed': ..., 'bytes_in': ..., 'bytes_out': ...}}}
+    """
+    return network_des['netsrv'].network.get_stats()
+
+
 def atlas_network_stop( network_des ):
     """
     Stop an atlas network, given a network state description
@@ -768,6 +811,23 @@ def atlas_peer_join( peer_info ):
     return testlib.peer_join(peer_info)
  
 
+def atlas_peer_get_peak_memory( peer_info ):
+    """
+    Get the peak resident set size of a peer process, in bytes.
+    Return None if it can't be read (i.e. not on Linux, or the peer is gone)
+    """
+    try:
+        with open("/proc/%s/status" % peer_info['proc'].pid, "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+
+    except Exception, e:
+        log.exception(e)
+
+    return None
+
+
 def atlas_local_peer_info():
     return {
         "proc": None,
@@ -0,0 +1,365 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Atlas convergence benchmark.
+#
+# Registers and updates M names, boots N Atlas peers in the given topology
+# on the simulated network, and hands each zone file to just one peer
+# (Zipf-skewed, so a few peers start out with most of them).  Then it measures
+# how long each peer takes to get the full inventory, the RPC traffic
+# between peers, and each peer's peak memory, and writes them out as JSON.
+#
+# Knobs (environment variables):
+#   BLOCKSTACK_ATLAS_BENCH_NODES      number of peers (default 8)
+#   BLOCKSTACK_ATLAS_BENCH_ZONEFILES  number of zone files (default 50)
+#   BLOCKSTACK_ATLAS_BENCH_TOPOLOGY   star, mesh, chain or ring (default star)
+#   BLOCKSTACK_ATLAS_BENCH_LOSS       probability a peer-to-peer RPC is dropped (default 0.0)
+#   BLOCKSTACK_ATLAS_BENCH_SKEW       Zipf exponent for placing zone files (default 1.0; 0 is uniform)
+#   BLOCKSTACK_ATLAS_BENCH_TIMEOUT    seconds to wait for convergence (default 300)
+#   BLOCKSTACK_ATLAS_BENCH_SEED       random seed (default 0)
+#   BLOCKSTACK_ATLAS_BENCH_OUTPUT     where to write the results (default $working_dir/atlas_bench.json)
+
+import testlib
+import virtualchain
+import json
+import time
+import random
+import base64
+import blockstack_client
+import blockstack_zones
+import os
+import sys
+
+"""
+TEST ENV BLOCKSTACK_ATLAS_NUM_NEIGHBORS 10
+"""
+
+wallets = [
+    testlib.Wallet( "5JesPiN68qt44Hc2nT8qmyZ1JDwHebfoh9KQ52Lazb1m1LaKNj9", 100000000000 ),
+    testlib.Wallet( "5KHqsiU9qa77frZb6hQy9ocV7Sus9RWJcQGYYBJJBb2Efj1o77e", 100000000000 ),
+    testlib.Wallet( "5Kg5kJbQHvk1B64rJniEmgbD83FpZpbw2RjdAZEzTefs9ihN3Bz", 100000000000 ),
+    testlib.Wallet( "5JuVsoS9NauksSkqEjbUZxWwgGDQbMwPsEfoRBSpLpgDX1RtLX7", 100000000000 ),
+    testlib.Wallet( "5KEpiSRr1BrT8vRD7LKGCEmudokTh1iMHbiThMQpLdwBwhDJB1T", 100000000000 ),
+    testlib.Wallet( "5KaSTdRgMfHLxSKsiWhF83tdhEj2hqugxdBNPUAw5NU8DMyBJji", 100000000000 )
+]
+
+consensus = "17ac43c1d8549c3181b200f1bf97eb7d"
+synchronized = False
+
+NUM_NODES = int(os.environ.get("BLOCKSTACK_ATLAS_BENCH_NODES", 8))
+NUM_ZONEFILES = int(os.environ.get("BLOCKSTACK_ATLAS_BENCH_ZONEFILES", 50))
+TOPOLOGY = os.environ.get("BLOCKSTACK_ATLAS_BENCH_TOPOLOGY", "star")
+LOSS = float(os.environ.get("BLOCKSTACK_ATLAS_BENCH_LOSS", 0.0))
+SKEW = float(os.environ.get("BLOCKSTACK_ATLAS_BENCH_SKEW", 1.0))
+TIMEOUT = int(os.environ.get("BLOCKSTACK_ATLAS_BENCH_TIMEOUT", 300))
+SEED = int(os.environ.get("BLOCKSTACK_ATLAS_BENCH_SEED", 0))
+OUTPUT = os.environ.get("BLOCKSTACK_ATLAS_BENCH_OUTPUT", None)
+
+# the node running the test
+SEED_PORT = 16264
+FIRST_PEER_PORT = 17000
+
+# names per block
+BATCH_SIZE = 10
+
+# zone files per put_zonefiles() call
+PUT_ZONEFILES_MAX = 5
+
+
+def make_topology( peer_ports, topology ):
+    """
+    Make the seed relations and the set of links for a topology.
+    Return (seed_relations, links), where links is a set of (port, port) pairs
+    that can talk to each other.
+    """
+    seeds = {}
+    links = set()
+    ports = [SEED_PORT] + peer_ports
+
+    def _link(p1, p2):
+        links.add( (p1, p2) )
+        links.add( (p2, p1) )
+
+    if topology == 'star':
+        # everyone talks to the seed node
+        for port in peer_ports:
+            seeds[port] = [SEED_PORT]
+            _link(port, SEED_PORT)
+
+    elif topology == 'mesh':
+        # everyone talks to everyone
+        for port in peer_ports:
+            seeds[port] = [SEED_PORT]
+            for other_port in ports:
+                if other_port != port:
+                    _link(port, other_port)
+
+    elif topology in ['chain', 'ring']:
+        # each peer only talks to the ones before and after it
+        for i in xrange(1, len(ports)):
+            seeds[ports[i]] = [ports[i-1]]
+            _link(ports[i-1], ports[i])
+
+        if topology == 'ring' and len(ports) > 2:
+            _link(ports[-1], ports[0])
+
+    else:
+        raise ValueError("Unknown topology '%s'" % topology)
+
+    return (seeds, links)
+
+
+def zipf_assign( rng, num_items, num_bins, skew ):
+    """
+    Assign each item to a bin, where bin i is picked with probability proportional to 1/(i+1)^skew.
+    Return the list of bins
+    """
+    weights = [1.0 / ((i + 1) ** skew) for i in xrange(0, num_bins)]
+    total = sum(weights)
+
+    assignment = []
+    for i in xrange(0, num_items):
+        r = rng.random() * total
+        for b in xrange(0, num_bins):
+            r -= weights[b]
+            if r <= 0 or b == num_bins - 1:
+                assignment.append(b)
+                break
+
+    return assignment
+
+
+def scenario( wallets, **kw ):
+
+    global synchronized
+
+    import blockstack_integration_tests.atlas_network as atlas_network
+
+    rng = random.Random( SEED )
+
+    testlib.blockstack_namespace_preorder( "test", wallets[1].addr, wallets[0].privkey )
+    testlib.next_block( **kw )
+
+    testlib.blockstack_namespace_reveal( "test", wallets[1].addr, 52595, 250, 4, [6,5,4,3,2,1,0,0,0,0,0,0,0,0,0,0], 10, 10, wallets[0].privkey )
+    testlib.next_block( **kw )
+
+    testlib.blockstack_namespace_ready( "test", wallets[1].privkey )
+    testlib.next_block( **kw )
+
+    # set up RPC daemon
+    test_proxy = testlib.TestAPIProxy()
+    blockstack_client.set_default_proxy( test_proxy )
+    wallet_keys = blockstack_client.make_wallet_keys( owner_privkey=wallets[3].privkey, data_privkey=wallets[4].privkey, payment_privkey=wallets[5].privkey )
+    testlib.blockstack_client_set_wallet( "0123456789abcdef", wallet_keys['payment_privkey'], wallet_keys['owner_privkey'], wallet_keys['data_privkey'] )
+
+    names = ["foo_{}.test".format(i) for i in xrange(0, NUM_ZONEFILES)]
+
+    # register the names
+    for i in xrange(0, NUM_ZONEFILES, BATCH_SIZE):
+        for name in names[i:i+BATCH_SIZE]:
+            res = testlib.blockstack_name_preorder( name, wallets[2].privkey, wallets[3].addr )
+            if 'error' in res:
+                print json.dumps(res)
+                return False
+
+        testlib.next_block( **kw )
+
+        for name in names[i:i+BATCH_SIZE]:
+            res = testlib.blockstack_name_register( name, wallets[2].privkey, wallets[3].addr )
+            if 'error' in res:
+                print json.dumps(res)
+                return False
+
+        testlib.next_block( **kw )
+
+    # give each name a zone file, but don't replicate them yet
+    data_pubkey = virtualchain.BitcoinPrivateKey(wallet_keys['data_privkey']).public_key().to_hex()
+    zonefiles = []
+    for i in xrange(0, NUM_ZONEFILES, BATCH_SIZE):
+        for name in names[i:i+BATCH_SIZE]:
+            empty_zonefile = blockstack_client.zonefile.make_empty_zonefile( name, data_pubkey, urls=["file:///tmp/{}".format(name)] )
+            empty_zonefile_str = blockstack_zones.make_zone_file( empty_zonefile )
+            value_hash = blockstack_client.hash_zonefile( empty_zonefile )
+
+            res = testlib.blockstack_name_update( name, value_hash, wallets[3].privkey )
+            if 'error' in res:
+                print json.dumps(res)
+                return False
+
+            zonefiles.append( empty_zonefile_str )
+
+        testlib.next_block( **kw )
+
+    # boot the peers
+    peer_ports = [FIRST_PEER_PORT + i for i in xrange(0, NUM_NODES)]
+    seed_relations, links = make_topology( peer_ports, TOPOLOGY )
+
+    def bench_drop(src_hostport, dest_hostport):
+        if src_hostport is None:
+            return 0.0
+
+        src_host, src_port = blockstack_client.utils.url_to_host_port( src_hostport )
+        dest_host, dest_port = blockstack_client.utils.url_to_host_port( dest_hostport )
+
+        if (src_port, dest_port) not in links:
+            return 1.0
+
+        return LOSS
+
+    network_des = atlas_network.atlas_network_build( peer_ports, seed_relations, {}, os.path.join( testlib.working_dir(**kw), "atlas_network" ) )
+    atlas_network.atlas_network_start( network_des, drop_probability=bench_drop )
+
+    # wait for the peers to index the chain, so they'll accept the zone files
+    lastblock = testlib.last_block( **kw ) - 1
+    print "Waiting for the atlas peers to reach block %s" % lastblock
+    for i in xrange(0, TIMEOUT):
+        caught_up = True
+        for peer in network_des['peers']:
+            try:
+                info = atlas_network.atlas_peer_rpc( peer ).getinfo()
+                if info['last_block_processed'] < lastblock:
+                    caught_up = False
+                    break
+
+            except Exception:
+                caught_up = False
+                break
+
+        if caught_up:
+            break
+
+        time.sleep(1.0)
+
+    if not caught_up:
+        print "Peers did not catch up to block %s" % lastblock
+        atlas_network.atlas_network_stop( network_des )
+        return False
+
+    # hand each zone file to one peer
+    assignment = zipf_assign( rng, NUM_ZONEFILES, NUM_NODES, SKEW )
+    start_stats = atlas_network.atlas_network_get_stats( network_des )
+    start_time = time.time()
+
+    for p, peer in enumerate(network_des['peers']):
+        peer_zonefiles = [base64.b64encode(zonefiles[i]) for i in xrange(0, NUM_ZONEFILES) if assignment[i] == p]
+        for i in xrange(0, len(peer_zonefiles), PUT_ZONEFILES_MAX):
+            res = atlas_network.atlas_peer_rpc( peer ).put_zonefiles( peer_zonefiles[i:i+PUT_ZONEFILES_MAX] )
+            if 'error' in res:
+                print json.dumps(res)
+                atlas_network.atlas_network_stop( network_des )
+                return False
+
+    # wait for every peer to get every zone file
+    sync_times = {}
+    while time.time() - start_time < TIMEOUT and len(sync_times) < NUM_NODES:
+        for peer in network_des['peers']:
+            if peer['port'] in sync_times:
+                continue
+
+            if testlib.peer_has_zonefiles( peer, lastblock, NUM_ZONEFILES ):
+                sync_times[peer['port']] = time.time() - start_time
+                print "localhost:%s has all %s zone files after %.1f seconds" % (peer['port'], NUM_ZONEFILES, sync_times[peer['port']])
+
+        time.sleep(1.0)
+
+    synchronized = (len(sync_times) == NUM_NODES)
+
+    # tally the traffic each peer sent while converging
+    end_stats = atlas_network.atlas_network_get_stats( network_des )
+    peers = {}
+    for p, peer in enumerate(network_des['peers']):
+        hostport = "localhost:%s" % peer['port']
+        traffic = {'rpcs': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0, 'methods': {}}
+
+        for method, method_stats in end_stats.get(hostport, {}).items():
+            prior = start_stats.get(hostport, {}).get(method, {})
+            delta = dict([(k, v - prior.get(k, 0)) for (k, v) in method_stats.items()])
+
+            traffic['methods'][method] = delta
+            traffic['rpcs'] += delta['count']
+            traffic['failed'] += delta['failed']
+            traffic['bytes_in'] += delta['bytes_in']
+            traffic['bytes_out'] += delta['bytes_out']
+
+        peers[hostport] = {
+            'initial_zonefiles': len([a for a in assignment if a == p]),
+            'sync_seconds': sync_times.get(peer['port'], None),
+            'peak_memory': atlas_network.atlas_peer_get_peak_memory( peer ),
+            'traffic': traffic,
+        }
+
+    atlas_network.atlas_network_stop( network_des )
+
+    sync_seconds = sorted(sync_times.values())
+    results = {
+        'params': {
+            'nodes': NUM_NODES,
+            'zonefiles': NUM_ZONEFILES,
+            'topology': TOPOLOGY,
+            'loss': LOSS,
+            'skew': SKEW,
+            'timeout': TIMEOUT,
+            'seed': SEED,
+        },
+        'synchronized': synchronized,
+        'converge_seconds': sync_seconds[-1] if synchronized else None,
+        'median_sync_seconds': sync_seconds[len(sync_seconds) / 2] if len(sync_seconds) > 0 else None,
+        'total_rpcs': sum([peers[hp]['traffic']['rpcs'] for hp in peers.keys()]),
+        'total_bytes': sum([peers[hp]['traffic']['bytes_in'] + peers[hp]['traffic']['bytes_out'] for hp in peers.keys()]),
+        'peers': peers,
+    }
+
+    output = OUTPUT
+    if output is None:
+        output = os.path.join( testlib.working_dir(**kw), "atlas_bench.json" )
+
+    with open(output, "w") as f:
+        f.write( json.dumps(results, indent=4, sort_keys=True) + "\n" )
+
+    print "Atlas benchmark results are in %s" % output
+    sys.stdout.flush()
+
+    return synchronized
+
+
+def check( state_engine ):
+
+    global synchronized
+    if not synchronized:
+        print "not synchronized"
+        return False
+
+    for i in xrange(0, NUM_ZONEFILES):
+        name = 'foo_{}.test'.format(i)
+
+        # registered and updated
+        name_rec = state_engine.get_name( name )
+        if name_rec is None:
+            print "name does not exist"
+            return False
+
+        if name_rec['value_hash'] is None:
+            print "wrong value hash: %s" % name_rec['value_hash']
+            return False
+
+    return True
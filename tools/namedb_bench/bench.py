@@ -0,0 +1,182 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Time BlockstackDB's read methods against a synthetic chainstate,
+# and print the results as JSON.
+#
+# usage: bench.py [--names N] [--namespaces N] [--history N] [--owners N]
+#                 [--expired-fraction F] [--blocks N] [--iterations N] [--seed N]
+#                 [--working-dir DIR] [--output PATH]
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+
+# Hack around absolute paths
+current_dir = os.path.abspath(os.path.dirname(__file__))
+parent_dir = os.path.abspath(current_dir + "/../../")
+
+sys.path.insert(0, parent_dir)
+sys.path.insert(0, current_dir)
+
+from chainstate import generate_chainstate, DEFAULT_PARAMS
+
+from blockstack.lib.nameset.virtualchain_hooks import get_db_state
+from blockstack.lib.nameset.db import namedb_open
+
+# names per get_all_names() and get_last_nameops() page (the RPC maximums)
+PAGE_SIZE = 100
+NAMEOPS_PAGE_SIZE = 10
+
+
+def time_calls( func, args_list ):
+    """
+    Call func(*args) for each args in args_list.
+    Return the latency statistics, in seconds
+    """
+    latencies = []
+    for args in args_list:
+        start = time.time()
+        func( *args )
+        latencies.append( time.time() - start )
+
+    latencies.sort()
+    return {
+        'iterations': len(latencies),
+        'total': sum(latencies),
+        'mean': sum(latencies) / len(latencies),
+        'p50': latencies[len(latencies) / 2],
+        'p90': latencies[int(len(latencies) * 0.9)],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'max': latencies[-1],
+    }
+
+
+def run_benchmarks( db, chainstate, iterations, seed ):
+    """
+    Time each read method against the chainstate.
+    Return {method: stats}
+    """
+    rng = random.Random( seed )
+    num_names = db.get_num_names()
+
+    benchmarks = [
+        ('get_name', db.get_name,
+            [(rng.choice(chainstate['names']),) for i in xrange(0, iterations)]),
+
+        ('get_all_names', db.get_all_names,
+            [(rng.randint(0, max(0, num_names - PAGE_SIZE)), PAGE_SIZE) for i in xrange(0, iterations)]),
+
+        ('get_names_owned_by_address', db.get_names_owned_by_address,
+            [(rng.choice(chainstate['owners']),) for i in xrange(0, iterations)]),
+
+        ('get_all_ops_at', db.get_all_ops_at,
+            [(rng.choice(chainstate['blocks_with_ops']),) for i in xrange(0, iterations)]),
+
+        ('get_last_nameops', db.get_last_nameops,
+            [(rng.randint(0, 10) * NAMEOPS_PAGE_SIZE, NAMEOPS_PAGE_SIZE) for i in xrange(0, iterations)]),
+
+        ('get_num_names', db.get_num_names,
+            [() for i in xrange(0, iterations)]),
+    ]
+
+    results = {}
+    for (method, func, args_list) in benchmarks:
+        results[method] = time_calls( func, args_list )
+
+    return results
+
+
+if __name__ == "__main__":
+
+    argparser = argparse.ArgumentParser( description='Benchmark the name database\'s read methods on a synthetic chainstate' )
+    argparser.add_argument( '--names', type=int, default=DEFAULT_PARAMS['num_names'], help='number of names' )
+    argparser.add_argument( '--namespaces', type=int, default=DEFAULT_PARAMS['num_namespaces'], help='number of namespaces' )
+    argparser.add_argument( '--history', type=int, default=DEFAULT_PARAMS['history_per_name'], help='history rows per name, after its registration' )
+    argparser.add_argument( '--owners', type=int, default=DEFAULT_PARAMS['num_owners'], help='number of distinct owner addresses' )
+    argparser.add_argument( '--expired-fraction', type=float, default=DEFAULT_PARAMS['expired_fraction'], help='fraction of names expired at the last block' )
+    argparser.add_argument( '--blocks', type=int, default=DEFAULT_PARAMS['num_blocks'], help='number of blocks the chainstate spans' )
+    argparser.add_argument( '--iterations', type=int, default=1000, help='calls per method' )
+    argparser.add_argument( '--seed', type=int, default=DEFAULT_PARAMS['seed'], help='random seed' )
+    argparser.add_argument( '--working-dir', help='where to generate the chainstate (kept afterwards); defaults to a temporary directory' )
+    argparser.add_argument( '--output', help='write the results here instead of stdout' )
+    args = argparser.parse_args()
+
+    working_dir = args.working_dir
+    if working_dir is None:
+        working_dir = tempfile.mkdtemp( prefix='blockstack-namedb-bench-' )
+
+    elif os.path.exists( working_dir ) and len(os.listdir( working_dir )) > 0:
+        print >> sys.stderr, "%s is not empty" % working_dir
+        sys.exit(1)
+
+    elif not os.path.exists( working_dir ):
+        os.makedirs( working_dir )
+
+    # BlockstackDB finds its files in the virtualchain working directory
+    os.environ['VIRTUALCHAIN_WORKING_DIR'] = working_dir
+
+    params = {
+        'num_names': args.names,
+        'num_namespaces': args.namespaces,
+        'history_per_name': args.history,
+        'num_owners': args.owners,
+        'expired_fraction': args.expired_fraction,
+        'num_blocks': args.blocks,
+        'seed': args.seed,
+    }
+
+    start = time.time()
+    chainstate = generate_chainstate( working_dir, **params )
+    generate_time = time.time() - start
+
+    con = namedb_open( chainstate['db_path'] )
+    num_history_rows = con.execute("SELECT COUNT(*) FROM history;").fetchone()['COUNT(*)']
+    con.close()
+
+    db = get_db_state()
+    results = {
+        'params': chainstate['params'],
+        'iterations': args.iterations,
+        'generate_seconds': generate_time,
+        'db_size': os.stat( chainstate['db_path'] ).st_size,
+        'num_history_rows': num_history_rows,
+        'last_block': chainstate['last_block'],
+        'results': run_benchmarks( db, chainstate, args.iterations, args.seed ),
+    }
+    db.close()
+
+    if args.working_dir is None:
+        shutil.rmtree( working_dir )
+
+    results_json = json.dumps( results, indent=4, sort_keys=True )
+    if args.output is not None:
+        with open( args.output, 'w' ) as f:
+            f.write( results_json + '\n' )
+
+    else:
+        print results_json
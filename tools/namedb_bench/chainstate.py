@@ -0,0 +1,323 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Generate a synthetic chainstate: a name database with the given numbers
+# of namespaces, names, history rows per name and owners, a fraction of
+# whose names have expired by the last block.
+
+import os
+import sys
+import json
+import random
+
+# Hack around absolute paths
+current_dir = os.path.abspath(os.path.dirname(__file__))
+parent_dir = os.path.abspath(current_dir + "/../../")
+
+sys.path.insert(0, parent_dir)
+
+import virtualchain
+
+from blockstack.lib.config import NAME_PREORDER, NAME_REGISTRATION, NAME_UPDATE, NAME_TRANSFER, TRANSFER_KEEP_DATA, \
+        NAMESPACE_PREORDER, NAMESPACE_REVEAL, NAMESPACE_READY, NAMESPACE_LIFE_INFINITE, BLOCKSTACK_BURN_ADDRESS, FIRST_BLOCK_MAINNET, \
+        get_epoch_namespace_lifetime_multiplier, get_epoch_namespace_lifetime_grace_period
+
+from blockstack.lib.nameset.db import namedb_create, namedb_preorder_insert, namedb_state_create, namedb_state_transition, \
+        namedb_get_name, namedb_get_namespace, namedb_history_checkpoint_save
+
+import blockstack.lib.nameset.virtualchain_hooks as virtualchain_hooks
+
+# every this many history rows, a name is transferred instead of updated
+TRANSFER_INTERVAL = 5
+
+# default parameters
+DEFAULT_PARAMS = {
+    'num_namespaces': 4,
+    'num_names': 10000,
+    'history_per_name': 8,
+    'num_owners': 2000,
+    'expired_fraction': 0.2,
+    'num_blocks': 20000,
+    'first_block': FIRST_BLOCK_MAINNET,
+    'seed': 0,
+}
+
+
+def _rand_hex( rng, num_bytes ):
+    """
+    Make a random hex string
+    """
+    return "%0*x" % (num_bytes * 2, rng.getrandbits(num_bytes * 8))
+
+
+def make_owners( rng, num_owners ):
+    """
+    Make a list of (sender script, address) pairs
+    """
+    owners = []
+    for i in xrange(0, num_owners):
+        hash160 = _rand_hex( rng, 20 )
+        owners.append( ("76a914%s88ac" % hash160, virtualchain.hex_hash160_to_address(hash160)) )
+
+    return owners
+
+
+def make_preorder( rng, op, owner, block_id, vtxindex ):
+    """
+    Make a name or namespace preorder record
+    """
+    return {
+        'preorder_hash': _rand_hex( rng, 20 ),
+        'consensus_hash': _rand_hex( rng, 16 ),
+        'sender': owner[0],
+        'sender_pubkey': None,
+        'address': owner[1],
+        'block_number': block_id,
+        'op': op,
+        'op_fee': 6400000,
+        'txid': _rand_hex( rng, 32 ),
+        'vtxindex': vtxindex,
+        'burn_address': BLOCKSTACK_BURN_ADDRESS,
+    }
+
+
+def make_schedule( rng, params ):
+    """
+    Lay out the names' operations over the chain.
+    Names are registered evenly over the blocks after their namespaces are ready.
+    Names due to expire are registered (and changed) before the expiry cutoff;
+    the rest are changed up until the last block.
+
+    Return (last_block, cutoff_block, [(block_id, kind, name_index, history_index)]),
+    sorted by block, where kind is 'preorder', 'register', or 'change'.
+    """
+    first_names_block = params['first_block'] + 3
+    last_block = params['first_block'] + params['num_blocks'] - 1
+    cutoff_block = first_names_block + int((last_block - first_names_block) * params['expired_fraction'])
+
+    schedule = []
+    for i in xrange(0, params['num_names']):
+        expire = (rng.random() < params['expired_fraction'])
+        end_block = cutoff_block if expire else last_block
+        register_block = rng.randint( first_names_block + 1, max(first_names_block + 1, end_block - params['history_per_name'] - 1) )
+
+        schedule.append( (register_block - 1, 'preorder', i, 0) )
+        schedule.append( (register_block, 'register', i, 0) )
+
+        step = max(1, (end_block - register_block) / (params['history_per_name'] + 1))
+        for j in xrange(0, params['history_per_name']):
+            schedule.append( (min(end_block, register_block + (j + 1) * step), 'change', i, j) )
+
+    schedule.sort( key=lambda e: (e[0], e[1] != 'preorder', e[1] != 'register', e[2], e[3]) )
+    return (last_block, cutoff_block, schedule)
+
+
+def generate_chainstate( working_dir, **params ):
+    """
+    Generate a synthetic name database in working_dir,
+    along with the lastblock and snapshots files BlockstackDB expects.
+    Unset params take the values in DEFAULT_PARAMS.
+
+    Return a dict describing what was generated:
+    {'db_path': ..., 'last_block': ..., 'cutoff_block': ..., 'names': [...], 'owners': [...], 'blocks_with_ops': [...], 'params': {...}}
+    Names last changed before cutoff_block have expired by last_block.
+    """
+    p = dict(DEFAULT_PARAMS)
+    p.update(params)
+    params = p
+
+    rng = random.Random( params['seed'] )
+    owners = make_owners( rng, params['num_owners'] )
+
+    db_path = virtualchain.get_db_filename( impl=virtualchain_hooks, working_dir=working_dir )
+    con = namedb_create( db_path )
+    cur = con.cursor()
+
+    last_block, cutoff_block, schedule = make_schedule( rng, params )
+
+    # namespaces: preordered, revealed and readied in the first three blocks.
+    # pick a lifetime such that names last renewed before the cutoff have expired by the last block.
+    first_block = params['first_block']
+    if params['expired_fraction'] > 0:
+        multiplier = get_epoch_namespace_lifetime_multiplier( last_block, None )
+        grace_period = get_epoch_namespace_lifetime_grace_period( last_block, None )
+        lifetime = max(1, (last_block - cutoff_block - grace_period) / multiplier)
+    else:
+        lifetime = NAMESPACE_LIFE_INFINITE
+
+    namespace_ids = ["ns%s" % i for i in xrange(0, params['num_namespaces'])]
+    for vtxindex, namespace_id in enumerate(namespace_ids):
+        owner = rng.choice(owners)
+        preorder = make_preorder( rng, NAMESPACE_PREORDER, owner, first_block, vtxindex )
+        namedb_preorder_insert( cur, preorder )
+
+        reveal = {
+            'namespace_id': namespace_id,
+            'preorder_hash': preorder['preorder_hash'],
+            'version': 1,
+            'sender': owner[0],
+            'sender_pubkey': None,
+            'address': owner[1],
+            'recipient': owner[0],
+            'recipient_address': owner[1],
+            'block_number': first_block,
+            'reveal_block': first_block + 1,
+            'op': NAMESPACE_REVEAL,
+            'op_fee': 4000000000,
+            'txid': _rand_hex( rng, 32 ),
+            'vtxindex': vtxindex,
+            'lifetime': lifetime,
+            'coeff': 4,
+            'base': 4,
+            'buckets': [6, 5, 4, 3, 2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            'nonalpha_discount': 10,
+            'no_vowel_discount': 10,
+            'ready_block': 0,
+        }
+        namedb_state_create( cur, "NAMESPACE_REVEAL", reveal, first_block + 1, vtxindex, reveal['txid'], namespace_id, preorder, "namespaces" )
+
+        ready = {
+            'op': NAMESPACE_READY,
+            'txid': _rand_hex( rng, 32 ),
+            'vtxindex': vtxindex,
+            'ready_block': first_block + 2,
+            'sender': owner[0],
+        }
+        cur_record = namedb_get_namespace( cur, namespace_id, first_block + 2, include_history=False, include_expired=True )
+        namedb_state_transition( cur, "NAMESPACE_READY", ready, first_block + 2, vtxindex, ready['txid'], namespace_id, cur_record, "namespaces" )
+
+    con.commit()
+
+    # names
+    names = ["name%s.%s" % (i, namespace_ids[i % len(namespace_ids)]) for i in xrange(0, params['num_names'])]
+    name_owners = [rng.choice(owners) for i in xrange(0, params['num_names'])]
+    preorders = {}
+
+    cur_block = None
+    vtxindex = 0
+    changed_names = set()
+    blocks_with_ops = []
+
+    def _finish_block( block_id ):
+        for name in sorted(changed_names):
+            namedb_history_checkpoint_save( cur, name, block_id )
+
+        changed_names.clear()
+        con.commit()
+
+    for (block_id, kind, i, j) in schedule:
+        if block_id != cur_block:
+            if cur_block is not None:
+                _finish_block( cur_block )
+
+            cur_block = block_id
+            vtxindex = 0
+            blocks_with_ops.append( block_id )
+
+        name = names[i]
+        owner = name_owners[i]
+
+        if kind == 'preorder':
+            preorders[i] = make_preorder( rng, NAME_PREORDER, owner, block_id, vtxindex )
+            namedb_preorder_insert( cur, preorders[i] )
+
+        elif kind == 'register':
+            preorder = preorders.pop(i)
+            namespace_id = namespace_ids[i % len(namespace_ids)]
+            register = {
+                'name': name,
+                'preorder_hash': preorder['preorder_hash'],
+                'namespace_id': namespace_id,
+                'namespace_block_number': first_block,
+                'value_hash': _rand_hex( rng, 20 ),
+                'sender': owner[0],
+                'sender_pubkey': None,
+                'address': owner[1],
+                'block_number': preorder['block_number'],
+                'preorder_block_number': preorder['block_number'],
+                'first_registered': block_id,
+                'last_renewed': block_id,
+                'revoked': False,
+                'op': NAME_REGISTRATION,
+                'txid': _rand_hex( rng, 32 ),
+                'vtxindex': vtxindex,
+                'op_fee': preorder['op_fee'],
+                'importer': None,
+                'importer_address': None,
+                'consensus_hash': preorder['consensus_hash'],
+                'transfer_send_block_id': None,
+                'last_creation_op': NAME_PREORDER,
+            }
+            namedb_state_create( cur, "NAME_REGISTRATION", register, block_id, vtxindex, register['txid'], name, preorder, "name_records" )
+
+        else:
+            cur_record = namedb_get_name( cur, name, block_id, include_history=False, include_expired=True )
+            if (j + 1) % TRANSFER_INTERVAL == 0:
+                owner = rng.choice(owners)
+                name_owners[i] = owner
+                opcode = "NAME_TRANSFER"
+                op_data = {
+                    'op': NAME_TRANSFER + TRANSFER_KEEP_DATA,
+                    'sender': owner[0],
+                    'address': owner[1],
+                    'sender_pubkey': None,
+                    'value_hash': cur_record['value_hash'],
+                }
+
+            else:
+                opcode = "NAME_UPDATE"
+                op_data = {
+                    'op': NAME_UPDATE,
+                    'value_hash': _rand_hex( rng, 20 ),
+                    'consensus_hash': _rand_hex( rng, 16 ),
+                }
+
+            op_data['txid'] = _rand_hex( rng, 32 )
+            op_data['vtxindex'] = vtxindex
+            namedb_state_transition( cur, opcode, op_data, block_id, vtxindex, op_data['txid'], name, cur_record, "name_records" )
+
+        if kind != 'preorder':
+            changed_names.add( name )
+
+        vtxindex += 1
+
+    if cur_block is not None:
+        _finish_block( cur_block )
+
+    con.close()
+
+    # what BlockstackDB expects to find next to the db
+    with open( virtualchain.get_lastblock_filename( impl=virtualchain_hooks, working_dir=working_dir ), 'w' ) as f:
+        f.write( "%s" % last_block )
+
+    with open( virtualchain.get_snapshots_filename( impl=virtualchain_hooks, working_dir=working_dir ), 'w' ) as f:
+        f.write( json.dumps( {'snapshots': {}} ) )
+
+    return {
+        'db_path': db_path,
+        'last_block': last_block,
+        'cutoff_block': cutoff_block,
+        'names': names,
+        'owners': [o[1] for o in owners],
+        'blocks_with_ops': blocks_with_ops,
+        'params': params,
+    }
@@ -0,0 +1,156 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Measure name DB read latency while a writer commits blocks,
+# with and without the WAL storage profile.
+#
+# usage: sqlite_read_latency.py [num_blocks] [ops_per_block] [num_readers]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import random
+import sqlite3
+
+# Hack around absolute paths
+current_dir = os.path.abspath(os.path.dirname(__file__))
+parent_dir = os.path.abspath(current_dir + "/../")
+
+sys.path.insert(0, parent_dir)
+
+from blockstack.lib.nameset.db import namedb_create, sqlite3_pragma, sqlite3_set_storage_profile, sqlite3_wal_checkpoint
+
+
+def trial_open( path, wal ):
+    """
+    Open a connection to the trial database.
+    Don't use namedb_open():  it would switch the database to the
+    default journal mode, and with other connections open, switching
+    it back fails silently.  Make sure we're measuring the right mode.
+    """
+    # (a 2**30-second timeout overflows sqlite's busy timeout, so in
+    # rollback mode, readers would fail on the writer's lock at once)
+    con = sqlite3.connect( path, isolation_level=None, timeout=60 )
+    journal_mode = str(sqlite3_pragma( con, "journal_mode" )[0]).lower()
+    assert journal_mode == ("wal" if wal else "delete"), "Trial database is in '%s' mode" % journal_mode
+
+    # sets the cache and mmap sizes; the journal mode is already right
+    sqlite3_set_storage_profile( con, wal=wal )
+    return con
+
+
+def write_blocks( path, wal, num_blocks, ops_per_block, names, done ):
+    """
+    Commit synthetic history rows, one transaction per block
+    """
+    con = trial_open( path, wal )
+
+    for block_id in xrange(0, num_blocks):
+        con.execute("BEGIN")
+        for vtxindex in xrange(0, ops_per_block):
+            name = random.choice(names)
+            con.execute("INSERT INTO history VALUES (?,?,?,?,?,?,?);",
+                        ("%064x" % random.getrandbits(256), name, None, block_id, vtxindex, ":", '{"name": "%s"}' % name))
+
+        con.execute("END")
+        sqlite3_wal_checkpoint( con )
+
+    con.close()
+    done.set()
+
+
+def read_names( path, wal, names, done, latencies ):
+    """
+    Look up random names' history until the writer finishes
+    """
+    con = trial_open( path, wal )
+
+    while not done.is_set():
+        name = random.choice(names)
+        t = time.time()
+        con.execute("SELECT * FROM history WHERE history_id = ? ORDER BY block_id, vtxindex;", (name,)).fetchall()
+        latencies.append( time.time() - t )
+
+    con.close()
+
+
+def run( wal, num_blocks, ops_per_block, num_readers ):
+    """
+    Run one trial.  Return the sorted read latencies
+    """
+    working_dir = tempfile.mkdtemp( prefix='blockstack-sqlite-bench-' )
+    path = os.path.join( working_dir, "blockstack-server.db" )
+
+    # the only connection, so the journal mode change takes
+    con = namedb_create( path )
+    sqlite3_set_storage_profile( con, wal=wal )
+    con.close()
+
+    trial_open( path, wal ).close()
+
+    names = ["name%s.id" % i for i in xrange(0, 10000)]
+    done = threading.Event()
+    latencies = []
+
+    readers = [threading.Thread(target=read_names, args=(path, wal, names, done, latencies)) for i in xrange(0, num_readers)]
+    for r in readers:
+        r.start()
+
+    write_blocks( path, wal, num_blocks, ops_per_block, names, done )
+
+    for r in readers:
+        r.join()
+
+    shutil.rmtree( working_dir )
+    return sorted(latencies)
+
+
+if __name__ == "__main__":
+
+    num_blocks = 200
+    ops_per_block = 500
+    num_readers = 4
+
+    if len(sys.argv) > 1:
+        num_blocks = int(sys.argv[1])
+
+    if len(sys.argv) > 2:
+        ops_per_block = int(sys.argv[2])
+
+    if len(sys.argv) > 3:
+        num_readers = int(sys.argv[3])
+
+    for wal in [False, True]:
+        latencies = run( wal, num_blocks, ops_per_block, num_readers )
+        if len(latencies) == 0:
+            print "%s: no reads completed" % ("wal" if wal else "rollback")
+            continue
+
+        print "%s: %s reads, p50 %.3fms, p99 %.3fms, max %.3fms" % (
+            "wal" if wal else "rollback",
+            len(latencies),
+            latencies[len(latencies) / 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+            latencies[-1] * 1000)
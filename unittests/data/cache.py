@@ -0,0 +1,168 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from blockstack_client.data import DataCacheTable, DataCache
+
+
+def make_dir(uuid, child_uuids):
+    return {
+        'uuid': uuid,
+        'version': 1,
+        'idata': {
+            'children': dict([('file-{}'.format(c), {'uuid': c}) for c in child_uuids]),
+        },
+    }
+
+
+class DataCacheTableTest(unittest.TestCase):
+    def test_lru_eviction_order(self):
+        table = DataCacheTable(4, num_shards=1)
+        for i in xrange(0, 4):
+            table.put('k{}'.format(i), i, 100)
+
+        # k0 becomes the most-recently-used, so k1 goes first
+        self.assertEqual(table.get('k0')[0], 0)
+        table.put('k4', 4, 100)
+        self.assertEqual(table.get('k1'), (None, None))
+
+        table.put('k5', 5, 100)
+        self.assertEqual(table.get('k2'), (None, None))
+
+        for k in ['k0', 'k3', 'k4', 'k5']:
+            self.assertNotEqual(table.get(k)[0], None)
+
+        self.assertEqual(table.get_stats()['entries'], 4)
+
+    def test_byte_limit_eviction(self):
+        # each value is 42 bytes of JSON, so only two fit
+        table = DataCacheTable(100, max_bytes=100, num_shards=1)
+        for i in xrange(0, 5):
+            table.put(i, str(i) * 40, 100)
+
+        self.assertEqual(table.get_stats(), {'entries': 2, 'bytes': 84})
+        self.assertEqual(table.get(2), (None, None))
+        self.assertEqual(table.get(3)[0], '3' * 40)
+        self.assertEqual(table.get(4)[0], '4' * 40)
+
+        # an entry bigger than the limit pushes out everything else, but is kept itself
+        table.put('big', 'x' * 500, 100)
+        self.assertEqual(table.get_stats(), {'entries': 1, 'bytes': 502})
+        self.assertEqual(table.get('big')[0], 'x' * 500)
+
+        # replacing an entry doesn't count its old size
+        table.put('big', 'y', 100)
+        self.assertEqual(table.get_stats(), {'entries': 1, 'bytes': 3})
+
+    def test_expiry_through_heap(self):
+        table = DataCacheTable(100, num_shards=1)
+        for i in xrange(0, 10):
+            table.put('stale-{}'.format(i), i, -1)
+
+        table.put('fresh', 'fresh', 100)
+
+        # the stale entries were popped off the heap on put, without ever being looked up
+        self.assertEqual(table.get_stats()['entries'], 1)
+        self.assertEqual(table.shards[0]['entries'].keys(), ['fresh'])
+        self.assertEqual(table.get('fresh')[0], 'fresh')
+        self.assertEqual(table.get('stale-0'), (None, None))
+
+        # a replaced entry's old deadline doesn't expire the new one
+        table.put('replaced', 1, -1)
+        table.put('replaced', 2, 100)
+        table.put('other', 3, 100)
+        self.assertEqual(table.get('replaced')[0], 2)
+
+        # ...and a replaced entry's old deadline doesn't keep the new one alive
+        table.put('replaced', 4, -1)
+        self.assertEqual(table.get('replaced'), (None, None))
+
+    def test_heap_compaction(self):
+        table = DataCacheTable(100, num_shards=1)
+        table.put('other', 'other', 100)
+        for i in xrange(0, 1000):
+            table.put('replaced', i, 100)
+
+        # the replaced entries' deadlines don't pile up
+        shard = table.shards[0]
+        self.assertTrue(len(shard['deadlines']) <= 2 * len(shard['entries']) + 17)
+        self.assertEqual(table.get('replaced')[0], 999)
+        self.assertEqual(table.get('other')[0], 'other')
+
+        # the compacted heap still expires entries
+        table.put('stale', 'stale', -1)
+        table.put('replaced', 1000, 100)
+        self.assertEqual(sorted(shard['entries'].keys()), ['other', 'replaced'])
+
+    def test_shards(self):
+        table = DataCacheTable(64, num_shards=8)
+        for i in xrange(0, 64):
+            table.put(i, i, 100)
+
+        # every shard holds up to its share
+        self.assertEqual(table.get_stats()['entries'], sum([len(s['entries']) for s in table.shards]))
+        for shard in table.shards:
+            self.assertTrue(len(shard['entries']) <= 8)
+
+        table.clear()
+        self.assertEqual(table.get_stats(), {'entries': 0, 'bytes': 0})
+
+
+class DataCacheTest(unittest.TestCase):
+    def test_evict_inode_reverse_index(self):
+        cache = DataCache()
+        cache.put_inode_directory('ds', make_dir('root', ['a', 'sub']), 100)
+        cache.put_inode_directory('ds', make_dir('sub', ['b', 'c']), 100)
+        cache.put_inode_header('ds', {'uuid': 'root'}, 100)
+        cache.put_inode_header('ds', {'uuid': 'sub'}, 100)
+
+        self.assertEqual(cache.dir_children, {'a': 'root', 'sub': 'root', 'b': 'sub', 'c': 'sub'})
+
+        # evicting a child evicts its parent directory too
+        cache.evict_inode('ds', 'b')
+        self.assertEqual(cache.get_inode_directory('ds', 'sub'), None)
+        self.assertEqual(cache.get_inode_header('ds', 'sub'), None)
+        self.assertNotEqual(cache.get_inode_directory('ds', 'root'), None)
+
+        # evicting a directory forgets its children
+        cache.evict_inode('ds', 'sub')
+        self.assertEqual(cache.get_inode_directory('ds', 'root'), None)
+        self.assertEqual(cache.dir_children, {'a': 'root', 'sub': 'root'})
+        self.assertEqual(cache.dir_members, {'root': set(['a', 'sub'])})
+
+        # ...but not children that have since moved to another directory
+        cache.put_inode_directory('ds', make_dir('other', ['a']), 100)
+        cache.evict_inode('ds', 'root')
+        self.assertEqual(cache.dir_children, {'a': 'other'})
+        self.assertEqual(cache.dir_members, {'other': set(['a'])})
+
+        cache.evict_all()
+        self.assertEqual(cache.dir_children, {})
+        self.assertEqual(cache.dir_members, {})
+        self.assertEqual(cache.get_stats()['headers'], {'entries': 0, 'bytes': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
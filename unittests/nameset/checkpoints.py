@@ -0,0 +1,191 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest, tempfile, shutil, os, hashlib
+
+from blockstack.lib.nameset import db
+
+FIRST_BLOCK = 100
+
+
+def digest(*args):
+    return hashlib.sha256(':'.join([str(a) for a in args])).hexdigest()
+
+
+class HistoryCheckpoints(unittest.TestCase):
+    """
+    Restoring a name through its history checkpoints gives
+    the same records as replaying its full history
+    """
+    def setUp(self):
+        self.saved_interval = db.NAME_HISTORY_CHECKPOINT_INTERVAL
+        db.NAME_HISTORY_CHECKPOINT_INTERVAL = 4
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.con = db.namedb_create(os.path.join(self.tmpdir, 'blockstack-server.db'))
+        self.name = 'foo.test'
+        self.last_block = None
+
+        cur = self.con.cursor()
+        db.namedb_namespace_insert(cur, {
+            'namespace_id': 'test',
+            'preorder_hash': digest('test')[:40],
+            'version': 1,
+            'sender': '76a914' + '00' * 20 + '88ac',
+            'sender_pubkey': None,
+            'address': '1111111111111111111114oLvT2',
+            'recipient': '76a914' + '00' * 20 + '88ac',
+            'recipient_address': '1111111111111111111114oLvT2',
+            'block_number': FIRST_BLOCK - 2,
+            'reveal_block': FIRST_BLOCK - 2,
+            'op': '&',
+            'op_fee': 6400000,
+            'txid': digest('reveal'),
+            'vtxindex': 0,
+            'lifetime': 0xffffffff,
+            'coeff': 4,
+            'base': 4,
+            'buckets': [6, 5, 4, 3, 2, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            'nonalpha_discount': 10,
+            'no_vowel_discount': 10,
+            'ready_block': FIRST_BLOCK - 1,
+        })
+
+        db.namedb_name_insert(cur, {
+            'name': self.name,
+            'preorder_hash': digest('preorder')[:40],
+            'name_hash128': digest(self.name)[:32],
+            'namespace_id': 'test',
+            'namespace_block_number': FIRST_BLOCK - 2,
+            'value_hash': None,
+            'sender': '76a914' + '11' * 20 + '88ac',
+            'sender_pubkey': None,
+            'address': '12higDjoCCNXSA95xZMWUdPvXNmkAduhWv',
+            'block_number': FIRST_BLOCK,
+            'preorder_block_number': FIRST_BLOCK - 1,
+            'first_registered': FIRST_BLOCK,
+            'last_renewed': FIRST_BLOCK,
+            'revoked': False,
+            'op': ':',
+            'txid': digest('register'),
+            'vtxindex': 1,
+            'op_fee': 640000,
+            'importer': None,
+            'importer_address': None,
+            'consensus_hash': None,
+            'transfer_send_block_id': None,
+            'last_creation_op': ':',
+        })
+
+    def tearDown(self):
+        db.NAME_HISTORY_CHECKPOINT_INTERVAL = self.saved_interval
+        self.con.close()
+        shutil.rmtree(self.tmpdir)
+
+    def update_name(self, block_id, vtxindex):
+        cur = self.con.cursor()
+        cur_rec = db.namedb_get_name(cur, self.name, block_id, include_expired=True, include_history=False)
+        op_data = {
+            'op': '+',
+            'txid': digest('update', block_id, vtxindex),
+            'vtxindex': vtxindex,
+            'value_hash': digest('value', block_id, vtxindex)[:40],
+            'consensus_hash': digest('consensus', block_id)[:32],
+        }
+
+        db.namedb_state_transition(cur, 'NAME_UPDATE', op_data, block_id, vtxindex, op_data['txid'], self.name, cur_rec, 'name_records')
+
+    def end_block(self, block_id):
+        db.namedb_history_checkpoint_save(self.con.cursor(), self.name, block_id)
+        self.last_block = block_id
+
+    def make_history(self, num_blocks):
+        # one update in most blocks, two in every third, none in every fifth
+        for block_id in xrange(FIRST_BLOCK + 1, FIRST_BLOCK + 1 + num_blocks):
+            if block_id % 5 != 0:
+                self.update_name(block_id, 2)
+
+            if block_id % 3 == 0:
+                self.update_name(block_id, 3)
+
+            self.end_block(block_id)
+
+    def num_checkpoints(self):
+        return db.namedb_select_count_rows(self.con.cursor(), "SELECT COUNT(*) FROM history_checkpoints WHERE history_id = ?;", (self.name,))
+
+    def assertSameRecords(self, checkpoint_recs, replay_recs, block_id):
+        """
+        Same records, down to the types of their keys and values
+        """
+        self.assertEqual(checkpoint_recs, replay_recs, 'block {}'.format(block_id))
+        if replay_recs is None:
+            return
+
+        for (checkpoint_rec, replay_rec) in zip(checkpoint_recs, replay_recs):
+            self.assertEqual(sorted([(repr(k), type(v)) for (k, v) in checkpoint_rec.items()]),
+                             sorted([(repr(k), type(v)) for (k, v) in replay_rec.items()]),
+                             'block {}'.format(block_id))
+
+    def restore_both_ways(self, block_id):
+        cur = self.con.cursor()
+
+        name_rec = db.namedb_get_name(cur, self.name, self.last_block, include_expired=True, include_history=False)
+        checkpoint_recs = db.namedb_restore_from_checkpoint(cur, name_rec, block_id)
+
+        name_rec = db.namedb_get_name(cur, self.name, self.last_block, include_expired=True, include_history=True)
+        replay_recs = db.namedb_restore_from_history(name_rec, block_id)
+
+        return checkpoint_recs, replay_recs
+
+    def test_restore_matches_replay(self):
+        self.make_history(40)
+        self.assertTrue(self.num_checkpoints() >= 5)
+
+        for block_id in xrange(FIRST_BLOCK - 1, self.last_block + 2):
+            checkpoint_recs, replay_recs = self.restore_both_ways(block_id)
+            self.assertSameRecords(checkpoint_recs, replay_recs, block_id)
+
+            if block_id >= FIRST_BLOCK:
+                self.assertEqual(checkpoint_recs[-1]['block_number'], FIRST_BLOCK)
+
+    def test_restore_without_checkpoints(self):
+        self.make_history(2)
+        self.assertEqual(self.num_checkpoints(), 0)
+
+        for block_id in xrange(FIRST_BLOCK - 1, self.last_block + 2):
+            checkpoint_recs, replay_recs = self.restore_both_ways(block_id)
+            self.assertSameRecords(checkpoint_recs, replay_recs, block_id)
+
+    def test_rec_restore(self):
+        # namedb_rec_restore() takes the checkpoint path unless asked for the history
+        self.make_history(20)
+        for block_id in [FIRST_BLOCK + 3, FIRST_BLOCK + 9, FIRST_BLOCK + 15]:
+            rows = self.con.cursor().execute("SELECT * FROM name_records WHERE name = ?;", (self.name,)).fetchall()
+            with_history = db.namedb_rec_restore(self.con, rows, 'name', block_id, include_history=True)
+            for rec in with_history:
+                del rec['history']
+
+            self.assertSameRecords(db.namedb_rec_restore(self.con, rows, 'name', block_id), with_history, block_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
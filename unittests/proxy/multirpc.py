@@ -0,0 +1,162 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest, threading, socket, errno, time
+
+from blockstack_client import proxy
+
+
+class FakeServer(object):
+    """
+    Replies to every call with @reply, or raises @error,
+    after waiting @delay seconds (or until released)
+    """
+    def __init__(self, reply=None, error=None, delay=0):
+        self.reply = reply
+        self.error = error
+        self.delay = delay
+        self.calls = []
+        self.released = threading.Event()
+
+    def __getattr__(self, key):
+        def inner(*args, **kw):
+            self.calls.append((key, args))
+            if self.delay > 0:
+                self.released.wait(self.delay)
+
+            if self.error is not None:
+                raise self.error
+
+            return self.reply
+
+        return inner
+
+
+class FakeMultiRPCClient(proxy.BlockstackMultiRPCClient):
+    """
+    Talks to FakeServers instead of BlockstackRPCClients
+    """
+    def __init__(self, fake_servers, **kw):
+        proxy.BlockstackMultiRPCClient.__init__(self, [('server{}'.format(i), 6264, 'http') for i in xrange(0, len(fake_servers))], **kw)
+        self.fake_servers = fake_servers
+
+    def _get_client(self, srv_idx):
+        return self.fake_servers[srv_idx]
+
+    def _put_client(self, srv_idx, client):
+        pass
+
+
+class MultiRPC(unittest.TestCase):
+    def setUp(self):
+        self.fake_servers = []
+
+    def tearDown(self):
+        for fake_server in self.fake_servers:
+            fake_server.released.set()
+
+    def make_client(self, fake_servers, **kw):
+        self.fake_servers = fake_servers
+        return FakeMultiRPCClient(fake_servers, **kw)
+
+    def test_hedge_wins(self):
+        slow = FakeServer(reply={'status': 'slow'}, delay=10)
+        fast = FakeServer(reply={'status': 'fast'})
+        client = self.make_client([slow, fast], timeout=10)
+
+        # the primary usually replies in 10ms, so hedge after RPC_HEDGE_MIN_DELAY
+        client.servers[0]['samples'].extend([0.01] * 10)
+
+        start = time.time()
+        self.assertEqual(client.getinfo(), {'status': 'fast'})
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(slow.calls, [('getinfo', ())])
+        self.assertEqual(fast.calls, [('getinfo', ())])
+
+    def test_no_hedge_for_writes(self):
+        slow = FakeServer(reply={'status': 'slow'}, delay=0.5)
+        fast = FakeServer(reply={'status': 'fast'})
+        client = self.make_client([slow, fast], timeout=10)
+        client.servers[0]['samples'].extend([0.01] * 10)
+
+        self.assertEqual(client.put_zonefiles(['zonefile']), {'status': 'slow'})
+        self.assertEqual(fast.calls, [])
+
+    def test_read_fails_over(self):
+        broken = FakeServer(error=ValueError('broken'))
+        ok = FakeServer(reply={'status': True})
+        client = self.make_client([broken, ok], hedge=False)
+
+        self.assertEqual(client.get_name_blockchain_record('foo.id'), {'status': True})
+        self.assertEqual(len(broken.calls), 1)
+        self.assertEqual(len(ok.calls), 1)
+
+        # the broken server is now tried last
+        self.assertTrue(client.server_health()[0]['errors'] > 0)
+        self.assertEqual(client._rank(), [1, 0])
+
+    def test_read_all_fail(self):
+        client = self.make_client([FakeServer(error=ValueError('first')), FakeServer(error=ValueError('second'))], hedge=False)
+        self.assertRaises(ValueError, client.get_name_blockchain_record, 'foo.id')
+
+    def test_write_not_retried(self):
+        broken = FakeServer(error=socket.error(errno.ECONNRESET, 'Connection reset by peer'))
+        ok = FakeServer(reply={'status': True})
+        client = self.make_client([broken, ok])
+
+        # the server may have carried out the write, so don't send it again
+        self.assertRaises(socket.error, client.put_zonefiles, ['zonefile'])
+        self.assertEqual(len(broken.calls), 1)
+        self.assertEqual(ok.calls, [])
+
+        # same for errors that aren't socket errors
+        self.fake_servers = [FakeServer(error=ValueError('broken')), ok]
+        client = FakeMultiRPCClient(self.fake_servers)
+        self.assertRaises(ValueError, client.put_zonefiles, ['zonefile'])
+        self.assertEqual(ok.calls, [])
+
+    def test_write_fails_over_if_unreachable(self):
+        for err in [errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH]:
+            unreachable = FakeServer(error=socket.error(err, 'unreachable'))
+            ok = FakeServer(reply={'status': True})
+            client = self.make_client([unreachable, ok])
+
+            self.assertEqual(client.put_zonefiles(['zonefile']), {'status': True})
+            self.assertEqual(len(ok.calls), 1)
+
+    def test_all_time_out(self):
+        for method in ['getinfo', 'put_zonefiles']:
+            client = self.make_client([FakeServer(delay=10), FakeServer(delay=10)], timeout=0.2)
+            client.servers[0]['samples'].extend([0.01] * 10)
+
+            start = time.time()
+            self.assertRaises(socket.timeout, getattr(client, method))
+            self.assertTrue(time.time() - start < 5)
+
+            for fake_server in self.fake_servers:
+                fake_server.released.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
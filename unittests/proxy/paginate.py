@@ -0,0 +1,109 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from blockstack_client import proxy
+
+# 257 names (not a multiple of the page size), one of which the client drops
+NAMES = ['name{}.id'.format(i) for i in range(0, 257)]
+NAMES[42] = 'NOT A VALID NAME.id'
+VALID_NAMES = [n for n in NAMES if n != NAMES[42]]
+
+
+class FakeNameServer(object):
+    """
+    Serves get_all_names() and get_names_in_namespace() out of NAMES
+    """
+    def __init__(self):
+        self.calls = []
+
+    def get_num_names(self):
+        return {'count': len(NAMES)}
+
+    def get_all_names(self, offset, count):
+        self.calls.append((offset, count))
+        return {'names': NAMES[offset:offset+count]}
+
+    def get_num_names_in_namespace(self, namespace_id):
+        return {'count': len(NAMES)}
+
+    def get_names_in_namespace(self, namespace_id, offset, count):
+        self.calls.append((offset, count))
+        return {'names': NAMES[offset:offset+count]}
+
+
+class FakeMultiNameServer(proxy.BlockstackMultiRPCClient, FakeNameServer):
+    """
+    Like FakeNameServer, but proxy_clone() shares it between threads,
+    so pages are fetched concurrently
+    """
+    def __init__(self):
+        FakeNameServer.__init__(self)
+        self.trusted = False
+
+
+class Paginate(unittest.TestCase):
+    def test_filtered_name_does_not_truncate(self):
+        # one invalid name makes the first page short; the rest must still come through
+        for fake in [FakeNameServer(), FakeMultiNameServer()]:
+            names = proxy.get_all_names(proxy=fake)
+            self.assertEqual(names, VALID_NAMES)
+            self.assertEqual(sorted(fake.calls), [(0, 100), (100, 100), (200, 57)])
+
+    def test_filtered_name_in_namespace(self):
+        for fake in [FakeNameServer(), FakeMultiNameServer()]:
+            names = proxy.get_names_in_namespace('id', proxy=fake)
+            self.assertEqual(names, VALID_NAMES)
+
+    def test_offset_and_count(self):
+        for fake in [FakeNameServer(), FakeMultiNameServer()]:
+            names = proxy.get_all_names(offset=30, count=150, proxy=fake)
+            self.assertEqual(names, [n for n in NAMES[30:180] if n != NAMES[42]])
+
+    def test_stream_order(self):
+        page_sizes = []
+        for page in proxy.paginate_stream(lambda o, c, p: range(o, min(o + c, 95)), 0, 120, 10, proxy=FakeMultiNameServer()):
+            page_sizes.append(len(page))
+            self.assertEqual(page, range(page[0], page[0] + len(page)))
+
+        # the last page is short, and the two past the end of the table are empty (and skipped)
+        self.assertEqual(page_sizes, [10] * 9 + [5])
+
+    def test_error_stops_stream(self):
+        def _get_page(offset, count, page_proxy):
+            if offset == 30:
+                return {'error': 'page failed'}
+
+            return range(offset, offset + count)
+
+        pages = list(proxy.paginate_stream(_get_page, 0, 100, 10, proxy=FakeMultiNameServer()))
+        self.assertEqual(pages[-1], {'error': 'page failed'})
+        self.assertEqual(len(pages), 4)
+
+        self.assertTrue(proxy.json_is_error(proxy.paginate(_get_page, 0, 100, 10, proxy=FakeNameServer())))
+
+
+if __name__ == '__main__':
+    unittest.main()
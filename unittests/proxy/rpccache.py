@@ -0,0 +1,169 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from blockstack_client import proxy
+
+
+class FakeNode(object):
+    """
+    Serves getinfo() and get_name_blockchain_record(),
+    and counts the calls
+    """
+    def __init__(self):
+        self.last_block = 100
+        self.record = {'status': True, 'record': {'name': 'foo.id', 'value_hash': '00' * 20}}
+        self.calls = []
+        self.url = 'http://fake-node:6264'
+
+    def getinfo(self):
+        self.calls.append('getinfo')
+        return {'last_block_processed': self.last_block, 'consensus': '00' * 16}
+
+    def get_name_blockchain_record(self, name):
+        self.calls.append('get_name_blockchain_record')
+        return self.record
+
+    def count(self, method):
+        return len([c for c in self.calls if c == method])
+
+
+class FakeRPCClient(proxy.BlockstackRPCClient, FakeNode):
+    def __init__(self):
+        FakeNode.__init__(self)
+
+
+class FakeMultiRPCClient(proxy.BlockstackMultiRPCClient, FakeNode):
+    def __init__(self):
+        FakeNode.__init__(self)
+        self.servers = [{'server': 'fake-node', 'port': 6264, 'protocol': 'http'}]
+
+
+class RPCCacheTest(unittest.TestCase):
+    def test_cached_until_new_block(self):
+        cache = proxy.RPCCache(enabled=True, probe_ttl=0)
+        node = FakeRPCClient()
+
+        for i in xrange(0, 3):
+            self.assertEqual(cache.call(node, 'get_name_blockchain_record', ('foo.id',)), node.record)
+
+        self.assertEqual(node.count('get_name_blockchain_record'), 1)
+
+        # the node processes a new block
+        node.last_block += 1
+        node.record = {'status': True, 'record': {'name': 'foo.id', 'value_hash': '11' * 20}}
+        for i in xrange(0, 3):
+            self.assertEqual(cache.call(node, 'get_name_blockchain_record', ('foo.id',)), node.record)
+
+        self.assertEqual(node.count('get_name_blockchain_record'), 2)
+        self.assertEqual(cache.num_entries, 1)
+
+    def test_probe_ttl(self):
+        cache = proxy.RPCCache(enabled=True, probe_ttl=3600)
+        node = FakeRPCClient()
+
+        for i in xrange(0, 3):
+            cache.call(node, 'get_name_blockchain_record', ('foo.id',))
+            self.assertEqual(cache.call(node, 'getinfo', ())['last_block_processed'], 100)
+
+        self.assertEqual(node.count('getinfo'), 1)
+
+        # a new block isn't noticed until the probe expires
+        node.last_block += 1
+        self.assertEqual(cache.call(node, 'getinfo', ())['last_block_processed'], 100)
+        cache.call(node, 'get_name_blockchain_record', ('foo.id',))
+        self.assertEqual(node.count('get_name_blockchain_record'), 1)
+
+        cache.probe_ttl = 0
+        self.assertEqual(cache.call(node, 'getinfo', ())['last_block_processed'], 101)
+        self.assertEqual(node.count('getinfo'), 2)
+
+        cache.call(node, 'get_name_blockchain_record', ('foo.id',))
+        self.assertEqual(node.count('get_name_blockchain_record'), 2)
+
+    def test_errors_not_cached(self):
+        cache = proxy.RPCCache(enabled=True, probe_ttl=3600)
+        node = FakeRPCClient()
+
+        for reply in [{'error': 'Name not found'}, {'status': True, 'indexing': True}, 'not a dict']:
+            node.record = reply
+            del node.calls[:]
+            for i in xrange(0, 2):
+                self.assertEqual(cache.call(node, 'get_name_blockchain_record', ('foo.id',)), reply)
+
+            self.assertEqual(node.count('get_name_blockchain_record'), 2)
+            self.assertEqual(cache.num_entries, 0)
+
+    def test_replies_copied(self):
+        cache = proxy.RPCCache(enabled=True, probe_ttl=3600)
+        node = FakeRPCClient()
+        expected = {'status': True, 'record': {'name': 'foo.id', 'value_hash': '00' * 20}}
+
+        # changing what the node replied doesn't change the cached reply
+        reply = cache.call(node, 'get_name_blockchain_record', ('foo.id',))
+        reply['record']['name'] = 'bar.id'
+        node.record['record']['value_hash'] = '22' * 20
+
+        # ...and neither does changing what the cache replied
+        reply = cache.call(node, 'get_name_blockchain_record', ('foo.id',))
+        self.assertEqual(reply, expected)
+        reply['record']['name'] = 'baz.id'
+
+        self.assertEqual(cache.call(node, 'get_name_blockchain_record', ('foo.id',)), expected)
+        self.assertEqual(node.count('get_name_blockchain_record'), 1)
+
+    def test_max_entries(self):
+        cache = proxy.RPCCache(enabled=True, probe_ttl=3600, max_entries=2)
+        node = FakeRPCClient()
+
+        for name in ['a.id', 'b.id', 'c.id']:
+            cache.call(node, 'get_name_blockchain_record', (name,))
+
+        self.assertTrue(cache.num_entries <= 2)
+
+    def test_multi_server_passes_through(self):
+        cache = proxy.RPCCache(enabled=True, probe_ttl=3600)
+        node = FakeMultiRPCClient()
+
+        for i in xrange(0, 3):
+            self.assertEqual(cache.call(node, 'get_name_blockchain_record', ('foo.id',)), node.record)
+
+        self.assertEqual(node.count('get_name_blockchain_record'), 3)
+        self.assertEqual(node.count('getinfo'), 0)
+        self.assertEqual(cache.num_entries, 0)
+
+    def test_disabled(self):
+        cache = proxy.RPCCache(enabled=False)
+        node = FakeRPCClient()
+
+        for i in xrange(0, 3):
+            cache.call(node, 'get_name_blockchain_record', ('foo.id',))
+
+        self.assertEqual(node.count('get_name_blockchain_record'), 3)
+        self.assertEqual(node.count('getinfo'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest, hashlib, os, shutil, tempfile
+
+from blockstack_client import snv
+
+FIRST_BLOCK = snv.FIRST_BLOCK_MAINNET
+LAST_BLOCK = FIRST_BLOCK + 300
+
+
+class FakeStateEngine(object):
+    """
+    Stands in for virtualchain's consensus hash calculations
+    """
+    @staticmethod
+    def make_snapshot_from_ops_hash(nameops_hash, prev_consensus_hashes):
+        return hashlib.md5(nameops_hash + ','.join(prev_consensus_hashes)).hexdigest()
+
+    @staticmethod
+    def make_ops_snapshot(serialized_ops):
+        return hashlib.md5('|'.join(serialized_ops)).hexdigest()
+
+    @staticmethod
+    def serialize_op(opcode, opdata, opfields, verbose=True):
+        return opdata['data']
+
+
+class FakeVirtualchain(object):
+    StateEngine = FakeStateEngine
+
+
+class FakeChain(object):
+    """
+    A chain of name operations and their consensus hashes, as served by a Blockstack node
+    """
+    def __init__(self, tag):
+        self.nameops = {}
+        self.nameops_hashes = {}
+        self.consensus_hashes = {}
+        self.calls = 0
+
+        for b in xrange(FIRST_BLOCK, LAST_BLOCK):
+            self.nameops[b] = [{'opcode': 'NAME_UPDATE', 'op': '+', 'data': '{}-{}'.format(tag, b)}]
+            self.nameops_hashes[b] = FakeStateEngine.make_ops_snapshot([op['data'] for op in self.nameops[b]])
+
+            i = 0
+            prev_chs = []
+            while b - (2 ** (i + 1) - 1) >= FIRST_BLOCK:
+                i += 1
+                prev_chs.append(self.consensus_hashes[b - (2 ** i - 1)])
+
+            self.consensus_hashes[b] = FakeStateEngine.make_snapshot_from_ops_hash(self.nameops_hashes[b], prev_chs)
+
+    def get_nameops_hash_at(self, block_id, proxy=None):
+        self.calls += 1
+        return self.nameops_hashes[block_id]
+
+    def get_consensus_hashes(self, block_ids, proxy=None):
+        self.calls += 1
+        return dict([(b, self.consensus_hashes.get(b, None)) for b in block_ids])
+
+    def get_nameops_at(self, block_id, proxy=None):
+        self.calls += 1
+        return [dict(op) for op in self.nameops[block_id]]
+
+
+class SNVCache(unittest.TestCase):
+    def setUp(self):
+        self.saved = dict([(attr, getattr(snv, attr)) for attr in ['virtualchain', 'get_nameops_hash_at', 'get_consensus_hashes', 'get_nameops_at']])
+        snv.virtualchain = FakeVirtualchain
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmpdir, 'snv.db')
+
+        self.honest = FakeChain('honest')
+        self.evil = FakeChain('evil')
+        self.serve(self.honest)
+
+    def tearDown(self):
+        for (attr, value) in self.saved.items():
+            setattr(snv, attr, value)
+
+        shutil.rmtree(self.tmpdir)
+
+    def serve(self, chain):
+        snv.get_nameops_hash_at = chain.get_nameops_hash_at
+        snv.get_consensus_hashes = chain.get_consensus_hashes
+        snv.get_nameops_at = chain.get_nameops_at
+
+    def lookup(self, chain, current_block_id, block_id, cache_path):
+        return snv.snv_get_nameops_at(current_block_id, chain.consensus_hashes[current_block_id],
+                                      block_id, chain.consensus_hashes[block_id], proxy=object(), cache_path=cache_path)
+
+    def test_cache_reuse(self):
+        nameops = self.lookup(self.honest, LAST_BLOCK - 10, FIRST_BLOCK + 50, self.cache_path)
+        self.assertEqual([op['data'] for op in nameops], ['honest-{}'.format(FIRST_BLOCK + 50)])
+        uncached_calls = self.honest.calls
+
+        for block_id in [FIRST_BLOCK + 50, FIRST_BLOCK + 100]:
+            self.honest.calls = 0
+            nameops = self.lookup(self.honest, LAST_BLOCK - 10, block_id, self.cache_path)
+            self.assertEqual([op['data'] for op in nameops], ['honest-{}'.format(block_id)])
+            self.assertTrue(self.honest.calls < uncached_calls)
+
+    def test_two_anchors(self):
+        # cache what a walk from the honest trust anchor verified
+        nameops = self.lookup(self.honest, LAST_BLOCK - 10, FIRST_BLOCK + 50, self.cache_path)
+        self.assertEqual([op['data'] for op in nameops], ['honest-{}'.format(FIRST_BLOCK + 50)])
+        honest_rows = snv.snv_cache_load(self.cache_path, FIRST_BLOCK, LAST_BLOCK)
+
+        # a walk from a bad trust anchor, against a server that agrees with it
+        self.serve(self.evil)
+        evil_cache_path = os.path.join(self.tmpdir, 'evil.db')
+        nameops = self.lookup(self.evil, LAST_BLOCK - 1, FIRST_BLOCK + 52, evil_cache_path)
+        self.assertEqual([op['data'] for op in nameops], ['evil-{}'.format(FIRST_BLOCK + 52)])
+        evil_rows = snv.snv_cache_load(evil_cache_path, FIRST_BLOCK, LAST_BLOCK)
+
+        # the evil walk only touched blocks the honest walk didn't, so both land in one cache
+        evil_rows = dict([(b, row) for (b, row) in evil_rows.items() if b not in honest_rows])
+        self.assertTrue(FIRST_BLOCK + 52 in evil_rows)
+        self.assertTrue(snv.snv_cache_store(self.cache_path,
+                                            dict([(b, row[0]) for (b, row) in evil_rows.items()]),
+                                            dict([(b, row[1]) for (b, row) in evil_rows.items() if row[1] is not None]),
+                                            dict([(b, row[2]) for (b, row) in evil_rows.items() if row[2] is not None])))
+
+        self.assertEqual(len(snv.snv_cache_load(self.cache_path, FIRST_BLOCK, LAST_BLOCK)), len(honest_rows) + len(evil_rows))
+
+        # looking up from the honest trust anchor must not use the evil walk's hashes
+        self.serve(self.honest)
+        for block_id in [FIRST_BLOCK + 52, FIRST_BLOCK + 50]:
+            nameops = self.lookup(self.honest, LAST_BLOCK - 10, block_id, self.cache_path)
+            self.assertFalse(isinstance(nameops, dict) and 'error' in nameops, nameops)
+            self.assertEqual([op['data'] for op in nameops], ['honest-{}'.format(block_id)])
+
+
+if __name__ == '__main__':
+    unittest.main()
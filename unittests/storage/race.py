@@ -0,0 +1,100 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest, threading, time
+
+from blockstack_client import storage
+
+
+class RaceStorageReads(unittest.TestCase):
+    def setUp(self):
+        self.released = threading.Event()
+        self.started = []
+
+    def tearDown(self):
+        self.released.set()
+
+    def attempt(self, name, result=None, block=False, error=None):
+        def _attempt():
+            self.started.append(name)
+            if block:
+                self.released.wait(10)
+
+            if error is not None:
+                raise error
+
+            return result
+
+        return _attempt
+
+    def test_first_valid_wins(self):
+        attempts = [self.attempt('a', 'data a'), self.attempt('b', 'data b')]
+        self.assertEqual(storage.race_storage_reads(attempts, stagger=10), 'data a')
+        self.assertEqual(self.started, ['a'])
+
+        # a slow attempt loses to a later one that answers first
+        del self.started[:]
+        attempts = [self.attempt('a', 'data a', block=True), self.attempt('b', 'data b'), self.attempt('c', 'data c')]
+        start = time.time()
+        self.assertEqual(storage.race_storage_reads(attempts, stagger=0.1), 'data b')
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(self.started, ['a', 'b'])
+
+    def test_stagger(self):
+        # the next attempt doesn't start until the stagger is up...
+        attempts = [self.attempt('a', 'data a', block=True), self.attempt('b', 'data b')]
+        start = time.time()
+        self.assertEqual(storage.race_storage_reads(attempts, stagger=0.3), 'data b')
+        self.assertTrue(time.time() - start >= 0.3)
+
+        # ...unless every attempt before it has already failed
+        del self.started[:]
+        attempts = [self.attempt('a'), self.attempt('b', error=Exception('b failed')), self.attempt('c', 'data c')]
+        start = time.time()
+        self.assertEqual(storage.race_storage_reads(attempts, stagger=10), 'data c')
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(self.started, ['a', 'b', 'c'])
+
+        # with no stagger, they all start at once
+        del self.started[:]
+        attempts = [self.attempt(name, block=True) for name in ['a', 'b', 'c']] + [self.attempt('d', 'data d')]
+        self.assertEqual(storage.race_storage_reads(attempts, stagger=0), 'data d')
+        self.assertEqual(sorted(self.started), ['a', 'b', 'c', 'd'])
+
+    def test_all_fail(self):
+        attempts = [self.attempt('a'), self.attempt('b', error=Exception('b failed')), self.attempt('c')]
+        start = time.time()
+        self.assertEqual(storage.race_storage_reads(attempts, stagger=10), None)
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(self.started, ['a', 'b', 'c'])
+
+        self.assertEqual(storage.race_storage_reads([], stagger=10), None)
+
+        # a lone attempt runs in the caller's thread
+        self.assertEqual(storage.race_storage_reads([self.attempt('d')], stagger=10), None)
+        self.assertEqual(storage.race_storage_reads([self.attempt('e', 'data e')], stagger=10), 'data e')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest, threading, time, functools
+
+from blockstack_client import storage
+
+
+class FakeDriver(object):
+    """
+    A storage driver whose writes succeed, fail, raise,
+    or block until released
+    """
+    def __init__(self, name, behavior='ok'):
+        self.__name__ = name
+        self.behavior = behavior
+        self.calls = []
+        self.released = threading.Event()
+        self.finished = threading.Event()
+
+    def _write(self, *args):
+        self.calls.append(args)
+        try:
+            if self.behavior == 'block':
+                self.released.wait(10)
+                return True
+
+            if self.behavior == 'raise':
+                raise Exception('driver {} raised'.format(self.__name__))
+
+            return self.behavior == 'ok'
+
+        finally:
+            self.finished.set()
+
+    def put_immutable_handler(self, data_hash, data_text, txid):
+        return self._write(data_hash, data_text, txid)
+
+    def put_mutable_handler(self, fq_data_id, data, fqu=None, profile=False):
+        return self._write(fq_data_id, data)
+
+    def delete_mutable_handler(self, fq_data_id, signed_data_tombstone, fqu=None, profile=False):
+        return self._write(fq_data_id, signed_data_tombstone)
+
+
+class ReplicateStorageWrites(unittest.TestCase):
+    def setUp(self):
+        self.saved = storage.storage_handlers
+        self.drivers = []
+        self.data_hash = '00' * 20
+
+    def tearDown(self):
+        storage.storage_handlers = self.saved
+        for driver in self.drivers:
+            driver.released.set()
+
+    def use_drivers(self, *drivers):
+        self.drivers = list(drivers)
+        storage.storage_handlers = self.drivers
+
+    def writes(self):
+        return [(d.__name__, functools.partial(d.put_immutable_handler, self.data_hash, 'hello', 'txid')) for d in self.drivers]
+
+    def put_immutable(self, **kw):
+        return storage.put_immutable_data('hello', 'txid', data_hash=self.data_hash, **kw)
+
+    def put_mutable(self, **kw):
+        return storage.put_mutable_data('foo.id/bar', 'hello', sign=False, raw=True, **kw)
+
+    def test_required_driver_fails(self):
+        for behavior in ['fail', 'raise']:
+            ok = FakeDriver('ok')
+            broken = FakeDriver('broken', behavior)
+            self.use_drivers(ok, broken)
+
+            self.assertEqual(self.put_immutable(required=['broken']), None)
+            self.assertFalse(self.put_mutable(required=['broken']))
+            self.assertFalse(storage.delete_mutable_data('foo.id/bar', signed_data_tombstone='tombstone', required=['broken']))
+
+            # every driver was still tried
+            self.assertEqual(len(ok.calls), 3)
+            self.assertEqual(len(broken.calls), 3)
+
+    def test_optional_driver_times_out(self):
+        slow = FakeDriver('slow', 'block')
+        fast = FakeDriver('fast')
+        self.use_drivers(slow, fast)
+
+        start = time.time()
+        res = storage.replicate_storage_writes(self.writes(), timeout={'slow': 0.2})
+        self.assertTrue(time.time() - start < 5)
+
+        self.assertEqual(res['successes'], ['fast'])
+        self.assertEqual(res['failures'].keys(), ['slow'])
+        self.assertEqual(res['background'], [])
+
+        # the put still succeeds on the other driver
+        start = time.time()
+        self.assertEqual(self.put_immutable(timeout=0.2), self.data_hash)
+        self.assertTrue(self.put_mutable(timeout=0.2))
+        self.assertTrue(time.time() - start < 5)
+
+        # ...but not if the slow one is required
+        self.assertEqual(self.put_immutable(required=['slow'], timeout=0.2), None)
+
+    def test_background_optional_writes(self):
+        slow = FakeDriver('slow', 'block')
+        fast = FakeDriver('fast')
+        self.use_drivers(slow, fast)
+
+        start = time.time()
+        self.assertEqual(self.put_immutable(required=['fast'], background=True), self.data_hash)
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(len(fast.calls), 1)
+
+        # the optional write carries on after the put returns
+        self.assertFalse(slow.finished.is_set())
+        slow.released.set()
+        self.assertTrue(slow.finished.wait(5))
+        self.assertEqual(len(slow.calls), 1)
+
+        res = storage.replicate_storage_writes(self.writes(), required=['fast'], background=True)
+        self.assertEqual(res['successes'], ['fast'])
+        self.assertEqual(res['background'], ['slow'])
+
+    def test_no_background_without_required(self):
+        # with nothing required, the optional drivers are all there is to wait for
+        slow = FakeDriver('slow', 'block')
+        self.use_drivers(slow)
+
+        threading.Timer(0.2, slow.released.set).start()
+        self.assertEqual(self.put_immutable(background=True), self.data_hash)
+        self.assertTrue(slow.finished.is_set())
+
+    def test_return_values(self):
+        # same results as writing to one driver after the other
+        cases = [
+            (['ok', 'ok'], [], self.data_hash, True),
+            (['ok', 'fail'], [], self.data_hash, True),
+            (['raise', 'ok'], [], self.data_hash, True),
+            (['fail', 'raise'], [], None, False),
+            (['ok', 'fail'], ['d0'], self.data_hash, True),
+            (['fail', 'ok'], ['d1'], self.data_hash, True),
+        ]
+
+        for (behaviors, required, immutable_rc, mutable_rc) in cases:
+            self.use_drivers(*[FakeDriver('d{}'.format(i), b) for (i, b) in enumerate(behaviors)])
+            self.assertEqual(self.put_immutable(required=required), immutable_rc, (behaviors, required))
+            self.assertEqual(self.put_mutable(required=required), mutable_rc, (behaviors, required))
+
+        # drivers that are skipped, or not required when required_exclusive is set, aren't tried
+        self.use_drivers(FakeDriver('d0'), FakeDriver('d1'), FakeDriver('d2'))
+        self.assertEqual(self.put_immutable(skip=['d0'], required=['d1'], required_exclusive=True), self.data_hash)
+        self.assertTrue(self.put_mutable(skip=['d0'], required=['d1'], required_exclusive=True))
+        self.assertEqual([len(d.calls) for d in self.drivers], [0, 2, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest, hashlib
+
+from blockstack_client import storage
+
+
+def fake_sign(data_txt, data_pubkey):
+    if isinstance(data_txt, unicode):
+        data_txt = data_txt.encode('utf-8')
+
+    return hashlib.sha256(data_txt + '|' + data_pubkey).hexdigest()
+
+
+class VerifyRawDataCached(unittest.TestCase):
+    def setUp(self):
+        self.saved = (storage.verify_raw_data, storage.SIGNATURE_CACHE_SIZE)
+        self.calls = []
+
+        def _verify_raw_data(data_txt, data_pubkey, sigb64):
+            self.calls.append((data_txt, data_pubkey, sigb64))
+            return sigb64 == fake_sign(data_txt, data_pubkey)
+
+        storage.verify_raw_data = _verify_raw_data
+        storage.VERIFIED_SIGNATURES.clear()
+
+    def tearDown(self):
+        storage.verify_raw_data, storage.SIGNATURE_CACHE_SIZE = self.saved
+        storage.VERIFIED_SIGNATURES.clear()
+
+    def test_cached(self):
+        for data_txt in ['hello', u'h\xe9llo']:
+            sig = fake_sign(data_txt, 'pubkey')
+            self.assertTrue(storage.verify_raw_data_cached(data_txt, 'pubkey', sig))
+            self.assertTrue(storage.verify_raw_data_cached(data_txt, 'pubkey', sig))
+
+        self.assertEqual(len(self.calls), 2)
+
+    def test_failure_not_cached(self):
+        sig = fake_sign('hello', 'pubkey')
+        for i in xrange(0, 3):
+            self.assertFalse(storage.verify_raw_data_cached('hello', 'other pubkey', sig))
+
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(len(storage.VERIFIED_SIGNATURES), 0)
+
+        # a good signature still verifies (and is cached) afterwards
+        self.assertTrue(storage.verify_raw_data_cached('hello', 'pubkey', sig))
+        self.assertEqual(len(storage.VERIFIED_SIGNATURES), 1)
+
+    def test_changed_byte_misses(self):
+        sig = fake_sign('hello', 'pubkey')
+        self.assertTrue(storage.verify_raw_data_cached('hello', 'pubkey', sig))
+
+        # one byte different in each part of the triple has to be checked again, and fails
+        for (data_txt, data_pubkey, sigb64) in [('hellp', 'pubkey', sig), ('hello', 'pubkez', sig), ('hello', 'pubkey', sig[:-1] + 'x')]:
+            del self.calls[:]
+            self.assertFalse(storage.verify_raw_data_cached(data_txt, data_pubkey, sigb64))
+            self.assertEqual(self.calls, [(data_txt, data_pubkey, sigb64)])
+
+        # moving bytes between the parts doesn't hit the cache either
+        del self.calls[:]
+        self.assertFalse(storage.verify_raw_data_cached('hellop', 'ubkey', sig))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_lru_bounded(self):
+        storage.SIGNATURE_CACHE_SIZE = 4
+        sigs = [fake_sign(str(i), 'pubkey') for i in xrange(0, 10)]
+        for i in xrange(0, 10):
+            self.assertTrue(storage.verify_raw_data_cached(str(i), 'pubkey', sigs[i]))
+
+            # keep '0' as the most-recently-used
+            self.assertTrue(storage.verify_raw_data_cached('0', 'pubkey', sigs[0]))
+            self.assertTrue(len(storage.VERIFIED_SIGNATURES) <= 4)
+
+        # '0' and the last three are cached; the rest were evicted
+        del self.calls[:]
+        for i in [0, 7, 8, 9]:
+            self.assertTrue(storage.verify_raw_data_cached(str(i), 'pubkey', sigs[i]))
+
+        self.assertEqual(self.calls, [])
+
+        self.assertTrue(storage.verify_raw_data_cached('1', 'pubkey', sigs[1]))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(storage.VERIFIED_SIGNATURES), 4)
+
+    def test_disabled(self):
+        storage.SIGNATURE_CACHE_SIZE = 0
+        sig = fake_sign('hello', 'pubkey')
+        for i in xrange(0, 3):
+            self.assertTrue(storage.verify_raw_data_cached('hello', 'pubkey', sig))
+
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(len(storage.VERIFIED_SIGNATURES), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
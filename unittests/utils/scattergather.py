@@ -0,0 +1,153 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest, threading, time
+
+from blockstack_client.utils import ScatterGather, ScatterGatherPool
+
+
+class ScatterGatherTest(unittest.TestCase):
+    def setUp(self):
+        self.released = threading.Event()
+
+    def tearDown(self):
+        self.released.set()
+
+    def blocked_task(self, ran=None):
+        def _task():
+            if ran is not None:
+                ran.append(True)
+
+            self.released.wait(10)
+            return {'status': 'released'}
+
+        return _task
+
+    def run_in_thread(self, sg):
+        thr = threading.Thread(target=sg.run_tasks)
+        thr.daemon = True
+        thr.start()
+        return thr
+
+    def test_results(self):
+        sg = ScatterGather(pool=ScatterGatherPool(num_workers=4))
+        for i in xrange(0, 10):
+            sg.add_task('task-{}'.format(i), lambda i=i: {'status': i})
+
+        sg.add_task('raises', lambda: 1 / 0)
+
+        results = sg.run_tasks()
+        for i in xrange(0, 10):
+            self.assertEqual(results['task-{}'.format(i)], {'status': i})
+            self.assertTrue(sg.get_latencies()['task-{}'.format(i)] >= 0)
+
+        self.assertTrue('error' in results['raises'])
+
+    def test_timeout(self):
+        sg = ScatterGather(pool=ScatterGatherPool(num_workers=2))
+        sg.add_task('slow', self.blocked_task(), timeout=0.2)
+        sg.add_task('fast', lambda: {'status': 'fast'}, timeout=0.2)
+
+        start = time.time()
+        results = sg.run_tasks()
+        self.assertTrue(time.time() - start < 5)
+
+        self.assertEqual(results['slow'], {'error': 'Task timed out after 0.2 seconds'})
+        self.assertEqual(results['fast'], {'status': 'fast'})
+        self.assertEqual(sg.get_latencies()['slow'], None)
+
+    def test_queue_time_not_counted(self):
+        pool = ScatterGatherPool(num_workers=1)
+
+        # occupy the only worker for a while
+        busy = ScatterGather(pool=pool)
+        busy.add_task('busy', lambda: time.sleep(0.5))
+        thr = self.run_in_thread(busy)
+        time.sleep(0.1)
+
+        # this task waits in the queue for longer than its timeout, but runs quickly
+        sg = ScatterGather(pool=pool)
+        sg.add_task('quick', lambda: {'status': 'quick'}, timeout=0.2)
+        self.assertEqual(sg.run_tasks()['quick'], {'status': 'quick'})
+
+        thr.join()
+
+    def test_cancel(self):
+        pool = ScatterGatherPool(num_workers=1)
+        ran = []
+
+        sg = ScatterGather(pool=pool)
+        sg.add_task('running', self.blocked_task())
+        thr = self.run_in_thread(sg)
+
+        # a second caller, queued behind the first
+        queued = ScatterGather(pool=pool)
+        queued.add_task('queued', self.blocked_task(ran))
+        queued_thr = self.run_in_thread(queued)
+
+        while sg.running is None or queued.running is None:
+            time.sleep(0.01)
+
+        sg.cancel()
+        queued.cancel()
+        thr.join(5)
+        queued_thr.join(5)
+        self.assertFalse(thr.is_alive())
+        self.assertFalse(queued_thr.is_alive())
+
+        self.assertEqual(sg.get_results(), {'running': {'error': 'Task cancelled'}})
+        self.assertEqual(queued.get_results(), {'queued': {'error': 'Task cancelled'}})
+
+        # the cancelled task never runs, even once the worker is free
+        self.released.set()
+        done = ScatterGather(pool=pool)
+        done.add_task('done', lambda: {'status': 'done'})
+        self.assertEqual(done.run_tasks()['done'], {'status': 'done'})
+        self.assertEqual(ran, [])
+
+    def test_nested(self):
+        # every worker runs a task that scatters more tasks onto the same pool
+        pool = ScatterGatherPool(num_workers=2)
+
+        def _outer(i):
+            inner = ScatterGather(pool=pool)
+            for j in xrange(0, 4):
+                inner.add_task('inner-{}'.format(j), lambda j=j: i * 10 + j)
+
+            return sorted(inner.run_tasks().values())
+
+        sg = ScatterGather(pool=pool)
+        for i in xrange(0, 4):
+            sg.add_task('outer-{}'.format(i), lambda i=i: _outer(i))
+
+        thr = self.run_in_thread(sg)
+        thr.join(5)
+        self.assertFalse(thr.is_alive(), 'nested tasks deadlocked')
+
+        for i in xrange(0, 4):
+            self.assertEqual(sg.get_result('outer-{}'.format(i)), [i * 10 + j for j in xrange(0, 4)])
+
+
+if __name__ == '__main__':
+    unittest.main()